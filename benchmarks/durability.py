@@ -0,0 +1,68 @@
+"""Measure the cost of each `--durability` mode when writing sidecars
+
+Usage: python benchmarks/durability.py [DIRECTORY] [N_FILES]
+
+Writes N_FILES (default 2000) sidecars, spread over 20 directories, below
+DIRECTORY (default: a temporary directory, point it at e.g. an NFS mount to
+measure a network filesystem) with each mode and prints the throughput.
+
+DIRECTORY should be on a disk-backed filesystem. On tmpfs (often where the
+default temporary directory lives) `fsync` is a no-op, so the figures only
+measure the overhead of the temporary files and renames.
+"""
+from __future__ import annotations
+
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from d2b import defaults
+from d2b.durability import Durability
+
+
+SIDECAR = json.dumps(
+    {
+        "SeriesDescription": "fMRI_rest",
+        "SeriesNumber": 7,
+        "SliceTiming": [i * 0.0625 for i in range(64)],
+    },
+    indent=2,
+)
+
+
+def run(directory: Path, mode: str, n_files: int) -> float:
+    """Write `n_files` sidecars with the given mode, return the files per second"""
+    out_dir = directory / mode
+    directories = [out_dir / f"{i}" for i in range(20)]
+    for d in directories:
+        d.mkdir(parents=True)
+
+    start = time.perf_counter()
+    durability = Durability(mode)
+    durability.track_directories(directories, directory)
+    for i in range(n_files):
+        durability.write_text(directories[i % 20] / f"{i}.json", SIDECAR)
+    durability.commit()
+    seconds = time.perf_counter() - start
+
+    shutil.rmtree(out_dir)
+    return n_files / seconds
+
+
+def main(argv: list[str]) -> None:
+    n_files = int(argv[1]) if len(argv) > 1 else 2000
+    with tempfile.TemporaryDirectory(dir=argv[0] if argv else None) as d:
+        results = {
+            mode: run(Path(d), mode, n_files) for mode in defaults.durability_choices
+        }
+    baseline = results["none"]
+    print(f"{'mode':<8}{'files/s':>12}{'relative':>10}")
+    for mode, throughput in results.items():
+        print(f"{mode:<8}{throughput:>12.0f}{throughput / baseline:>10.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
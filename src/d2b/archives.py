@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import os
+import shutil
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+from pathlib import PurePosixPath
+from typing import Callable
+from typing import IO
+from typing import Iterator
+
+
+def is_archive(path: str | Path) -> bool:
+    """Whether `path` is a (possibly compressed) tar or zip archive"""
+    _path = Path(path)
+    if not _path.is_file():
+        return False
+    return zipfile.is_zipfile(_path) or tarfile.is_tarfile(_path)
+
+
+class Archive:
+    """A tar or zip archive used as an input "directory"
+
+    Members are extracted selectively, so only the members which are needed
+    (e.g. the sidecars, and then the files of matched acquisitions) are ever
+    written to disk. Compressed tar archives can only be read sequentially,
+    so each call to `Archive.extract()` is a single pass over the archive.
+
+    Examples:
+        >>> import io, tempfile
+        >>> with tempfile.TemporaryDirectory() as d:
+        ...     archive = Path(d) / 'session.zip'
+        ...     with zipfile.ZipFile(archive, 'w') as zf:
+        ...         zf.writestr('a/b.json', '{}')
+        ...         zf.writestr('a/b.nii.gz', '')
+        ...     extracted = Archive(archive).extract(
+        ...         Path(d) / 'out', lambda name: name.endswith('.json'),
+        ...     )
+        ...     [str(p.relative_to(Path(d) / 'out')) for p in extracted]
+        ['a/b.json']
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.is_zip = zipfile.is_zipfile(self.path)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({str(self.path)!r})"
+
+    def extract(self, dst: str | Path, select: Callable[[str], bool]) -> list[Path]:
+        """Extract the (regular file) members whose names are selected into `dst`"""
+        _dst = Path(dst)
+        extracted: list[Path] = []
+        for name, mtime, fileobj in self._members(select):
+            target = _member_path(_dst, name)
+            target.parent.mkdir(exist_ok=True, parents=True)
+            with open(target, "wb") as f:
+                shutil.copyfileobj(fileobj, f, 1024 * 1024)
+            os.utime(target, (mtime, mtime))
+            extracted.append(target)
+        return extracted
+
+    def _members(
+        self,
+        select: Callable[[str], bool],
+    ) -> Iterator[tuple[str, float, IO[bytes]]]:
+        if self.is_zip:
+            with zipfile.ZipFile(self.path) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not select(info.filename):
+                        continue
+                    mtime = time.mktime((*info.date_time, 0, 0, -1))
+                    with zf.open(info) as fileobj:
+                        yield info.filename, mtime, fileobj
+        else:
+            # stream mode, i.e. a single sequential read of the archive
+            with tarfile.open(self.path, "r|*") as tf:
+                for member in tf:
+                    if not member.isfile() or not select(member.name):
+                        continue
+                    fileobj = tf.extractfile(member)
+                    assert fileobj is not None
+                    yield member.name, member.mtime, fileobj
+
+
+def _member_path(dst: Path, name: str) -> Path:
+    """Where to extract a member, refusing members which would land outside `dst`"""
+    parts = PurePosixPath(name).parts
+    if not parts or PurePosixPath(name).is_absolute() or ".." in parts:
+        raise ValueError(f"Refusing to extract archive member [{name}]")
+    return dst.joinpath(*parts)
+
+
+def sidecar_member(name: str) -> bool:
+    return name.endswith(".json")
+
+
+def stem_members(stems: list[PurePosixPath]) -> Callable[[str], bool]:
+    """Select the members which belong to any of the given stems
+
+    A member belongs to a stem (a path without extension, relative to the root
+    of the archive) if it's in the stem's directory (or below it) and its name
+    starts with the stem's name followed by a `.`, the same files the core
+    `move` hook moves for an acquisition.
+    """
+    by_parent: dict[PurePosixPath, list[str]] = {}
+    for stem in stems:
+        by_parent.setdefault(stem.parent, []).append(f"{stem.name}.")
+
+    def select(name: str) -> bool:
+        path = PurePosixPath(name)
+        for parent in [path.parent, *path.parent.parents]:
+            prefixes = by_parent.get(parent)
+            if prefixes and path.name.startswith(tuple(prefixes)):
+                return True
+        return False
+
+    return select
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+from typing import Any
+from typing import TYPE_CHECKING
+
+from d2b.plugins import pm
+from d2b.utils import md5_from_file
+from d2b.utils import md5_from_string
+from d2b.utils import splitext
+from d2b.utils import write_json_atomic
+
+if TYPE_CHECKING:
+    from d2b.criteria import Criteria
+
+
+class MatchCache:
+    """Verdicts of (file, description) pairs, persisted across runs
+
+    A verdict is keyed by a hash of the file (its path and contents) and a
+    hash of the description's compiled criteria (the criteria together with
+    the searchMethod and caseSensitive settings), so a verdict is reused
+    only if neither the file nor the description has changed since it was
+    recorded. Criteria which only look at a file's name or path are keyed by
+    the file's path alone.
+
+    The whole cache is discarded if the installed version of d2b, or the set
+    of plugins which link files to descriptions, has changed.
+    """
+
+    def __init__(self, path: str | Path, logger: logging.Logger | None = None):
+        self.path = Path(path)
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._verdicts: dict[str, dict[str, bool]] = {}
+        # the verdicts which were looked up or recorded during this run
+        self._used: dict[str, dict[str, bool]] = {}
+        self._file_keys: dict[tuple[Path, bool], str] = {}
+
+    @classmethod
+    def load(cls, path: str | Path, logger: logging.Logger | None = None):
+        cache = cls(path, logger)
+        if not cache.path.is_file():
+            return cache
+        try:
+            data = json.loads(cache.path.read_text())
+        except (OSError, ValueError) as e:
+            cache.logger.warning(f"Ignoring unreadable match cache [{path}]: {e}")
+            return cache
+        if data.get("identity") == cls.identity():
+            cache._verdicts = data.get("verdicts", {})
+        return cache
+
+    def save(self) -> None:
+        """Persist the verdicts used during this run (stale verdicts are dropped)"""
+        data = {"identity": self.identity(), "verdicts": self._used}
+        write_json_atomic(self.path, data)
+
+    @staticmethod
+    def identity() -> dict[str, Any]:
+        from d2b.d2b import __version__
+
+        plugins = sorted(
+            {
+                impl.plugin_name
+                for hook in (pm.hook.is_link, pm.hook.is_link_batch)  # type: ignore
+                for impl in hook.get_hookimpls()
+            },
+        )
+        return {"d2b": __version__, "plugins": plugins}
+
+    def get(self, path: Path, criteria: Criteria) -> bool | None:
+        file_key = self.file_key(path, criteria.needs_data)
+        verdict = self._verdicts.get(file_key, {}).get(self.criteria_key(criteria))
+        if verdict is not None:
+            self._used.setdefault(file_key, {})[self.criteria_key(criteria)] = verdict
+        return verdict
+
+    def put(self, path: Path, criteria: Criteria, verdict: bool) -> None:
+        file_key = self.file_key(path, criteria.needs_data)
+        self._verdicts.setdefault(file_key, {})[self.criteria_key(criteria)] = verdict
+        self._used.setdefault(file_key, {})[self.criteria_key(criteria)] = verdict
+
+    def file_key(self, path: Path, with_contents: bool = True) -> str:
+        key = (path, with_contents)
+        if key not in self._file_keys:
+            digest = md5_from_string(str(path))
+            if with_contents:
+                digest.update(self._contents_digest(path).encode())
+            self._file_keys[key] = digest.hexdigest()
+        return self._file_keys[key]
+
+    @staticmethod
+    def criteria_key(criteria: Criteria) -> str:
+        return criteria.digest
+
+    @staticmethod
+    def _contents_digest(path: Path) -> str:
+        try:
+            if splitext(path)[1] != ".json":
+                # don't read through (potentially very large) non-sidecar files,
+                # their size and modification time stand in for their contents
+                stat = path.stat()
+                return f"{stat.st_size}:{stat.st_mtime_ns}"
+            return md5_from_file(path).hexdigest()
+        except FileNotFoundError:
+            return ""
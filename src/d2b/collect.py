@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from pathlib import Path
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Tuple
+
+from d2b import defaults
+from d2b.utils import write_json_atomic
+
+
+class StemIndex:
+    """The files below a set of directories, found with a single walk
+
+    The index answers the questions the collect, move, and IntendedFor stages
+    would otherwise each answer by walking (or globbing) the directories again,
+    e.g. "which files share a stem with this sidecar?". The file names of each
+    directory are kept sorted, so the files which start with a given prefix
+    are found by bisection.
+
+    Examples:
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as d:
+        ...     for fn in ['a.json', 'a.nii.gz', 'ab.json', 'b/a.bval']:
+        ...         (Path(d) / fn).parent.mkdir(exist_ok=True)
+        ...         _ = (Path(d) / fn).write_text('')
+        ...     index = StemIndex.build([Path(d)])
+        ...     siblings = index.siblings(Path(d) / 'a')
+        ...     all_siblings = index.siblings(Path(d) / 'a', recursive=True)
+        ...
+        >>> [p.name for p in siblings], [p.name for p in all_siblings]
+        (['a.json', 'a.nii.gz'], ['a.json', 'a.nii.gz', 'a.bval'])
+    """
+
+    def __init__(self):
+        # directory -> the sorted names of the files in it
+        self._files: dict[Path, list[str]] = {}
+        # directory -> its subdirectories
+        self._subdirs: dict[Path, list[Path]] = {}
+
+    def __contains__(self, path: object) -> bool:
+        _path = Path(path)  # type: ignore
+        names = self._files.get(_path.parent, [])
+        i = bisect.bisect_left(names, _path.name)
+        return i < len(names) and names[i] == _path.name
+
+    def __len__(self) -> int:
+        return sum(len(names) for names in self._files.values())
+
+    @classmethod
+    def build(
+        cls,
+        directories: Iterable[str | Path],
+        threads: int = defaults.walk_threads,
+        cache: WalkCache | None = None,
+    ) -> StemIndex:
+        """Index the files below `directories`, listing up to `threads`
+        directories at once (see `walk()`)"""
+        index = cls()
+        for directory, filenames, subdirs in walk(directories, threads, cache):
+            index.add_directory(directory, filenames, subdirs)
+        return index
+
+    def add_directory(
+        self,
+        directory: Path,
+        filenames: list[str],
+        subdirs: list[Path],
+    ) -> None:
+        """Record the listing of a single directory"""
+        self._register(directory)
+        self._files[directory] = sorted(filenames)
+        for subdir in subdirs:
+            self._register(subdir)
+
+    def refresh(
+        self,
+        directories: Iterable[str | Path],
+        threads: int = defaults.walk_threads,
+        cache: WalkCache | None = None,
+    ) -> None:
+        """Index the files below `directories` again, e.g. after files were
+        written to them, directories which weren't indexed yet are added"""
+        roots: list[Path] = []
+        # a directory sorts directly after its ancestors
+        for directory in sorted({Path(d) for d in directories}):
+            if not roots or roots[-1] not in directory.parents:
+                roots.append(directory)
+        for root in roots:
+            for d in list(self._walk(root)):
+                self._files.pop(d, None)
+                self._subdirs.pop(d, None)
+            # root is registered anew (once it's listed again) below
+            siblings = self._subdirs.get(root.parent, [])
+            if root in siblings:
+                siblings.remove(root)
+        for directory, filenames, subdirs in walk(roots, threads, cache):
+            self.add_directory(directory, filenames, subdirs)
+
+    def add(self, path: str | Path) -> None:
+        """Record a single (e.g. newly created) file"""
+        _path = Path(path)
+        # register any new directories between the file and the indexed tree
+        missing: list[Path] = []
+        directory = _path.parent
+        while directory not in self._files and directory.parent != directory:
+            missing.append(directory)
+            directory = directory.parent
+        if directory not in self._files:
+            missing = [_path.parent]
+        for d in reversed(missing):
+            self._register(d)
+        names = self._files[_path.parent]
+        i = bisect.bisect_left(names, _path.name)
+        if i == len(names) or names[i] != _path.name:
+            names.insert(i, _path.name)
+
+    def files(self, suffix: str | None = None) -> list[Path]:
+        """Every file in the index, or only those whose names end with `suffix`"""
+        return [
+            directory / name
+            for directory, names in self._files.items()
+            for name in names
+            if suffix is None or name.endswith(suffix)
+        ]
+
+    def children(self, directory: Path, prefix: str = "") -> list[Path]:
+        """The files directly in `directory` whose names start with `prefix`"""
+        names = self._files.get(directory, [])
+        i = bisect.bisect_left(names, prefix)
+        matches: list[Path] = []
+        while i < len(names) and names[i].startswith(prefix):
+            matches.append(directory / names[i])
+            i += 1
+        return matches
+
+    def siblings(self, root: Path, recursive: bool = False) -> list[Path]:
+        """The files which share the file root `root` (parent dir + stem)
+
+        i.e. the files in `root.parent` whose names start with `root.name`
+        followed by a `.`. If `recursive` is `True` the files in
+        subdirectories of `root.parent` are also included (as with
+        `root.parent.rglob(f"{root.name}.*")`).
+        """
+        prefix = f"{root.name}."
+        directories = [root.parent]
+        if recursive:
+            directories = list(self._walk(root.parent))
+        return [p for d in directories for p in self.children(d, prefix)]
+
+    def _walk(self, directory: Path) -> Iterable[Path]:
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            yield current
+            stack.extend(reversed(self._subdirs.get(current, [])))
+
+    def _register(self, directory: Path) -> None:
+        if directory in self._files:
+            return
+        self._files[directory] = []
+        self._subdirs[directory] = []
+        parent = directory.parent
+        if parent != directory and parent in self._files:
+            self._subdirs[parent].append(directory)
+
+
+TListing = Tuple[Path, List[str], List[Path]]
+
+
+class WalkCache:
+    """Directory listings, persisted across runs and keyed by modification time
+
+    Adding, removing, or renaming an entry of a directory updates the
+    directory's modification time, so the listing of a directory whose
+    modification time (and inode) hasn't changed since it was recorded is
+    reused, at the cost of a single `stat` rather than reading the directory
+    and checking the type of each of its entries. Every directory is still
+    stat-ed, since changes below a subdirectory don't update its parent.
+
+    A listing is only recorded if the directory's modification time is at
+    least `WalkCache.racy_ns` older than the listing, so a change made within
+    the filesystem's timestamp granularity of the listing (which might leave
+    the modification time as it was) can't be missed on a later run.
+
+    Note:
+        Entries are classified when they're listed, replacing the target of a
+        symlink (e.g. a file with a directory) isn't noticed until the
+        directory containing the symlink itself changes.
+    """
+
+    version = 1
+    racy_ns = 2_000_000_000
+
+    def __init__(self, path: str | Path, logger: logging.Logger | None = None):
+        self.path = Path(path)
+        self.logger = logger or logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+
+        # directory -> [mtime_ns, inode, filenames, subdirectory names]
+        self._listings: dict[str, list] = {}
+        # the listings which were reused or recorded during this run
+        self._used: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str | Path, logger: logging.Logger | None = None):
+        cache = cls(path, logger)
+        if not cache.path.is_file():
+            return cache
+        try:
+            data = json.loads(cache.path.read_text())
+        except (OSError, ValueError) as e:
+            cache.logger.warning(f"Ignoring unreadable walk cache [{path}]: {e}")
+            return cache
+        if data.get("version") == cls.version:
+            cache._listings = data.get("listings", {})
+        return cache
+
+    def save(self) -> None:
+        """Persist the listings used during this run (stale listings are dropped)"""
+        write_json_atomic(self.path, {"version": self.version, "listings": self._used})
+
+    def list_directory(self, directory: Path) -> tuple[list[str], list[Path]]:
+        """The same as `list_directory()`, reusing the recorded listing if the
+        directory hasn't changed since"""
+        try:
+            st = os.stat(directory)
+        except OSError:
+            return list_directory(directory)
+
+        key = str(directory)
+        cached = self._listings.get(key)
+        if cached is not None and cached[:2] == [st.st_mtime_ns, st.st_ino]:
+            with self._lock:
+                self.hits += 1
+                self._used[key] = cached
+            return list(cached[2]), [directory / name for name in cached[3]]
+
+        listed_at = time.time_ns()
+        filenames, subdirs = list_directory(directory)
+        with self._lock:
+            self.misses += 1
+            if st.st_mtime_ns + self.racy_ns <= listed_at:
+                names = [d.name for d in subdirs]
+                self._used[key] = [st.st_mtime_ns, st.st_ino, filenames, names]
+        return filenames, subdirs
+
+
+def walk(
+    directories: Iterable[str | Path],
+    threads: int = defaults.walk_threads,
+    cache: WalkCache | None = None,
+) -> Iterator[TListing]:
+    """Yield the listing of every directory below (and including) `directories`
+
+    Each listing is a `(directory, filenames, subdirectories)` tuple, as
+    returned by `list_directory()`. If `threads` is greater than 1 then the
+    directories are listed by a pool of threads, so on high-latency (e.g.
+    network) filesystems many listings are in flight at once. A directory's
+    listing is always yielded before the listings of its subdirectories,
+    otherwise the order is that in which the listings complete. At most
+    `threads * 4` listings are queued at once, the rest wait their turn.
+    Unchanged directories' listings are reused from `cache` (if given).
+
+    Examples:
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as d:
+        ...     for sub in ['a/b', 'a/c', 'd']:
+        ...         (Path(d) / sub).mkdir(parents=True)
+        ...     listings = list(walk([d], threads=4))
+        ...
+        >>> len(listings)
+        5
+    """
+    list_fn = list_directory if cache is None else cache.list_directory
+    roots = deque(Path(d) for d in directories)
+    if threads <= 1:
+        while roots:
+            directory = roots.pop()
+            filenames, subdirs = list_fn(directory)
+            yield directory, filenames, subdirs
+            roots.extend(reversed(subdirs))
+        return
+
+    max_in_flight = threads * 4
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        in_flight: dict[Future, Path] = {}
+        while roots or in_flight:
+            while roots and len(in_flight) < max_in_flight:
+                directory = roots.popleft()
+                in_flight[executor.submit(list_fn, directory)] = directory
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory = in_flight.pop(future)
+                filenames, subdirs = future.result()
+                yield directory, filenames, subdirs
+                roots.extend(subdirs)
+
+
+def list_directory(directory: Path) -> tuple[list[str], list[Path]]:
+    """The names of the files, and the paths of the subdirectories, in `directory`
+
+    Symlinks to files are included as files, symlinks to directories are
+    ignored. A directory which can't be listed is treated as empty.
+    """
+    filenames: list[str] = []
+    subdirs: list[Path] = []
+    try:
+        it = os.scandir(directory)
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return filenames, subdirs
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(Path(entry.path))
+                elif entry.is_file():
+                    filenames.append(entry.name)
+            except OSError:
+                continue
+    return filenames, subdirs
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import os
+from functools import partial
+from pathlib import Path
+from typing import Any
+from typing import TYPE_CHECKING
+
+from d2b.criteria import CompiledPattern
+from d2b.criteria import Criteria
+from d2b.criteria import MatchMemo
+from d2b.criteria import PATH_TAGS
+from d2b.criteria import tag_value
+from d2b.criteria import TPattern
+from d2b.utils import splitext
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+if TYPE_CHECKING:
+    from d2b.sidecars import SidecarCache
+
+
+# on posix `fnmatch` does not normalize the case of the strings it compares
+_NORMCASE_IS_NOOP = os.path.normcase("A/") == "A/"
+
+
+def available() -> bool:
+    """Whether NumPy is installed (and so the columnar engine can be used)"""
+    return np is not None
+
+
+def check_engine(engine: str | None) -> None:
+    """Raise an `ImportError` if `engine` is the columnar engine but NumPy
+    isn't installed (so a run fails before, rather than while, matching)"""
+    if engine == "numpy" and not available():
+        raise ImportError(
+            "The numpy matching engine (--match-engine numpy) requires numpy, "
+            "install it or use --match-engine auto",
+        )
+
+
+class SidecarTable:
+    """The values of a set of tags across many sidecars, stored column-wise
+
+    Rows which aren't sidecars (i.e. not `.json` files) are kept, but are
+    never considered a match for any criteria (see `SidecarTable.mask`).
+    """
+
+    def __init__(
+        self,
+        paths: list[Path],
+        tags: set[str],
+        sidecars: SidecarCache,
+        memo: MatchMemo | None = None,
+    ):
+        if np is None:
+            raise ImportError("The columnar matching engine requires numpy")
+
+        self.paths = paths
+        self.memo = memo
+        self.mask = np.array(
+            [splitext(p)[1] == ".json" for p in paths],
+            dtype=bool,
+        )
+
+        # sidecars are only read if some tag refers to their contents
+        needs_data = any(tag not in PATH_TAGS for tag in tags)
+        rows: list[dict[str, Any]] = [
+            sidecars.get(p) if is_sidecar and needs_data else {}
+            for p, is_sidecar in zip(paths, self.mask)
+        ]
+        self.columns: dict[str, np.ndarray] = {}
+        for tag in tags:
+            column = np.empty(len(paths), dtype=object)
+            column[:] = [tag_value(tag, p, data) for p, data in zip(paths, rows)]
+            self.columns[tag] = column
+
+        # (tag, pattern) -> per-row verdicts
+        self._verdicts: dict[tuple[str, TPattern], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def evaluate(self, tag: str, pattern: TPattern) -> np.ndarray:
+        """Evaluate a single pattern against every row of a tag's column"""
+        key = (tag, pattern)
+        if key not in self._verdicts:
+            self._verdicts[key] = self._evaluate(tag, pattern)
+        return self._verdicts[key]
+
+    def _evaluate(self, tag: str, pattern: TPattern) -> np.ndarray:
+        column = self.columns[tag]
+        # path-based values are (almost) unique to each row, see MatchMemo
+        memo = self.memo if tag not in PATH_TAGS else None
+        if isinstance(pattern, CompiledPattern):
+            strings = np.array([str(v) for v in column], dtype=str)
+            if (
+                pattern.literal is not None
+                and pattern.case_sensitive
+                and _NORMCASE_IS_NOOP
+            ):
+                # a literal, case-sensitive pattern is a plain equality check
+                return strings == pattern.literal
+            uniques, inverse = np.unique(strings, return_inverse=True)
+            match = pattern.match if memo is None else partial(memo.match, pattern)
+            verdicts = np.fromiter(
+                (match(u) for u in uniques),
+                dtype=bool,
+                count=len(uniques),
+            )
+            return verdicts[inverse.reshape(-1)]
+
+        # list patterns may be compared against list values, which aren't
+        # hashable, so the distinct values are found via their repr
+        first_seen: dict[str, int] = {}
+        inverse = np.fromiter(
+            (first_seen.setdefault(repr(v), len(first_seen)) for v in column),
+            dtype=np.intp,
+            count=len(column),
+        )
+        representatives = [None] * len(first_seen)
+        for value, position in zip(column, inverse):
+            representatives[position] = value
+        verdicts = np.fromiter(
+            (pattern.match(v, memo) for v in representatives),
+            dtype=bool,
+            count=len(representatives),
+        )
+        return verdicts[inverse]
+
+
+def match_matrix(
+    paths: list[Path],
+    criteria: list[Criteria | None],
+    sidecars: SidecarCache,
+    memo: MatchMemo | None = None,
+) -> np.ndarray:
+    """Return a (files x criteria) boolean matrix of which files match which criteria
+
+    Every sidecar's referenced tags are loaded into a columnar table and each
+    criteria is evaluated over whole columns at once. A pattern is evaluated
+    once per distinct value in a column, the per-file verdicts are then
+    gathered and combined with vectorized operations. If a `memo` is given
+    then the verdicts of the distinct values are looked up in (and added to)
+    it, so they're shared with every other batch matched with the same memo.
+    """
+    tags = {tag for c in criteria if c is not None for tag, _ in c.patterns}
+    table = SidecarTable(paths, tags, sidecars, memo)
+
+    matrix = np.zeros((len(paths), len(criteria)), dtype=bool)
+    for position, c in enumerate(criteria):
+        if c is None:
+            continue
+        column = table.mask.copy()
+        for tag, pattern in c.patterns:
+            column &= table.evaluate(tag, pattern)
+        matrix[:, position] = column
+
+    return matrix
@@ -21,7 +21,7 @@ def create_run_parser(subparsers: Union[argparse._SubParsersAction, None]):
         "in_dir",
         type=Path,
         nargs="+",
-        help="Directory(ies) containing files to organize",
+        help="Directory(ies), or tar/zip archive(s), containing files to organize",
     )
 
     required.add_argument(
@@ -54,6 +54,140 @@ def create_run_parser(subparsers: Union[argparse._SubParsersAction, None]):
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
         help="Set logging level",
     )
+    optional.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=defaults.jobs,
+        help="Number of processes used to match files against descriptions",
+    )
+    optional.add_argument(
+        "--match-engine",
+        default=defaults.match_engine,
+        choices=defaults.match_engine_choices,
+        help=(
+            "How files are matched against descriptions, 'auto' uses the "
+            "(vectorized) 'numpy' engine if NumPy is installed"
+        ),
+    )
+    optional.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help=(
+            "Don't reuse (or record) match results or directory listings from "
+            "previous runs"
+        ),
+    )
+    optional.add_argument(
+        "--sidecar-cache-size",
+        type=int,
+        default=defaults.sidecar_cache_size,
+        help="Maximum number of parsed sidecar files to hold in memory at once",
+    )
+    optional.add_argument(
+        "--stage-jobs",
+        type=int,
+        default=defaults.stage_jobs,
+        help="Number of input directories to copy into the staging area at once",
+    )
+    optional.add_argument(
+        "--walk-threads",
+        type=int,
+        default=defaults.walk_threads,
+        help=(
+            "Number of directories listed at once while collecting files, "
+            "values > 1 help on high-latency (e.g. network) filesystems"
+        ),
+    )
+    optional.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help=(
+            "Resume an interrupted run of the same participant/session, "
+            "skipping the stages it completed, e.g. only the acquisitions which "
+            "weren't moved yet are moved"
+        ),
+    )
+    optional.add_argument(
+        "--plan-only",
+        action="store_true",
+        default=False,
+        help=(
+            "Log where every matched file would be moved, and stop before "
+            "moving anything"
+        ),
+    )
+    optional.add_argument(
+        "--durability",
+        default=defaults.durability,
+        choices=defaults.durability_choices,
+        help=(
+            "When files written to the BIDS directory are flushed to disk "
+            "(fsync), 'none' leaves it to the OS, 'batch' writes sidecars "
+            "atomically and flushes every file and directory once at the end "
+            "of the move stage, 'strict' flushes each file as it's written"
+        ),
+    )
+    optional.add_argument(
+        "--move-jobs",
+        type=int,
+        default=defaults.move_jobs,
+        help=(
+            "Number of acquisitions moved into the BIDS directory at once, "
+            "acquisitions with conflicting files are always moved one at a time"
+        ),
+    )
+    optional.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help=(
+            "Match files while the input directories are still being walked, "
+            "rather than once every file has been collected"
+        ),
+    )
+    optional.add_argument(
+        "--stage-mode",
+        default=defaults.stage_mode,
+        choices=defaults.stage_mode_choices,
+        help=(
+            "How input files on the same filesystem as the output directory are "
+            "staged, 'auto' reflinks (copy-on-write) or else hardlinks them, "
+            "'reflink' reflinks or else copies them, 'copy' always copies them. "
+            "'none' doesn't stage any files, files are matched in place and only "
+            "the matched files are copied into the BIDS directory. "
+            "NOTE: hardlinked BIDS files share their data with the input files"
+        ),
+    )
+    optional.add_argument(
+        "--copy-engine",
+        default=defaults.copy_engine,
+        choices=defaults.copy_engine_choices,
+        help=(
+            "How input directories are copied, 'python' copies files in-process "
+            "(several at once), 'rsync' runs the external rsync tool"
+        ),
+    )
+    optional.add_argument(
+        "--copy-jobs",
+        type=int,
+        default=defaults.copy_jobs,
+        help=(
+            "Number of files copied at once, by the 'python' copy engine and "
+            "when moving files to the BIDS directory across filesystems"
+        ),
+    )
+    optional.add_argument(
+        "--checksum",
+        action="store_true",
+        default=False,
+        help=(
+            "Compare every input file with its staged copy by contents (slow), "
+            "rather than only re-staging files whose size or mtime has changed"
+        ),
+    )
 
     _parser.set_defaults(handler=handler)
 
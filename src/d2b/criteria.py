@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from fnmatch import translate
+from pathlib import Path
+from typing import Any
+from typing import cast
+from typing import Mapping
+from typing import Union
+
+from d2b import defaults
+from d2b.utils import LRUCache
+from d2b.utils import md5_from_string
+
+
+FILENAME_TAGS = ("filename", "SidecarFilename")
+FILEPATH_TAGS = ("filepath", "SidecarFilepath")
+PATH_TAGS = FILENAME_TAGS + FILEPATH_TAGS
+
+
+class CompiledPattern:
+    """A single criteria pattern, translated, case-folded, and compiled once
+
+    `CompiledPattern(pattern, search_method, case_sensitive).match(name)` is
+    equivalent to `d2b.utils.compare(name, pattern, search_method, case_sensitive)`
+    without the per-call translation and compilation.
+
+    Examples:
+        >>> CompiledPattern('*es*').match('Test')
+        True
+        >>> CompiledPattern('*es*').match('TEST')
+        False
+        >>> CompiledPattern('*es*', case_sensitive=False).match('TEST')
+        True
+        >>> CompiledPattern('.+es.+', 're').match('Test')
+        True
+    """
+
+    def __init__(
+        self,
+        pattern: Any,
+        search_method: str = defaults.search_method,
+        case_sensitive: bool = defaults.case_sensitive,
+    ):
+        self.pattern = str(pattern)
+        self.search_method = search_method
+        self.case_sensitive = case_sensitive
+
+        if search_method == "re":
+            self._regex = re.compile(self.pattern)
+        else:
+            self._regex = re.compile(translate(self.fold(self.pattern, case_sensitive)))
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self.pattern!r}, "
+            f"{self.search_method!r}, {self.case_sensitive!r})"
+        )
+
+    def __eq__(self, o: Any):
+        return isinstance(o, self.__class__) and self._key == o._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    @property
+    def _key(self) -> tuple[str, str, bool]:
+        return (self.pattern, self.search_method, self.case_sensitive)
+
+    @property
+    def literal(self) -> str | None:
+        """The (folded) string this pattern matches exactly, if it has no wildcards"""
+        if self.search_method == "re" or any(c in self.pattern for c in "*?["):
+            return None
+        return self.fold(self.pattern, self.case_sensitive)
+
+    @staticmethod
+    def fold(name: Any, case_sensitive: bool = defaults.case_sensitive) -> str:
+        """Normalize a string the way `fnmatch` does before comparing it"""
+        _name = str(name) if case_sensitive else str(name).lower()
+        return os.path.normcase(_name)
+
+    def match(self, name: Any) -> bool:
+        if self.search_method == "re":
+            return self._regex.search(str(name)) is not None
+        return self._regex.match(self.fold(name, self.case_sensitive)) is not None
+
+
+class ListPattern:
+    """A list-valued criteria pattern
+
+    A list pattern matches a list-valued tag if there's a bijective mapping
+    between the two lists. Any other tag value is compared against the
+    string form of the list (compiled on first use).
+    """
+
+    def __init__(
+        self,
+        patterns: list[Any],
+        search_method: str = defaults.search_method,
+        case_sensitive: bool = defaults.case_sensitive,
+    ):
+        self.raw = patterns
+        self.search_method = search_method
+        self.case_sensitive = case_sensitive
+        self.items = [
+            CompiledPattern(p, search_method, case_sensitive) for p in patterns
+        ]
+
+        self._whole: CompiledPattern | None = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.raw!r})"
+
+    @property
+    def whole(self) -> CompiledPattern:
+        if self._whole is None:
+            self._whole = CompiledPattern(
+                self.raw,
+                self.search_method,
+                self.case_sensitive,
+            )
+        return self._whole
+
+    def match(self, value: Any, memo: MatchMemo | None = None) -> bool:
+        _match = memo.match if memo is not None else _unmemoized_match
+        if not isinstance(value, list):
+            return _match(self.whole, value)
+        # check that there's a bijective mapping between the two lists
+        matching_length = len(value) == len(self.items)
+        matching_contents = all(
+            any(_match(p, item) for item in value) for p in self.items
+        )
+        return matching_length and matching_contents
+
+
+class MatchMemo:
+    """An LRU-bounded memo of pattern verdicts, keyed on (value, pattern)
+
+    Since a `CompiledPattern` is identified by its pattern, search method, and
+    case sensitivity, each distinct (value, pattern) pair is only evaluated
+    once while it is held in the memo. Sharing one memo across many sidecars
+    makes the cost of matching scale with the number of distinct tag values
+    rather than with the number of sidecars.
+
+    Examples:
+        >>> memo = MatchMemo(maxsize=128)
+        >>> pattern = CompiledPattern('*MPRAGE*')
+        >>> memo.match(pattern, 'T1_MPRAGE'), memo.match(pattern, 'T1_MPRAGE')
+        (True, True)
+        >>> memo.hits, memo.misses
+        (1, 1)
+    """
+
+    def __init__(self, maxsize: int = defaults.match_memo_size):
+        self._cache: LRUCache[tuple[str, CompiledPattern], bool] = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def match(self, pattern: CompiledPattern, value: Any) -> bool:
+        # patterns compare the string form of a value, so values with the same
+        # string form share a verdict
+        key = (str(value), pattern)
+        verdict = self._cache.get(key)
+        if verdict is None:
+            self.misses += 1
+            verdict = pattern.match(key[0])
+            self._cache.put(key, verdict)
+        else:
+            self.hits += 1
+        return verdict
+
+
+def _unmemoized_match(pattern: CompiledPattern, value: Any) -> bool:
+    return pattern.match(value)
+
+
+TPattern = Union[CompiledPattern, ListPattern]
+
+
+class Criteria:
+    """The criteria of a description, with every pattern compiled up front
+
+    Examples:
+        >>> from pathlib import Path
+        >>> criteria = Criteria({'filename': '*T1*', 'EchoNumber': '1'})
+        >>> criteria.matches(Path('a/T1w.json'), {'EchoNumber': 1})
+        True
+        >>> criteria.matches(Path('a/T1w.json'), {'EchoNumber': 2})
+        False
+    """
+
+    def __init__(
+        self,
+        criteria: dict[str, Any],
+        search_method: str = defaults.search_method,
+        case_sensitive: bool = defaults.case_sensitive,
+    ):
+        self.criteria = criteria
+        self.search_method = search_method
+        self.case_sensitive = case_sensitive
+
+        # path-based patterns come first, so a sidecar's contents are only
+        # needed (and read) if the sidecar's name and path already match
+        self.patterns: list[tuple[str, TPattern]] = sorted(
+            ((tag, self._compile(tag, pattern)) for tag, pattern in criteria.items()),
+            key=lambda item: item[0] not in PATH_TAGS,
+        )
+
+        self._digest: str | None = None
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self.criteria!r}, "
+            f"{self.search_method!r}, {self.case_sensitive!r})"
+        )
+
+    @classmethod
+    def from_config(
+        cls,
+        criteria: dict[str, Any],
+        config: dict[str, Any] | None = None,
+    ):
+        _config = config or {}
+        return cls(
+            criteria,
+            search_method=_config.get("searchMethod", defaults.search_method),
+            case_sensitive=_config.get("caseSensitive", defaults.case_sensitive),
+        )
+
+    @property
+    def data_tags(self) -> set[str]:
+        """The sidecar keys whose values the criteria refer to"""
+        return {tag for tag, _ in self.patterns if tag not in PATH_TAGS}
+
+    @property
+    def needs_data(self) -> bool:
+        """Whether evaluating the criteria requires the contents of a sidecar"""
+        return bool(self.data_tags)
+
+    @property
+    def digest(self) -> str:
+        """A stable hash of the criteria and how its patterns are interpreted"""
+        if self._digest is None:
+            payload = json.dumps(
+                [self.criteria, self.search_method, self.case_sensitive],
+                sort_keys=True,
+                default=str,
+            )
+            self._digest = md5_from_string(payload).hexdigest()
+        return self._digest
+
+    def matches(
+        self,
+        path: Path,
+        data: Mapping[str, Any],
+        memo: MatchMemo | None = None,
+    ) -> bool:
+        """Determine if a sidecar (its path and contents) meets the criteria
+
+        Path-based patterns are evaluated first, so if `data` is a
+        `LazySidecar` the sidecar is only read when its contents are needed.
+
+        If a `memo` is given then verdicts are looked up in (and added to) it,
+        rather than evaluating every pattern against every value. Path-based
+        values are (almost) unique to each sidecar, so they're never memoized.
+        """
+        for tag, pattern in self.patterns:
+            value = tag_value(tag, path, data)
+            if isinstance(pattern, ListPattern):
+                verdict = pattern.match(value, memo)
+            elif memo is not None and tag not in PATH_TAGS:
+                verdict = memo.match(pattern, value)
+            else:
+                verdict = pattern.match(value)
+            if not verdict:
+                return False
+        return True
+
+    def _compile(self, tag: str, pattern: Any) -> TPattern:
+        method, case = self.search_method, self.case_sensitive
+        if isinstance(pattern, list) and tag not in PATH_TAGS:
+            return ListPattern(pattern, method, case)
+        return CompiledPattern(pattern, method, case)
+
+
+class CriteriaIndex:
+    """An inverted index from literal criteria values to criteria
+
+    Each criteria is filed under (at most) one of its literal (i.e. wildcard
+    free `fnmatch`) patterns, so a sidecar only has to be fully evaluated
+    against the criteria filed under its own tag values, plus the criteria
+    which have no literal patterns at all (and so have to be scanned).
+
+    Examples:
+        >>> from pathlib import Path
+        >>> index = CriteriaIndex([
+        ...     Criteria({'SeriesDescription': 'T1W_3D_TFE'}),
+        ...     Criteria({'SeriesDescription': 'fMRI*'}),
+        ...     Criteria({'SeriesDescription': 'DTI', 'EchoNumber': '1'}),
+        ... ])
+        >>> index.candidates(Path('a.json'), {'SeriesDescription': 'T1W_3D_TFE'})
+        [0, 1]
+        >>> index.match(Path('a.json'), {'SeriesDescription': 'T1W_3D_TFE'})
+        [0]
+    """
+
+    def __init__(
+        self,
+        criteria: list[Criteria | None],
+        memo: MatchMemo | None = None,
+    ):
+        self.criteria = criteria
+        self.memo = memo
+
+        # (tag, case_sensitive) -> folded literal value -> criteria positions
+        self.index: dict[tuple[str, bool], dict[str, list[int]]] = {}
+        # positions of the criteria which have to be scanned
+        self.scan: list[int] = []
+
+        for position, c in enumerate(criteria):
+            if c is None:
+                continue
+            literal = next(
+                (
+                    (tag, p)
+                    for tag, p in c.patterns
+                    if isinstance(p, CompiledPattern) and p.literal is not None
+                ),
+                None,
+            )
+            if literal is None:
+                self.scan.append(position)
+                continue
+            tag, pattern = literal
+            values = self.index.setdefault((tag, pattern.case_sensitive), {})
+            values.setdefault(cast(str, pattern.literal), []).append(position)
+
+        # path-based lookups first, see Criteria.patterns
+        self._index_items = sorted(
+            self.index.items(),
+            key=lambda item: item[0][0] not in PATH_TAGS,
+        )
+
+    def candidates(self, path: Path, data: Mapping[str, Any]) -> list[int]:
+        """Positions of the criteria which `path` could possibly match"""
+        positions = set(self.scan)
+        for (tag, case_sensitive), values in self._index_items:
+            key = CompiledPattern.fold(tag_value(tag, path, data), case_sensitive)
+            positions.update(values.get(key, ()))
+        return sorted(positions)
+
+    def match(self, path: Path, data: Mapping[str, Any]) -> list[int]:
+        """Positions of the criteria which `path` matches"""
+        return [
+            position
+            for position in self.candidates(path, data)
+            if cast(Criteria, self.criteria[position]).matches(path, data, self.memo)
+        ]
+
+
+def tag_value(tag: str, path: Path, data: Mapping[str, Any]) -> Any:
+    """The value a criteria's tag is compared against for a given sidecar"""
+    if tag in FILENAME_TAGS:
+        # check the file name of the sidecar
+        return path.name
+    elif tag in FILEPATH_TAGS:
+        # check the _path_ of the file
+        return str(path)
+    return data.get(tag, "")
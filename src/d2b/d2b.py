@@ -1,14 +1,20 @@
 from __future__ import annotations
 
 import itertools
+import json
 import logging
+import math
 import os
 import platform
 import sys
 from collections import defaultdict
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import datetime
 from pathlib import Path
+from pathlib import PurePosixPath
 from typing import Any
 from typing import cast
 from typing import DefaultDict
@@ -16,11 +22,30 @@ from typing import Iterator
 from typing import TypeVar
 
 from d2b import defaults
+from d2b.archives import Archive
+from d2b.archives import is_archive
+from d2b.archives import sidecar_member
+from d2b.archives import stem_members
+from d2b.cache import MatchCache
+from d2b.columnar import check_engine
+from d2b.collect import StemIndex
+from d2b.collect import walk
+from d2b.collect import WalkCache
+from d2b.criteria import Criteria
+from d2b.criteria import MatchMemo
+from d2b.durability import Durability
+from d2b.journal import RunJournal
+from d2b.moving import move_concurrently
+from d2b.moving import Mover
+from d2b.moving import MovePlan
+from d2b.moving import MovePlanError
 from d2b.plugins import pm
+from d2b.sidecars import SidecarCache
+from d2b.staging import Stager
 from d2b.utils import associated_nii_ext
 from d2b.utils import md5_from_string
 from d2b.utils import prepend
-from d2b.utils import rsync
+from d2b.utils import SORT_KEYS
 from d2b.utils import splitext
 
 __version__ = "1.4.2"
@@ -40,10 +65,18 @@ class D2B:
         options: dict[str, Any] | None = None,  # from the cli
     ):
         self.config: dict[str, Any]  # set by calling self.load_config()
+        self.src_dirs: list[Path]  # set in self.run()
+        self.stem_index: StemIndex  # set in self.run()
+        self._walk_cache: WalkCache | None = None  # set in self.run()
+        self._archives: dict[Path, Archive] = {}  # set in self.run()
         self.files: list[Path]  # set in self.run()
         self.descriptions: list[Description]  # set in self.run()
         self.matcher: Matcher  # set in self.run()
         self.acquisitions: list[Acquisition]  # set in self.run()
+        self.move_plan: MovePlan  # set in self.run()
+        self.mover: Mover  # set in self.run()
+        self.durability: Durability  # set in self.run()
+        self.journal: RunJournal  # set in self.run()
 
         self.in_dirs = (
             [Path(d) for d in in_dirs] if isinstance(in_dirs, list) else [Path(in_dirs)]
@@ -52,8 +85,12 @@ class D2B:
         self.config_file = Path(config_file)
         self.participant = Participant(participant, session)
         self.options = options or {}
+        check_engine(self.options.get("match_engine"))
 
         self.d2b_dir = self.out_dir / defaults.d2b_dir_name
+        self.sidecars = SidecarCache(
+            self.options.get("sidecar_cache_size", defaults.sidecar_cache_size),
+        )
 
         self._configure_logger()  # logging setup
 
@@ -67,17 +104,124 @@ class D2B:
         self._pre_run_logs()
         self._check_in_dirs_exist()
 
-        # make copies of the input directories
-        dst_parent = self.d2b_dir / "src"
-        for in_dir in self.in_dirs:
-            dst_dir = self._create_tmpdir_for(in_dir, dst_parent)
-            msg = f"Copying folder [{in_dir}] to temporary location [{dst_dir}]"
-            self.logger.info(msg)
-            rsync(in_dir, dst_dir, delete=True)
+        # load the descriptions
+        self.descriptions = [
+            Description.from_dict(i, d, self.config)
+            for i, d in enumerate(self.config["descriptions"])
+        ]
+        self._check_for_effectively_nonunique_descriptions(self.descriptions)
+
+        # only decode the sidecar keys which are sorted or matched on
+        self.sidecars = SidecarCache(self.sidecars.maxsize, keys=self._sidecar_keys())
+
+        # a journal of the completed stages, so an interrupted run can resume
+        self.journal = self._journal()
+
+        planned = self.journal.get("planned")
+        if planned is None:
+            self._find_acquisitions()
+            # plan the moves (every src -> dst pair) before anything is moved
+            self.move_plan = self._plan_moves()
+            self.journal.record("planned", acquisitions=self._planned_record())
+        else:
+            self._restore_plan(planned)
+        if self.options.get("plan_only"):
+            self.logger.info("Only planning the moves (--plan-only), nothing moved")
+            return
+
+        # move the files
+        self._move_acquisitions()
+
+        # run post-move hooks
+        self.logger.info("Running post-move hooks")
+        pm.hook.post_move(  # type: ignore
+            out_dir=self.out_dir,
+            acquisitions=self.acquisitions,
+            config=self.config,
+            options=self.options,
+            d2b=self,
+        )
+        self.journal.finish()
+
+    def _find_acquisitions(self):
+        """Stage, collect, and match the files, then resolve the acquisitions"""
+        # make copies of the input directories (unless matching in place)
+        if self._restore_staged():
+            self.logger.info("Resuming, the input directories are already staged")
+        else:
+            self.src_dirs = self._stage()
+            self.journal.record(
+                "staged",
+                src_dirs=[str(d) for d in self.src_dirs],
+                archives={str(d): str(a.path) for d, a in self._archives.items()},
+            )
+
+        cache = None
+        if not self.options.get("no_cache"):
+            cache_file = self.d2b_dir / "cache" / self.participant.directory
+            cache = MatchCache.load(cache_file / "matches.json", logger=self.logger)
+
+        # a single walk of the source directories, shared by the later stages
+        links = self._walk(cache)
+
+        collected = self.journal.get("collected")
+        if collected is None:
+            self._collect_files()
+            self.journal.record("collected", files=[str(fp) for fp in self.files])
+        else:
+            self.files = [Path(fp) for fp in collected["files"]]
+
+        # run the matching algorithm (only the files which weren't matched
+        # during the walk, or by the run being resumed, are matched now)
+        matched = self.journal.get("matched")
+        if matched is not None:
+            links = {Path(fp): positions for fp, positions in matched["links"].items()}
+        self.matcher = Matcher(
+            self.files,
+            self.participant,
+            self.descriptions,
+            self.config,
+            self.options,
+            sidecars=self.sidecars,
+            cache=cache,
+        )
+        unresolved_acquisitions = self.matcher.run(links)
+        if cache is not None:
+            cache.save()
+        if matched is None:
+            self.journal.record("matched", links=self._links_record())
+        self._extract_matched_archive_members(unresolved_acquisitions)
 
+        # resolve IntendedFor Fields
+        resolver = IntendedForResolver(logger=self.logger, index=self.stem_index)
+        self.acquisitions = resolver.resolve(unresolved_acquisitions)
+
+        # run pre-move hooks
+        self.logger.info("Running pre-move hooks")
+        pm.hook.pre_move(  # type: ignore
+            acquisitions=self.acquisitions,
+            config=self.config,
+            options=self.options,
+            d2b=self,
+        )
+
+    def _refresh_index(self) -> None:
+        """Index the source directories of the acquisitions again, so the move
+        plan includes the files written by the pre-move hooks, and the files
+        next to sidecars collected from outside the source directories"""
+        directories = {
+            acquisition.src_root.parent
+            for acquisition in self.acquisitions
+            if acquisition.src_file.suffix == ".json"
+        }
+        threads = self.options.get("walk_threads") or defaults.walk_threads
+        self.stem_index.refresh(directories, threads, self._walk_cache)
+
+    def _collect_files(self):
         # collect files for description-matching
         self.logger.info("Collecting files")
         collected_files: list[list[Path]] = pm.hook.collect_files(  # type: ignore
+            src_dirs=self.src_dirs,
             out_dir=self.out_dir,
             d2b_dir=self.d2b_dir,
             config=self.config,
@@ -98,58 +242,315 @@ class D2B:
             d2b=self,
         )
 
-        # load the descriptions
-        self.descriptions = [
-            Description.from_dict(i, d)
-            for i, d in enumerate(self.config["descriptions"])
-        ]
-        self._check_for_effectively_nonunique_descriptions(self.descriptions)
-
-        # run the matching algorithm
-        self.matcher = Matcher(
-            self.files,
-            self.participant,
-            self.descriptions,
-            self.config,
-            self.options,
+    def _move_acquisitions(self):
+        self.durability = Durability(
+            self.options.get("durability") or defaults.durability,
+        )
+        self.move_plan.make_directories()
+        self.durability.track_directories(self.move_plan.directories, self.out_dir)
+        self.mover = Mover(
+            self.out_dir,
+            self.src_dirs,
+            jobs=self.options.get("copy_jobs") or defaults.copy_jobs,
+            keep_sources=self.in_place,
+            logger=self.logger,
+            durability=self.durability,
         )
-        unresolved_acquisitions = self.matcher.run()
-
-        # resolve IntendedFor Fields
-        resolver = IntendedForResolver(logger=self.logger)
-        self.acquisitions = resolver.resolve(unresolved_acquisitions)
 
-        # run pre-move hooks
-        self.logger.info("Running pre-move hooks")
-        pm.hook.pre_move(  # type: ignore
+        self.logger.info("Moving acquisitions into BIDS folder")
+        try:
+            self._move_all()
+        finally:
+            # flush whatever was moved, even if some acquisitions failed
+            self.durability.commit()
+
+    def _plan_moves(self) -> MovePlan:
+        # the pre-move hooks may have written files next to the sidecars
+        self._refresh_index()
+        plan = MovePlan.build(self.acquisitions, self.out_dir, self.stem_index)
+        pm.hook.prepare_move_plan(  # type: ignore
+            plan=plan,
             acquisitions=self.acquisitions,
             config=self.config,
             options=self.options,
             d2b=self,
         )
+        collisions = plan.collisions()
+        if collisions:
+            raise MovePlanError(collisions)
+        self._warn_unplanned(plan)
+
+        level = logging.INFO if self.options.get("plan_only") else logging.DEBUG
+        for src, dst in plan:
+            self.logger.log(level, f"Planned [{src}] -> [{dst}]")
+        existing = plan.existing()
+        for dst in existing:
+            self.logger.debug(f"[{dst}] already exists")
+        if existing:
+            self.logger.warning(
+                f"❗ [{len(existing)}] files already exist in the BIDS directory "
+                "and will be overwritten",
+            )
+        return plan
 
-        # move the files
-        self.logger.info("Moving acquisitions into BIDS folder")
+    def _warn_unplanned(self, plan: MovePlan) -> None:
         for acquisition in self.acquisitions:
-            pm.hook.move(  # type: ignore
-                out_dir=self.out_dir,
-                acquisition=acquisition,
-                acquisitions=self.acquisitions,
-                config=self.config,
-                options=self.options,
-                d2b=self,
-            )
+            if acquisition.src_file.suffix == ".json" and not plan.moves(acquisition):
+                self.logger.warning(
+                    "No files are planned to be moved for the acquisition derived "
+                    f"from [{acquisition.src_file}]",
+                )
 
-        # run post-move hooks
-        self.logger.info("Running post-move hooks")
-        pm.hook.post_move(  # type: ignore
+    def _move_all(self) -> None:
+        moved = self.journal.moved
+        if moved:
+            self.logger.info(f"Resuming, [{len(moved)}] acquisitions were moved")
+        positions = {id(acq): i for i, acq in enumerate(self.acquisitions)}
+        pending = [acq for i, acq in enumerate(self.acquisitions) if i not in moved]
+
+        def move(acquisition: Acquisition) -> None:
+            self._move(acquisition)
+            self.journal.record("moved", acquisition=positions[id(acquisition)])
+
+        move_jobs = self.options.get("move_jobs") or defaults.move_jobs
+        if move_jobs > 1:
+            move_concurrently(pending, move, move_jobs, self.logger)
+        else:
+            for acquisition in pending:
+                move(acquisition)
+
+    def _move(self, acquisition: Acquisition) -> None:
+        pm.hook.move(  # type: ignore
             out_dir=self.out_dir,
+            acquisition=acquisition,
             acquisitions=self.acquisitions,
             config=self.config,
             options=self.options,
             d2b=self,
         )
 
+    def _journal(self) -> RunJournal:
+        path = self.d2b_dir / "journal" / self.participant.directory / "run.jsonl"
+        identity = {
+            "d2b": __version__,
+            "in_dirs": [str(d.expanduser().resolve()) for d in self.in_dirs],
+            "participant": str(self.participant.directory),
+            # an in-place run's "staged" directories are the input directories
+            "stage_mode": self.options.get("stage_mode") or defaults.stage_mode,
+            "config": md5_from_string(
+                json.dumps(self.config, sort_keys=True, default=str),
+            ).hexdigest(),
+        }
+        # a plan-only run leaves no journal behind for the next run to resume
+        persist = not self.options.get("plan_only")
+        if self.options.get("resume"):
+            journal = RunJournal.resume(path, identity, self.logger, persist)
+            if journal is not None:
+                self.logger.info(f"Resuming the run recorded in [{path}]")
+                return journal
+            self.logger.info("No run to resume, starting from the beginning")
+        return RunJournal.start(path, identity, persist)
+
+    def _restore_staged(self) -> bool:
+        staged = self.journal.get("staged")
+        if staged is None:
+            return False
+        self.src_dirs = [Path(d) for d in staged["src_dirs"]]
+        self._archives = {
+            Path(dst): Archive(src) for dst, src in staged["archives"].items()
+        }
+        return True
+
+    def _links_record(self) -> dict[str, list[int]]:
+        return {
+            str(fp): [acq.description.index for acq in acquisitions]
+            for fp, acquisitions in self.matcher.file_to_acq.items()
+        }
+
+    def _planned_record(self) -> list[dict[str, Any]]:
+        """The acquisitions as the pre-move hooks left them, and their moves"""
+        planned = {id(acq) for acq in self.move_plan.acquisitions}
+        return [
+            {
+                "src_file": str(acq.src_file),
+                "participant": [acq.participant.label, acq.participant.session],
+                "description": {
+                    "index": acq.description.index,
+                    "data_type": acq.description.data_type,
+                    "modality_label": acq.description.modality_label,
+                    "custom_labels": acq.description.custom_labels,
+                    "sidecar_changes": acq.description.sidecar_changes,
+                    "intended_for": acq.description.intended_for,
+                    "data": acq.description.data,
+                },
+                "data": acq.data,
+                "src_files": [str(src) for src, _ in self.move_plan.moves(acq)]
+                if id(acq) in planned
+                else None,
+            }
+            for acq in self.acquisitions
+        ]
+
+    def _restore_plan(self, planned: dict[str, Any]):
+        """Rebuild the acquisitions and the move plan of the run being resumed"""
+        self.logger.info("Resuming, the acquisitions' moves are already planned")
+        self._restore_staged()
+        threads = self.options.get("walk_threads") or defaults.walk_threads
+        self.stem_index = StemIndex.build(self.src_dirs, threads)
+        self.acquisitions = []
+        self.move_plan = MovePlan(self.out_dir)
+        for entry in planned["acquisitions"]:
+            index = entry["description"]["index"]
+            # (the pre-move hooks might have added descriptions of their own)
+            known = isinstance(index, int) and 0 <= index < len(self.descriptions)
+            description = Description(
+                **entry["description"],
+                criteria=self.descriptions[index].criteria if known else None,
+            )
+            acquisition = Acquisition(
+                entry["src_file"],
+                Participant(*entry["participant"]),
+                description,
+                entry["data"],
+            )
+            self.acquisitions.append(acquisition)
+            if entry["src_files"] is not None:
+                src_files = [Path(fp) for fp in entry["src_files"]]
+                self.move_plan.add(acquisition, src_files)
+
+    @property
+    def in_place(self) -> bool:
+        """Whether files are matched in (and copied from) the input directories,
+        rather than staged copies of them"""
+        return self.options.get("stage_mode") == "none"
+
+    def _stage(self) -> list[Path]:
+        archives = {d for d in self.in_dirs if is_archive(d)}
+        dst_parent = self.d2b_dir / "src"
+        src_dirs: list[Path] = []
+        pairs: list[tuple[Path, Path]] = []
+        for in_dir in self.in_dirs:
+            if self.in_place and in_dir not in archives:
+                src_dirs.append(in_dir)
+                continue
+            dst_dir = self._create_tmpdir_for(in_dir, dst_parent)
+            src_dirs.append(dst_dir)
+            pairs.append((in_dir, dst_dir))
+
+        # archives' sidecars are extracted now, their other files only once
+        # they're known to belong to a matched acquisition
+        self._archives = {dst: Archive(src) for src, dst in pairs if src in archives}
+
+        if self.in_place:
+            msg = "Matching files in place, only matched files will be copied"
+            self.logger.info(msg)
+        if pairs:
+            self._stager().stage(pairs)
+        return src_dirs
+
+    def _walk(self, cache: MatchCache | None) -> dict[Path, list[int]]:
+        """Index the source directories (and, if pipelined, match the sidecars
+        while doing so, returning the positions of the descriptions each matched)"""
+        threads = self.options.get("walk_threads") or defaults.walk_threads
+        walk_cache = None
+        if not self.options.get("no_cache"):
+            cache_dir = self.d2b_dir / "cache" / self.participant.directory
+            walk_cache = WalkCache.load(cache_dir / "walk.json", logger=self.logger)
+        self._walk_cache = walk_cache
+
+        links: dict[Path, list[int]] = {}
+        if self.options.get("pipeline"):
+            links = self._match_while_walking(threads, cache, walk_cache)
+        else:
+            self.stem_index = StemIndex.build(self.src_dirs, threads, walk_cache)
+
+        if walk_cache is not None:
+            self.logger.info(
+                f"Reused [{walk_cache.hits}] cached directory listings, "
+                f"listed [{walk_cache.misses}] directories",
+            )
+            walk_cache.save()
+        return links
+
+    def _match_while_walking(
+        self,
+        threads: int,
+        cache: MatchCache | None,
+        walk_cache: WalkCache | None = None,
+    ) -> dict[Path, list[int]]:
+        """Walk the source directories and match the sidecars found so far, in
+        batches on another thread, while the walk continues
+
+        Returns the positions of the descriptions each sidecar matched. Run
+        numbering and IntendedFor resolution need every acquisition, so they
+        still wait for the walk (and the collect hooks) to finish.
+        """
+        batch_size = self.options.get("pipeline_batch_size") or (
+            defaults.pipeline_batch_size
+        )
+        matcher = Matcher(
+            [],
+            self.participant,
+            self.descriptions,
+            self.config,
+            self.options,
+            sidecars=self.sidecars,
+            cache=cache,
+        )
+        self.logger.info("Matching files while collecting them")
+        self.stem_index = StemIndex()
+        batches: list[tuple[list[Path], Future[list[list[int]]]]] = []
+        batch: list[Path] = []
+        # the matcher's worker processes (if any) match every batch
+        with matcher, ThreadPoolExecutor(max_workers=1) as executor:
+            listings = walk(self.src_dirs, threads, walk_cache)
+            for directory, filenames, subdirs in listings:
+                self.stem_index.add_directory(directory, filenames, subdirs)
+                # the files the core collect_files hook collects
+                batch.extend(directory / fn for fn in filenames if fn.endswith(".json"))
+                if len(batch) >= batch_size:
+                    batches.append((batch, executor.submit(matcher.links, batch)))
+                    batch = []
+            if batch:
+                batches.append((batch, executor.submit(matcher.links, batch)))
+
+            links: dict[Path, list[int]] = {}
+            for files, future in batches:
+                links.update(zip(files, future.result()))
+        return links
+
+    def _stager(self) -> Stager:
+        # archives are staged even if directories are matched in place
+        mode = self.options.get("stage_mode") or defaults.stage_mode
+        cache_dir = self.d2b_dir / "cache" / self.participant.directory
+        return Stager(
+            self.options.get("stage_jobs") or defaults.stage_jobs,
+            logger=self.logger,
+            mode="copy" if self.in_place else mode,
+            manifest_dir=cache_dir / "staging",
+            checksum=bool(self.options.get("checksum")),
+            engine=self.options.get("copy_engine") or defaults.copy_engine,
+            copy_jobs=self.options.get("copy_jobs") or defaults.copy_jobs,
+        )
+
+    def _extract_matched_archive_members(self, acquisitions: list[Acquisition]):
+        for dst_dir, archive in self._archives.items():
+            stems = [
+                PurePosixPath(acq.src_root.relative_to(dst_dir).as_posix())
+                for acq in acquisitions
+                if dst_dir in acq.src_root.parents
+            ]
+            if not stems:
+                continue
+            select = stem_members(stems)
+            self.logger.info(f"Extracting matched files from archive [{archive.path}]")
+            extracted = archive.extract(
+                dst_dir,
+                lambda n: select(n) and not sidecar_member(n),
+            )
+            for fp in extracted:
+                self.stem_index.add(fp)
+
     def _pre_run_logs(self):
         self.logger.info("--- d2b start ---")
         self.logger.info("OS:version: %s", platform.platform())
@@ -163,7 +564,7 @@ class D2B:
         pm.hook.pre_run_logs(logger=self.logger, d2b=self)  # type: ignore
 
     def _check_in_dirs_exist(self):
-        dir_not_found = [d for d in self.in_dirs if not d.is_dir()]
+        dir_not_found = [d for d in self.in_dirs if not (d.is_dir() or is_archive(d))]
         if dir_not_found:
             raise FileNotFoundError(dir_not_found)
 
@@ -179,6 +580,13 @@ class D2B:
         short_hash = digest[:7]
         return short_hash
 
+    def _sidecar_keys(self) -> set[str]:
+        keys = set(SORT_KEYS)
+        for description in self.descriptions:
+            if description.criteria is not None:
+                keys |= description.criteria.data_tags
+        return keys
+
     def _check_for_effectively_nonunique_descriptions(
         self,
         descriptions: list[Description],
@@ -229,6 +637,8 @@ class Matcher:
         config: dict[str, Any] | None = None,  # d2b config
         options: dict[str, Any] | None = None,  # from the cli
         logger: logging.Logger | None = None,
+        sidecars: SidecarCache | None = None,
+        cache: MatchCache | None = None,
     ):
         self.participant = participant
         self.descriptions = descriptions
@@ -236,37 +646,239 @@ class Matcher:
         self.config = config or {}
         self.options = options or {}
         self.logger = logger or logging.getLogger(__name__)
+        self.sidecars = sidecars if sidecars is not None else SidecarCache()
+        self.cache = cache
+        check_engine(self.options.get("match_engine"))
+        # the pattern verdicts of the distinct tag values, for every batch
+        self.memo = MatchMemo(
+            self.options.get("match_memo_size") or defaults.match_memo_size,
+        )
+        # the worker processes, started by the first parallel match and kept
+        # until self.close(), so matching many batches pays for them once
+        self._executor: ProcessPoolExecutor | None = None
+
+        # compiled criteria, one entry per description
+        self.criteria = [self._compile_criteria(d) for d in descriptions]
 
         # populated in self.find_matches()
         self.file_to_acq: dict[Path, list[Acquisition]] = {fp: [] for fp in files}
         # populated in self.filter_unique_matches()
         self.acquisitions: list[Acquisition] = []
 
-    def run(self) -> list[Acquisition]:
-        self.find_matches()
+    def __enter__(self) -> Matcher:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def run(self, links: dict[Path, list[int]] | None = None) -> list[Acquisition]:
+        with self:
+            self.find_matches(links)
         self.filter_unique_matches()
         self.dedup_runs()
         return self.acquisitions
 
-    def find_matches(self):
-        possible_matches = itertools.product(self.files, self.descriptions)
-        for fp, description in possible_matches:
-            criteria = description.data.get("criteria")
-            if criteria is None:
+    def close(self) -> None:
+        """Shut down the worker processes (if any were started)"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def find_matches(self, links: dict[Path, list[int]] | None = None):
+        """Match the files against the descriptions
+
+        `links` holds the positions of the descriptions already known to match
+        some of the files (e.g. those matched while the files were still being
+        collected), only the other files are evaluated.
+        """
+        known = dict(links or {})
+        pending = [fp for fp in self.files if fp not in known]
+        if pending:
+            if len(pending) == len(self.files):
+                pending = self.files
+            known.update(zip(pending, self.links(pending)))
+
+        for fp in self.files:
+            for position in known[fp]:
+                description = self.descriptions[position]
+                acquisition = Acquisition(fp, self.participant, description.copy())
+                self.file_to_acq[fp].append(acquisition)
+
+    def links(self, files: list[Path]) -> list[list[int]]:
+        """Return, for each of `files`, the positions of the descriptions it
+        matches (reusing and recording cached verdicts if there's a cache)"""
+        if self.cache is None:
+            return self._evaluate(files, list(range(len(self.descriptions))))
+        return self._cached_links(self.cache, files)
+
+    def _cached_links(
+        self,
+        cache: MatchCache,
+        files: list[Path],
+    ) -> list[list[int]]:
+        """Reuse the cached verdicts of unchanged (file, description) pairs and
+        only evaluate the pairs whose file or description has changed."""
+        verdicts: list[dict[int, bool]] = []
+        # descriptions without criteria never match, so they're never evaluated
+        evaluable = [p for p, c in enumerate(self.criteria) if c is not None]
+        # the positions of the descriptions to evaluate -> the files' positions
+        pending: DefaultDict[tuple[int, ...], list[int]] = defaultdict(list)
+        for i, fp in enumerate(files):
+            cached: dict[int, bool] = {}
+            for position in evaluable:
+                verdict = cache.get(fp, cast(Criteria, self.criteria[position]))
+                if verdict is not None:
+                    cached[position] = verdict
+            verdicts.append(cached)
+            missing = tuple(p for p in evaluable if p not in cached)
+            pending[missing].append(i)
+
+        n_evaluated = 0
+        for positions, file_positions in pending.items():
+            if not positions:
                 continue
-            possible_link = cast(
-                "list[bool]",
-                pm.hook.is_link(  # type: ignore
-                    path=fp,
-                    criteria=criteria,
-                    config=self.config,
-                    options=self.options,
+            subset = [files[i] for i in file_positions]
+            links = self._evaluate(subset, list(positions))
+            for i, fp, linked in zip(file_positions, subset, links):
+                for position in positions:
+                    verdict = position in linked
+                    verdicts[i][position] = verdict
+                    cache.put(fp, cast(Criteria, self.criteria[position]), verdict)
+                n_evaluated += len(positions)
+
+        n_pairs = len(files) * len(self.descriptions)
+        self.logger.info(
+            f"Reused [{n_pairs - n_evaluated}] cached match results, "
+            f"evaluated [{n_evaluated}] (file, description) pairs",
+        )
+        return [[p for p, v in sorted(row.items()) if v] for row in verdicts]
+
+    def _evaluate(self, files: list[Path], positions: list[int]) -> list[list[int]]:
+        """Match the files against the descriptions at the given positions"""
+        if files is self.files and len(positions) == len(self.descriptions):
+            matcher = self
+        else:
+            matcher = Matcher(
+                files,
+                self.participant,
+                [self.descriptions[p] for p in positions],
+                self.config,
+                self.options,
+                self.logger,
+                self.sidecars,
+            )
+            matcher.memo = self.memo
+
+        jobs = self.options.get("jobs") or defaults.jobs
+        if jobs > 1 and len(files) > 1:
+            links = matcher._parallel_links(self._process_pool(jobs))
+        else:
+            links = matcher._links()
+
+        return [[positions[i] for i in row] for row in links]
+
+    def _links(self) -> list[list[int]]:
+        """Return, for each file, the positions of the descriptions it matches.
+
+        Plugins implementing the `is_link_batch` hook are asked about all the
+        (file, description) pairs in one call, plugins which only implement
+        `is_link` are asked about each remaining pair individually.
+        """
+        linked = [[False] * len(self.descriptions) for _ in self.files]
+
+        batch_results = cast(
+            "list[list[list[bool]]]",
+            pm.hook.is_link_batch(  # type: ignore
+                paths=self.files,
+                descriptions=self.descriptions,
+                compiled_criteria=self.criteria,
+                config=self.config,
+                options=self.options,
+                sidecars=self.sidecars,
+                memo=self.memo,
+            ),
+        )
+        for matrix in batch_results:
+            for row, links in zip(linked, matrix):
+                for position, link in enumerate(links):
+                    row[position] = row[position] or bool(link)
+
+        batch_plugins = [
+            impl.plugin
+            for impl in pm.hook.is_link_batch.get_hookimpls()  # type: ignore
+        ]
+        if batch_plugins:
+            is_link = pm.subset_hook_caller("is_link", remove_plugins=batch_plugins)
+        else:
+            is_link = pm.hook.is_link  # type: ignore
+
+        if is_link.get_hookimpls():
+            self._fill_links(linked, is_link)
+
+        return [[i for i, link in enumerate(row) if link] for row in linked]
+
+    def _fill_links(self, linked: list[list[bool]], is_link: Any):
+        """Ask the `is_link` hook about each pair which isn't linked yet"""
+        for fp, row in zip(self.files, linked):
+            for position, criteria in enumerate(self.criteria):
+                if criteria is None or row[position]:
+                    continue
+                possible_link = cast(
+                    "list[bool]",
+                    is_link(
+                        path=fp,
+                        criteria=criteria.criteria,
+                        compiled_criteria=criteria,
+                        config=self.config,
+                        options=self.options,
+                        sidecars=self.sidecars,
+                    ),
+                )
+                row[position] = any(possible_link)
+
+    def _process_pool(self, jobs: int) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_match_worker,
+                initargs=(
+                    self.options.get("match_memo_size") or defaults.match_memo_size,
                 ),
             )
-            if not any(possible_link):
-                continue
-            acquisition = Acquisition(fp, self.participant, description.copy())
-            self.file_to_acq[fp].append(acquisition)
+        return self._executor
+
+    def _parallel_links(self, executor: ProcessPoolExecutor) -> list[list[int]]:
+        """Split the files into contiguous chunks and match each chunk in one of
+        `executor`'s processes, the per-file results are returned in the
+        original (sorted) file order."""
+        jobs = self.options.get("jobs") or defaults.jobs
+        chunksize = max(1, math.ceil(len(self.files) / (jobs * 4)))
+        chunks = [
+            self.files[i : i + chunksize]  # noqa: E203
+            for i in range(0, len(self.files), chunksize)
+        ]
+        self.logger.info(
+            f"Matching [{len(self.files)}] files in [{len(chunks)}] chunks "
+            f"across [{jobs}] processes",
+        )
+        results = executor.map(
+            _match_chunk,
+            chunks,
+            itertools.repeat(self.participant),
+            itertools.repeat(self.descriptions),
+            itertools.repeat(self.config),
+            itertools.repeat({**self.options, "jobs": 1}),
+            itertools.repeat(self.sidecars.keys),
+        )
+        return list(itertools.chain.from_iterable(results))
+
+    def _compile_criteria(self, description: Description) -> Criteria | None:
+        if description.criteria is not None:
+            return description.criteria
+        criteria = description.data.get("criteria")
+        if criteria is None:
+            return None
+        return Criteria.from_config(criteria, self.config)
 
     def filter_unique_matches(self):
         """Keep only the matches (acquisitions/files) which match a single
@@ -332,6 +944,38 @@ class Matcher:
                 yield key, positions
 
 
+# the memo of a worker process, shared by every chunk it matches
+_worker_memo: MatchMemo | None = None
+
+
+def _init_match_worker(memo_size: int) -> None:
+    global _worker_memo
+    _worker_memo = MatchMemo(memo_size)
+
+
+def _match_chunk(
+    files: list[Path],
+    participant: Participant,
+    descriptions: list[Description],
+    config: dict[str, Any],
+    options: dict[str, Any],
+    sidecar_keys: frozenset[str] | None = None,
+) -> list[list[int]]:
+    """Worker process entry point for `Matcher._parallel_links()`"""
+    sidecars = SidecarCache(keys=sidecar_keys)
+    matcher = Matcher(
+        files,
+        participant,
+        descriptions,
+        config,
+        options,
+        sidecars=sidecars,
+    )
+    if _worker_memo is not None:
+        matcher.memo = _worker_memo
+    return matcher._links()
+
+
 class IntendedForResolver:
     """Object to handle resolving `IntendedFor` fields among a list of acquisitions
 
@@ -341,8 +985,14 @@ class IntendedForResolver:
         acquisitions for which `acq.description.intended_for is not None`
     """
 
-    def __init__(self, logger: logging.Logger | None = None):
+    def __init__(
+        self,
+        logger: logging.Logger | None = None,
+        index: StemIndex | None = None,
+    ):
         self.logger = logger or logging.getLogger(__name__)
+        # used (if given) to find acquisitions' NIfTI files
+        self.index = index
 
         # set in self.resolve()
         self.acquisitions: list[Acquisition]
@@ -421,7 +1071,7 @@ class IntendedForResolver:
             return
         if len(target_acqs) == 1:
             target_acq = target_acqs[0]
-            ext = associated_nii_ext(target_acq.src_file)
+            ext = associated_nii_ext(target_acq.src_file, self.index)
             if ext is None:
                 self._log_associated_nii_not_found(acq, target_acq)
                 return
@@ -430,7 +1080,7 @@ class IntendedForResolver:
         else:
             paths: list[Path] = []
             for target_acq in target_acqs:
-                ext = associated_nii_ext(target_acq.src_file)
+                ext = associated_nii_ext(target_acq.src_file, self.index)
                 if ext is None:
                     self._log_associated_nii_not_found(acq, target_acq)
                     return
@@ -621,6 +1271,7 @@ class Description:
         sidecar_changes: dict[str, Any] | None = None,
         intended_for: int | str | list[int | str] | None = None,
         data: dict[str, Any] | None = None,
+        criteria: Criteria | None = None,
     ):
         self.index = index
         self.data_type = data_type
@@ -630,6 +1281,7 @@ class Description:
         self.sidecar_changes = sidecar_changes or {}
         self.intended_for = intended_for
         self.data = data or {}
+        self.criteria = criteria
 
     def __eq__(self, o: Any):
         return isinstance(o, self.__class__) and hash(self) == hash(o)
@@ -638,8 +1290,14 @@ class Description:
         return hash((self.data_type, self.modality_label, self.custom_labels))
 
     @classmethod
-    def from_dict(cls, index: int, data: dict[str, Any]):
+    def from_dict(
+        cls,
+        index: int,
+        data: dict[str, Any],
+        config: dict[str, Any] | None = None,
+    ):
         _d = deepcopy(data)
+        criteria = _d.get("criteria")
         return cls(
             index=index,
             data_type=_d.pop("dataType"),
@@ -648,6 +1306,9 @@ class Description:
             sidecar_changes=_d.pop("sidecarChanges", None),
             intended_for=_d.pop("IntendedFor", None),
             data=_d,
+            criteria=None
+            if criteria is None
+            else Criteria.from_config(criteria, config),
         )
 
     def copy(self):
@@ -659,6 +1320,7 @@ class Description:
             sidecar_changes=deepcopy(self.sidecar_changes),
             intended_for=deepcopy(self.intended_for),
             data=deepcopy(self.data),
+            criteria=self.criteria,
         )
 
     # getter/setters
@@ -8,12 +8,28 @@ case_sensitive = True
 cli_log_level = "INFO"
 cli_out_dir = Path.cwd()
 cli_session = ""
+copy_engine = "python"
+copy_engine_choices = ["python", "rsync"]
+copy_jobs = 4
 comp_keys = ["SeriesNumber", "AcquisitionTime"]
 defaceTpl = None
+jobs = 1
 log_level = "WARNING"
+match_engine = "auto"
+match_memo_size = 65536
+match_engine_choices = ["auto", "python", "numpy"]
 out_dir = cli_out_dir
 search_method: TSeachMethod = "fnmatch"
 search_method_choices = ["fnmatch", "re"]
 session = cli_session
 run_tpl = "_run-{:d}"
 d2b_dir_name = "tmp_d2b"
+sidecar_cache_size = 4096
+stage_jobs = 1
+walk_threads = 1
+pipeline_batch_size = 256
+move_jobs = 1
+durability = "none"
+durability_choices = ["none", "batch", "strict"]
+stage_mode = "auto"
+stage_mode_choices = ["auto", "reflink", "copy", "none"]
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import errno
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from d2b import defaults
+
+
+class Durability:
+    """Make the files written to (or moved into) the BIDS directory durable
+
+    The `mode` determines when a file (its data, and its directory entry) is
+    flushed to stable storage with `fsync`:
+
+    - `"none"`: never, files are written in place and left to the OS
+    - `"batch"`: files are written to a temporary file which then replaces the
+      destination, and every written file and directory is flushed once, in a
+      single `Durability.commit()` at the end of the move stage
+    - `"strict"`: as with `"batch"`, but each file and its directory are
+      flushed as soon as the file is written
+
+    In `"batch"` and `"strict"` mode a file is never seen partially written,
+    even after a crash. `"batch"` only pays for one `fsync` per file and per
+    directory, which matters most on network filesystems.
+
+    Examples:
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as d:
+        ...     durability = Durability('batch')
+        ...     durability.write_text(Path(d) / 'a.json', '{}')
+        ...     pending = durability.pending
+        ...     durability.commit()
+        ...     (Path(d) / 'a.json').read_text(), pending, durability.pending
+        ('{}', 2, 0)
+    """
+
+    def __init__(self, mode: str = defaults.durability):
+        if mode not in defaults.durability_choices:
+            raise ValueError(
+                f"Invalid durability mode [{mode}], expected one of "
+                f"{defaults.durability_choices}",
+            )
+        self.mode = mode
+        # the permissions of a written file (as if it were created by open())
+        self._file_mode = 0o666 & ~_umask()
+        # the files and directories which are still to be flushed
+        self._files: set[Path] = set()
+        self._directories: set[Path] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """The number of files and directories still to be flushed"""
+        return len(self._files) + len(self._directories)
+
+    def write_text(self, path: Path, text: str) -> None:
+        if self.mode == "none":
+            path.write_text(text)
+            return
+        fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+                if self.mode == "strict":
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.chmod(tmp, self._file_mode)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            raise
+        self._written(path, data_flushed=self.mode == "strict")
+
+    def track(self, path: Path) -> None:
+        """Make `path` (a file moved or copied into place, or a new directory)
+        and its entry in its directory durable"""
+        if self.mode != "none":
+            self._written(path)
+
+    def track_directories(self, directories: list[Path], root: Path) -> None:
+        """Make newly created `directories`, and each of their parents below
+        `root`, durable"""
+        if self.mode == "none":
+            return
+        seen: set[Path] = set()
+        for directory in directories:
+            for d in [directory, *directory.parents]:
+                if d == root or d in seen or root not in d.parents:
+                    break
+                seen.add(d)
+                self.track(d)
+
+    def commit(self) -> None:
+        """Flush every file, then every directory, which is still pending"""
+        with self._lock:
+            files, self._files = self._files, set()
+            directories, self._directories = self._directories, set()
+        # a file's data before the directory entries which point to it (each
+        # path is flushed once, even if it's both a new and a parent directory)
+        for path in sorted(files - directories):
+            fsync(path)
+        for path in sorted(directories):
+            fsync(path)
+
+    def _written(self, path: Path, data_flushed: bool = False) -> None:
+        if self.mode == "strict":
+            if not data_flushed:
+                fsync(path)
+            fsync(path.parent)
+            return
+        with self._lock:
+            self._files.add(path)
+            self._directories.add(path.parent)
+
+
+def fsync(path: Path) -> None:
+    """Flush a file's (or a directory's) data and metadata to stable storage"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # some filesystems can't fsync directories
+        if e.errno not in {errno.EINVAL, errno.EBADF} or not os.path.isdir(path):
+            raise
+    finally:
+        os.close(fd)
+
+
+def _umask() -> int:
+    # the umask can only be read by setting it
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
@@ -11,8 +11,13 @@ from pluggy import HookspecMarker
 
 
 if TYPE_CHECKING:
+    from d2b.criteria import Criteria
+    from d2b.criteria import MatchMemo
     from d2b.d2b import D2B
     from d2b.d2b import Acquisition
+    from d2b.d2b import Description
+    from d2b.moving import MovePlan
+    from d2b.sidecars import SidecarCache
 
 
 hookspec = HookspecMarker("d2b")
@@ -46,13 +51,19 @@ def pre_run_logs(logger: logging.Logger, d2b: D2B) -> None:
 
 @hookspec
 def collect_files(
+    src_dirs: list[Path],
     out_dir: Path,
     d2b_dir: Path,
     config: dict[str, Any],
     options: dict[str, Any],
     d2b: D2B,
 ) -> list[Path]:
-    """Provide files to consider for description <-> file matching"""
+    """Provide files to consider for description <-> file matching
+
+    `src_dirs` are the directories to collect files from, the staged copies of
+    the input directories, or the input directories themselves if files are
+    matched in place (in which case they must not be modified).
+    """
     ...
 
 
@@ -72,10 +83,44 @@ def prepare_collected_files(
 def is_link(
     path: Path,
     criteria: dict[str, Any],
+    compiled_criteria: Criteria,
     config: dict[str, Any],
     options: dict[str, Any],
+    sidecars: SidecarCache,
 ) -> bool:
-    """Determine if the path matches the criteria"""
+    """Determine if the path matches the criteria
+
+    `compiled_criteria` holds the same criteria with every pattern already
+    compiled according to the config's searchMethod and caseSensitive settings.
+    `sidecars` is the run-scoped cache of parsed sidecar files, implementations
+    should prefer `sidecars.get(path)` over reading and parsing `path` themselves.
+    Only the keys which are sorted or matched on are decoded from the cached
+    sidecars, use `sidecars.get(path, complete=True)` to read every key.
+    """
+    ...
+
+
+@hookspec
+def is_link_batch(
+    paths: list[Path],
+    descriptions: list[Description],
+    compiled_criteria: list[Criteria | None],
+    config: dict[str, Any],
+    options: dict[str, Any],
+    sidecars: SidecarCache,
+    memo: MatchMemo,
+) -> list[list[bool]]:
+    """Determine which paths match which descriptions' criteria, all in one call
+
+    Return a matrix with one row per path and one column per description (the
+    compiled criteria of `descriptions[j]` is `compiled_criteria[j]`, `None` if
+    the description has no criteria). A pair is linked if any plugin links it.
+    `memo` holds the pattern verdicts of the distinct tag values seen so far,
+    it's shared by every call made while matching a run's files.
+
+    Plugins implementing this hook are not asked about individual pairs via the
+    `is_link` hook, which lets them amortize parsing and vectorize their checks.
+    """
     ...
 
 
@@ -90,6 +135,22 @@ def pre_move(
     but before any of the files/acquisitions have been moved"""
 
 
+@hookspec
+def prepare_move_plan(
+    plan: MovePlan,
+    acquisitions: list[Acquisition],
+    config: dict[str, Any],
+    options: dict[str, Any],
+    d2b: D2B,
+) -> None:
+    """Inspect or amend the move plan (every source -> destination pair), after
+    the pre-move hooks have run but before any of the files have been moved
+
+    Use `plan.add(acquisition, src_files)` to plan additional files, the core
+    `move` hook moves exactly the files planned for each acquisition.
+    """
+
+
 @hookspec
 def move(
     out_dir: Path,
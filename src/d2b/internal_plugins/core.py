@@ -2,13 +2,18 @@ from __future__ import annotations
 
 import json
 import os
+from functools import partial
 from pathlib import Path
 from typing import Any
 from typing import TYPE_CHECKING
 
+from d2b import columnar
 from d2b import defaults
+from d2b.criteria import Criteria
+from d2b.criteria import CriteriaIndex
+from d2b.criteria import MatchMemo
 from d2b.hookspecs import hookimpl
-from d2b.utils import compare
+from d2b.sidecars import LazySidecar
 from d2b.utils import filepath_sort_key
 from d2b.utils import first_nii
 from d2b.utils import splitext
@@ -16,6 +21,7 @@ from d2b.utils import splitext
 if TYPE_CHECKING:
     from d2b.d2b import D2B
     from d2b.d2b import Acquisition
+    from d2b.sidecars import SidecarCache
 
 
 @hookimpl
@@ -27,13 +33,14 @@ def load_config(path: Path):
 
 
 @hookimpl
-def collect_files(d2b_dir: Path) -> list[Path]:
-    return list(d2b_dir.rglob("*.json"))
+def collect_files(d2b: D2B) -> list[Path]:
+    # d2b.stem_index holds every file in the source directories
+    return d2b.stem_index.files(suffix=".json")
 
 
 @hookimpl(tryfirst=True)
-def prepare_collected_files(files: list[Path]) -> None:
-    files.sort(key=filepath_sort_key)
+def prepare_collected_files(files: list[Path], d2b: D2B) -> None:
+    files.sort(key=partial(filepath_sort_key, sidecars=d2b.sidecars))
 
 
 @hookimpl
@@ -41,49 +48,46 @@ def is_link(
     path: Path,
     criteria: dict[str, Any],
     config: dict[str, Any],
+    compiled_criteria: Criteria,
+    sidecars: SidecarCache,
 ):
     _, ext = splitext(path)
     if ext != ".json":
         # if it's not a sidecar file let someone else handle it
         return
 
-    data = json.loads(path.read_text())
-    search_method = config.get("searchMethod", defaults.search_method)
-    case_sensitive = config.get("caseSensitive", defaults.case_sensitive)
-
-    result: list[bool] = []
-    for tag, pattern in criteria.items():
-        tagValue = data.get(tag, "")
-
-        if tag == "filename" or tag == "SidecarFilename":
-            # check the file name of the sidecar
-            result.append(compare(path.name, pattern, search_method, case_sensitive))
-
-        elif tag == "filepath" or tag == "SidecarFilepath":
-            # check the _path_ of the file (this can included )
-            result.append(compare(str(path), pattern, search_method, case_sensitive))
-
-        elif isinstance(tagValue, list) and isinstance(pattern, list):
-            # check that there's a bijective mapping between the two lists
-            matching_length = len(tagValue) == len(pattern)
-            matching_contents = all(
-                [
-                    any(
-                        compare(tagItem, patternItem, search_method, case_sensitive)
-                        for tagItem in tagValue
-                    )
-                    for patternItem in pattern
-                ],
-            )
-            result.append(matching_length and matching_contents)
-
-        else:
-            # check the value
-            result.append(
-                compare(str(tagValue), pattern, search_method, case_sensitive),
-            )
-
-    return all(result)
+    # the sidecar is only read if the criteria refer to its contents
+    return compiled_criteria.matches(path, LazySidecar(path, sidecars))
+
+
+@hookimpl
+def is_link_batch(
+    paths: list[Path],
+    compiled_criteria: list[Criteria | None],
+    options: dict[str, Any],
+    sidecars: SidecarCache,
+    memo: MatchMemo,
+) -> list[list[bool]]:
+    # the memo lives as long as the matcher, so each distinct tag value is
+    # only compared against each pattern once, whichever batch it's in
+    engine = options.get("match_engine") or defaults.match_engine
+    if engine == "numpy" or (engine == "auto" and columnar.available()):
+        matrix = columnar.match_matrix(paths, compiled_criteria, sidecars, memo)
+        return matrix.tolist()
+
+    # rather than evaluating every (path, criteria) pair, the criteria are
+    # indexed by their literal values and each sidecar is only evaluated
+    # against the criteria it could possibly match
+    index = CriteriaIndex(compiled_criteria, memo)
+    matrix: list[list[bool]] = []
+    for path in paths:
+        row = [False] * len(compiled_criteria)
+        _, ext = splitext(path)
+        if ext == ".json":
+            for position in index.match(path, LazySidecar(path, sidecars)):
+                row[position] = True
+        matrix.append(row)
+    return matrix
 
 
 @hookimpl
@@ -106,43 +110,45 @@ def move(out_dir: Path, acquisition: Acquisition, d2b: D2B):
         # know how to handle "non-sidecar-based" acquisitions.
         return
 
-    src_parent = acquisition.src_root.parent
-    src_stem = acquisition.src_root.name
-    src_files = [fp for fp in src_parent.rglob(f"{src_stem}.*") if fp.is_file()]
-
-    if not first_nii(acquisition.src_file):
+    if not first_nii(acquisition.src_file, d2b.stem_index):
         # this json file does not have an associated .nii.gz
         filename = acquisition.src_file.name
         m = f"No associated nii found for acquisition derived from file [{filename}]"
         d2b.logger.warning(m)
 
-    dst_files: list[Path] = []
-    for src in src_files:
-        _, ext = splitext(src)
-        dst = out_dir / acquisition.dst_root.with_suffix(ext)
-        dst.parent.mkdir(exist_ok=True, parents=True)
-        d2b.logger.info(f"Moving [{src}] -> [{dst}]")
-
-        if ext != ".json":
-            # if it's not the sidecar, just copy it over
-            os.rename(src, dst)
-
-        else:
-            # load + apply sidecarChanges + (optionally) add IntendedFor
-            data = json.loads(src.read_text())
-            data = {
-                **data,
-                **acquisition.description.sidecar_changes,
-                "D2bVersion": __version__,
-            }
-            intended_for = acquisition.data.get("IntendedFor")
-            if intended_for is not None:
-                data["IntendedFor"] = intended_for
-            # write the file
-            dst.write_text(json.dumps(data, indent=2))
-            # remove src
+    # the destination directories were created along with the move plan, the
+    # moves made by an interrupted run (see `d2b run --resume`) are skipped
+    planned = d2b.move_plan.moves(acquisition)
+    moves = [move for move in planned if not move.done]
+    for src, dst in moves:
+        d2b.logger.info(f"{'Copying' if d2b.in_place else 'Moving'} [{src}] -> [{dst}]")
+
+    # if it's not the sidecar, just move it over (the input directories are
+    # never modified, so files matched in place are copied)
+    d2b.mover.move_all([(src, dst) for src, dst in moves if not _is_sidecar(src)])
+
+    for src, dst in moves:
+        if not _is_sidecar(src):
+            continue
+        # load + apply sidecarChanges + (optionally) add IntendedFor
+        data = d2b.sidecars.get(src, complete=True)
+        data = {
+            **data,
+            **acquisition.description.sidecar_changes,
+            "D2bVersion": __version__,
+        }
+        intended_for = acquisition.data.get("IntendedFor")
+        if intended_for is not None:
+            data["IntendedFor"] = intended_for
+        # write the file
+        d2b.durability.write_text(dst, json.dumps(data, indent=2))
+        # remove src
+        if not d2b.in_place:
             os.remove(src)
+        d2b.sidecars.discard(src)
+
+    return [dst for _, dst in planned]
 
-        dst_files.append(dst)
 
-    return dst_files
+def _is_sidecar(path: Path) -> bool:
+    return splitext(path)[1] == ".json"
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+
+class RunJournal:
+    """A write-ahead journal of the stages a run has completed
+
+    The outcome of each stage (the staged directories, the collected files,
+    the match results, the move plan, and each moved acquisition) is appended
+    to the journal as a single JSON line, which is flushed to disk before the
+    run carries on. If the run dies part way through, `d2b run --resume` picks
+    the journal back up and skips every stage it records as complete, e.g.
+    only the acquisitions which hadn't been moved yet are moved.
+
+    The journal starts with the run's identity (the d2b version, the input
+    directories, the participant and session, the stage mode, and a hash of
+    the config), a journal is only resumed by a run with the same identity.
+    E.g. a run which matched the files in place (`--stage-mode none`) isn't
+    resumed by one which would treat its input directories as staged copies.
+    A completed run removes its journal. If `persist` is `False` (e.g. a
+    `--plan-only` run) the records are only kept in memory, the journal on
+    disk is neither written nor removed.
+
+    Note:
+        An acquisition is journaled as moved as soon as its files have been
+        moved, so unless the run uses `--durability strict` its files might
+        not have reached the disk yet if the machine (rather than the run)
+        dies.
+
+    Examples:
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as d:
+        ...     path = Path(d) / 'run.jsonl'
+        ...     journal = RunJournal.start(path, {'participant': 'a'})
+        ...     journal.record('staged', src_dirs=['in'])
+        ...     journal.record('moved', acquisition=0)
+        ...     resumed = RunJournal.resume(path, {'participant': 'a'})
+        ...
+        >>> resumed.get('staged'), resumed.moved
+        ({'stage': 'staged', 'src_dirs': ['in']}, {0})
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        identity: dict[str, Any],
+        records: list[dict[str, Any]] | None = None,
+        persist: bool = True,
+    ):
+        self.path = Path(path)
+        self.identity = identity
+        self.records = records or []
+        self.persist = persist
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(
+        cls,
+        path: str | Path,
+        identity: dict[str, Any],
+        persist: bool = True,
+    ) -> RunJournal:
+        """Start a new journal (discarding any previous journal at `path`)"""
+        journal = cls(path, identity, persist=persist)
+        if persist:
+            journal.path.parent.mkdir(exist_ok=True, parents=True)
+            journal.path.write_text("")
+        journal.record("start", identity=identity)
+        return journal
+
+    @classmethod
+    def resume(
+        cls,
+        path: str | Path,
+        identity: dict[str, Any],
+        logger: logging.Logger | None = None,
+        persist: bool = True,
+    ) -> RunJournal | None:
+        """Load the journal at `path`, if it belongs to a run with `identity`"""
+        _logger = logger or logging.getLogger(__name__)
+        try:
+            lines = Path(path).read_text().splitlines()
+        except OSError:
+            return None
+        records: list[dict[str, Any]] = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # the run died while appending this (the last) record
+                break
+        recorded = records[0].get("identity", {}) if records else {}
+        keys = {*identity, *recorded}
+        differs = sorted(k for k in keys if recorded.get(k) != identity.get(k))
+        if not records or differs:
+            msg = f"Journal [{path}] belongs to a different run ({differs} differ)"
+            _logger.warning(f"{msg}, ignoring")
+            return None
+        return cls(path, identity, records, persist)
+
+    def record(self, stage: str, **data: Any) -> None:
+        """Append a record to the journal, and flush it to disk"""
+        line = json.dumps({"stage": stage, **data}, default=str)
+        with self._lock:
+            self.records.append(json.loads(line))
+            if not self.persist:
+                return
+            with open(self.path, "a") as f:
+                f.write(f"{line}\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def get(self, stage: str) -> dict[str, Any] | None:
+        """The (last) record of `stage`, if the stage was completed"""
+        for record in reversed(self.records):
+            if record["stage"] == stage:
+                return record
+        return None
+
+    @property
+    def moved(self) -> set[int]:
+        """The positions of the acquisitions which have been moved"""
+        return {r["acquisition"] for r in self.records if r["stage"] == "moved"}
+
+    def finish(self) -> None:
+        """Remove the journal, the run is complete"""
+        if self.persist:
+            self.path.unlink(missing_ok=True)
@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import errno
+import logging
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+from typing import DefaultDict
+from typing import Iterator
+from typing import NamedTuple
+from typing import TYPE_CHECKING
+
+from d2b import defaults
+from d2b.durability import Durability
+from d2b.sync import transfer_file
+from d2b.utils import splitext
+
+if TYPE_CHECKING:
+    from d2b.collect import StemIndex
+    from d2b.d2b import Acquisition
+
+
+class MoveError(RuntimeError):
+    """Raised if one or more acquisitions could not be moved
+
+    `errors` maps the source file of each acquisition which failed to move to
+    the exception raised while moving it.
+    """
+
+    def __init__(self, errors: dict[Path, BaseException]):
+        self.errors = errors
+        details = "; ".join(f"[{fp}]: {e}" for fp, e in errors.items())
+        super().__init__(f"Failed to move [{len(errors)}] acquisitions: {details}")
+
+
+class MovePlanError(ValueError):
+    """Raised if the move plan would write more than one file to a destination
+
+    `collisions` maps each such destination to the source files planned to be
+    written to it.
+    """
+
+    def __init__(self, collisions: dict[Path, list[Path]]):
+        self.collisions = collisions
+        details = "; ".join(
+            f"[{dst}] <- {[str(src) for src in srcs]}"
+            for dst, srcs in collisions.items()
+        )
+        super().__init__(
+            f"[{len(collisions)}] destinations would be written more than once: "
+            f"{details}",
+        )
+
+
+class PlannedMove(NamedTuple):
+    src: Path
+    dst: Path
+
+    @property
+    def done(self) -> bool:
+        """Whether the move was already made (e.g. by an interrupted run)"""
+        return not os.path.lexists(self.src) and os.path.lexists(self.dst)
+
+
+class MovePlan:
+    """Every (source, destination) pair of the move stage, computed up front
+
+    The plan is built (see `MovePlan.build()`) after the `pre_move` hooks have
+    run, from an index of the acquisitions' source directories taken once they
+    have (so it includes any files the hooks wrote), and handed to the
+    `prepare_move_plan` hooks, which may inspect or amend it, before anything
+    is moved. The core `move` hook then moves each acquisition's planned files.
+
+    Examples:
+        >>> from d2b.d2b import Acquisition, Description, Participant
+        >>> plan = MovePlan(Path('bids'))
+        >>> acq = Acquisition(
+        ...     Path('in/a.json'), Participant('a'), Description(0, 'anat', 'T1w'),
+        ... )
+        >>> plan.add(acq, [Path('in/a.json'), Path('in/a.nii.gz')])
+        >>> [str(dst) for _, dst in plan.moves(acq)]
+        ['bids/sub-a/anat/sub-a_T1w.json', 'bids/sub-a/anat/sub-a_T1w.nii.gz']
+        >>> plan.directories
+        [PosixPath('bids/sub-a/anat')]
+    """
+
+    def __init__(self, out_dir: Path):
+        self.out_dir = out_dir
+        # id(acquisition) -> (acquisition, its planned moves)
+        self._entries: dict[int, tuple[Acquisition, list[PlannedMove]]] = {}
+
+    def __iter__(self) -> Iterator[PlannedMove]:
+        for _, moves in self._entries.values():
+            yield from moves
+
+    def __len__(self) -> int:
+        return sum(len(moves) for _, moves in self._entries.values())
+
+    @classmethod
+    def build(
+        cls,
+        acquisitions: list[Acquisition],
+        out_dir: Path,
+        index: StemIndex,
+    ) -> MovePlan:
+        """Plan the moves of the acquisitions derived from sidecar files
+
+        An acquisition's files are the files in or below its source directory
+        which share its stem, as recorded in `index` (which has to be up to
+        date, see `StemIndex.refresh()`). A file is planned for the first
+        acquisition (in order) it belongs to, the same file can't be moved twice.
+        """
+        plan = cls(out_dir)
+        claimed: set[Path] = set()
+        for acquisition in acquisitions:
+            if acquisition.src_file.suffix != ".json":
+                # the core move hook only handles sidecar-based acquisitions
+                continue
+            src_files = index.siblings(acquisition.src_root, recursive=True)
+            plan.add(acquisition, [fp for fp in src_files if fp not in claimed])
+            claimed.update(src_files)
+        return plan
+
+    def add(self, acquisition: Acquisition, src_files: list[Path]) -> None:
+        """Plan to move `src_files` to `acquisition`'s destination"""
+        moves = [
+            PlannedMove(src, self.out_dir / acquisition.dst_root.with_suffix(ext))
+            for src in src_files
+            for ext in [splitext(src)[1]]
+        ]
+        _, planned = self._entries.setdefault(id(acquisition), (acquisition, []))
+        planned.extend(moves)
+
+    def moves(self, acquisition: Acquisition) -> list[PlannedMove]:
+        """The planned moves of `acquisition` (none if it isn't in the plan)"""
+        return list(self._entries.get(id(acquisition), (acquisition, []))[1])
+
+    @property
+    def acquisitions(self) -> list[Acquisition]:
+        return [acquisition for acquisition, _ in self._entries.values()]
+
+    @property
+    def directories(self) -> list[Path]:
+        """Every destination directory, parents before their children"""
+        return sorted({move.dst.parent for move in self})
+
+    def collisions(self) -> dict[Path, list[Path]]:
+        """The destinations which more than one source file is planned for"""
+        srcs: DefaultDict[Path, list[Path]] = defaultdict(list)
+        for src, dst in self:
+            srcs[dst].append(src)
+        return {dst: s for dst, s in srcs.items() if len(s) > 1}
+
+    def existing(self) -> list[Path]:
+        """The destinations which already exist (and would be overwritten)"""
+        return [dst for _, dst in self if os.path.lexists(dst)]
+
+    def make_directories(self) -> None:
+        """Create each destination directory (once)"""
+        for directory in self.directories:
+            directory.mkdir(exist_ok=True, parents=True)
+
+
+class Mover:
+    """Move files into the BIDS directory, copying them across filesystems
+
+    A file on the same filesystem (device) as the BIDS directory is renamed.
+    A file on another filesystem can't be renamed (`EXDEV`), so it's copied
+    (with `transfer_file()`, which streams the data with `copy_file_range` or
+    `sendfile`) and the source file is only removed once the copy is
+    complete. Whether a source directory is on another filesystem is
+    determined once, when it's first seen. If `keep_sources` is `True` (e.g.
+    the files are matched in place) every file is copied and no source file
+    is removed.
+
+    `Mover.move_all()` copies up to `jobs` files at once. Every moved file is
+    handed to `durability` (see `Durability`).
+    """
+
+    def __init__(
+        self,
+        out_dir: Path,
+        src_dirs: list[Path] | None = None,
+        jobs: int = defaults.copy_jobs,
+        keep_sources: bool = False,
+        logger: logging.Logger | None = None,
+        durability: Durability | None = None,
+    ):
+        self.out_dir = out_dir
+        self.jobs = jobs
+        self.keep_sources = keep_sources
+        self.durability = durability or Durability("none")
+        self.logger = logger or logging.getLogger(__name__)
+        self._out_dev = os.stat(out_dir).st_dev
+        # directory -> whether it's on another filesystem than out_dir
+        self._cross_device: dict[Path, bool] = {}
+        self._lock = threading.Lock()
+        for directory in src_dirs or []:
+            if not keep_sources and self._on_other_device(directory):
+                msg = f"[{directory}] is on another filesystem, files will be copied"
+                self.logger.info(msg)
+
+    def cross_device(self, src: Path) -> bool:
+        """Whether `src` is on another filesystem than the BIDS directory"""
+        return self._on_other_device(src.parent)
+
+    def _on_other_device(self, directory: Path) -> bool:
+        # every directory of a (staged) tree is almost always on one device,
+        # so the answer for the closest known ancestor is reused
+        for d in [directory, *directory.parents]:
+            if d in self._cross_device:
+                return self._cross_device[d]
+        try:
+            cross_device = os.stat(directory).st_dev != self._out_dev
+        except OSError:
+            return False
+        with self._lock:
+            self._cross_device[directory] = cross_device
+        return cross_device
+
+    def move(self, src: Path, dst: Path) -> None:
+        self._move(src, dst)
+        self.durability.track(dst)
+
+    def _move(self, src: Path, dst: Path) -> None:
+        if self.keep_sources:
+            transfer_file(src, dst)
+            return
+        if not self.cross_device(src):
+            try:
+                os.rename(src, dst)
+                return
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # e.g. a mount point below the source directory
+                with self._lock:
+                    self._cross_device[src.parent] = True
+        transfer_file(src, dst)
+        os.remove(src)
+
+    def move_all(self, pairs: list[tuple[Path, Path]]) -> None:
+        """Move each (src, dst) pair, copying up to `jobs` files at once"""
+        copies: list[tuple[Path, Path]] = []
+        for src, dst in pairs:
+            if self.keep_sources or self.cross_device(src):
+                copies.append((src, dst))
+            else:
+                self.move(src, dst)
+        if len(copies) <= 1 or self.jobs <= 1:
+            for src, dst in copies:
+                self.move(src, dst)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.jobs, len(copies))) as executor:
+            # consume the results so any error is raised
+            for _ in executor.map(lambda pair: self.move(*pair), copies):
+                pass
+
+
+def conflict_groups(acquisitions: list[Acquisition]) -> list[list[int]]:
+    """Group the acquisitions which can't be moved independently of each other
+
+    Two acquisitions conflict if they have the same destination, or if they
+    might share source files, i.e. their source roots have the same name and
+    one's directory contains the other's (an acquisition's files are the files
+    in or below its source directory which share its stem, see the core
+    `move` hook). Returns the positions of the acquisitions in each group, the
+    groups (and the positions in each group) are in their original order.
+
+    Examples:
+        >>> from d2b.d2b import Acquisition, Description, Participant
+        >>> def acq(src, modality):
+        ...     return Acquisition(
+        ...         Path(src), Participant('a'), Description(0, 'anat', modality),
+        ...     )
+        >>> conflict_groups([
+        ...     acq('in/a.json', 'T1w'),
+        ...     acq('in/b.json', 'T2w'),
+        ...     acq('in/sub/a.json', 'FLAIR'),  # shares files with in/a.json
+        ...     acq('in/c.json', 'T2w'),  # same destination as in/b.json
+        ...     acq('other/a.json', 'PD'),
+        ... ])
+        [[0, 2], [1, 3], [4]]
+    """
+    parent = list(range(len(acquisitions)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int) -> None:
+        parent[max(find(i), find(j))] = min(find(i), find(j))
+
+    by_dst: dict[Path, int] = {}
+    by_name: DefaultDict[str, list[int]] = defaultdict(list)
+    for i, acq in enumerate(acquisitions):
+        union(i, by_dst.setdefault(acq.dst_root, i))
+        by_name[acq.src_root.name].append(i)
+
+    for positions in by_name.values():
+        for n, i in enumerate(positions):
+            for j in positions[n + 1 :]:  # noqa: E203
+                a = acquisitions[i].src_root.parent
+                b = acquisitions[j].src_root.parent
+                if a == b or a in b.parents or b in a.parents:
+                    union(i, j)
+
+    groups: DefaultDict[int, list[int]] = defaultdict(list)
+    for i in range(len(acquisitions)):
+        groups[find(i)].append(i)
+    return list(groups.values())
+
+
+def move_concurrently(
+    acquisitions: list[Acquisition],
+    move: Callable[[Acquisition], None],
+    jobs: int = defaults.move_jobs,
+    logger: logging.Logger | None = None,
+) -> None:
+    """Call `move` for each acquisition, on up to `jobs` threads at once
+
+    Conflicting acquisitions (see `conflict_groups()`) are moved one after
+    the other, in their original order, by the same thread. Every acquisition
+    is attempted, if any of them fail a single `MoveError` is raised which
+    holds the error of each failed acquisition.
+    """
+    _logger = logger or logging.getLogger(__name__)
+    groups = conflict_groups(acquisitions)
+    errors: dict[Path, BaseException] = {}
+
+    def move_group(group: list[int]) -> dict[Path, BaseException]:
+        failed: dict[Path, BaseException] = {}
+        for i in group:
+            try:
+                move(acquisitions[i])
+            except Exception as e:
+                failed[acquisitions[i].src_file] = e
+        return failed
+
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(groups)))) as executor:
+        futures = [executor.submit(move_group, group) for group in groups]
+        for future in as_completed(futures):
+            for src_file, e in future.result().items():
+                _logger.error(f"Failed to move acquisition [{src_file}]: {e}")
+                errors[src_file] = e
+
+    if errors:
+        # in the acquisitions' order, rather than the order they failed in
+        order = {acq.src_file: i for i, acq in enumerate(acquisitions)}
+        raise MoveError(dict(sorted(errors.items(), key=lambda kv: order[kv[0]])))
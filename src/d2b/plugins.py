@@ -26,6 +26,7 @@ def get_plugins():
         [(('hooks',
            ['collect_files',
             'is_link',
+            'is_link_batch',
             'load_config',
             'move',
             'pre_move',
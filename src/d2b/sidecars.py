@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import json
+import re
+from json.decoder import scanstring
+from pathlib import Path
+from typing import Any
+from typing import Collection
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+
+from d2b import defaults
+from d2b.utils import LRUCache
+
+
+class SidecarCache:
+    """A run-scoped store of parsed sidecar files
+
+    Each sidecar is read and parsed at most once while it is held in the
+    cache, so the sort, match, and move stages can all share the same parsed
+    data. At most `maxsize` sidecars are held at once, the least recently used
+    entries are evicted first.
+
+    If `keys` is given then only those top-level keys are decoded from each
+    sidecar (see `project_sidecar()`), any other key is absent from the
+    returned dictionaries. Use `SidecarCache.get(path, complete=True)` to read
+    a sidecar in full.
+
+    The cache can be shared between threads (e.g. the threads of the move
+    stage), two threads which miss the same sidecar at once may both read it.
+
+    Note:
+        The dictionaries returned by `SidecarCache.get()` are shared between
+        all callers, they should be treated as read-only.
+
+    Examples:
+        >>> import tempfile
+        >>> from pathlib import Path
+        >>> with tempfile.TemporaryDirectory() as d:
+        ...     fp = Path(d) / 'a.json'
+        ...     _ = fp.write_text('{"SeriesNumber": 3}')
+        ...     sidecars = SidecarCache(maxsize=10)
+        ...     data = sidecars.get(fp)
+        ...     cached = sidecars.get(fp) is data
+        ...
+        >>> data, cached, len(sidecars)
+        ({'SeriesNumber': 3}, True, 1)
+    """
+
+    def __init__(
+        self,
+        maxsize: int = defaults.sidecar_cache_size,
+        keys: Iterable[str] | None = None,
+    ):
+        self.keys = frozenset(keys) if keys is not None else None
+        self._cache: LRUCache[Path, dict[str, Any]] = LRUCache(maxsize)
+
+    def __contains__(self, path: object) -> bool:
+        return Path(path) in self._cache  # type: ignore
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def maxsize(self) -> int:
+        return self._cache.maxsize
+
+    def get(self, path: str | Path, complete: bool = False) -> dict[str, Any]:
+        """Return the parsed contents of the sidecar at `path`
+
+        If `complete` is `True` every key of the sidecar is returned (and the
+        result is not cached), even if the cache only holds projected sidecars.
+        """
+        _path = Path(path)
+        if complete and self.keys is not None:
+            return read_sidecar(_path)
+        data = self._cache.get(_path)
+        if data is None:
+            data = read_sidecar(_path, self.keys)
+            self._cache.put(_path, data)
+        return data
+
+    def discard(self, path: str | Path) -> None:
+        """Forget the sidecar at `path`, e.g. after it has been moved or removed"""
+        self._cache.pop(Path(path))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+class LazySidecar(Mapping[str, Any]):
+    """A read-only view of a sidecar which is only read and parsed on first access
+
+    Criteria which only look at a sidecar's name or path never access the
+    view, so matching them requires no file I/O at all.
+
+    Examples:
+        >>> sidecar = LazySidecar('does/not/exist.json')
+        >>> sidecar.loaded
+        False
+    """
+
+    def __init__(self, path: str | Path, sidecars: SidecarCache | None = None):
+        self.path = Path(path)
+        self.sidecars = sidecars
+
+        self._data: dict[str, Any] | None = None
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    @property
+    def data(self) -> dict[str, Any]:
+        if self._data is None:
+            if self.sidecars is not None:
+                self._data = self.sidecars.get(self.path)
+            else:
+                self._data = json.loads(self.path.read_text())
+        return self._data
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# everything up to the next bracket which isn't inside a string (nothing
+# follows the repetition, so the match never backtracks into it)
+_CONTAINER_CONTENTS = re.compile(
+    r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*',
+    re.DOTALL,
+)
+_SCALAR = re.compile(r"[^\s,\]}]*")
+_DECODER = json.JSONDecoder()
+
+
+def read_sidecar(
+    path: str | Path,
+    keys: Collection[str] | None = None,
+) -> dict[str, Any]:
+    """Read a sidecar, only decoding the top-level `keys` if any are given"""
+    text = Path(path).read_text()
+    if keys is None:
+        return json.loads(text)
+    return project_sidecar(text, keys)
+
+
+def project_sidecar(text: str, keys: Collection[str]) -> dict[str, Any]:
+    """Decode only the values of the top-level `keys` of a JSON object
+
+    The values of every other key are skipped over without being decoded
+    (nor fully validated), which avoids materializing large embedded values
+    (e.g. vendor headers or slice timing arrays) that are never looked at.
+    As with `json.loads()` the last of any duplicated keys wins.
+
+    Examples:
+        >>> text = '{"a": 1, "b": {"c": [1, "]}"]}, "d": "x", "a": 2}'
+        >>> project_sidecar(text, {"a", "d", "e"})
+        {'a': 2, 'd': 'x'}
+    """
+    idx = _WHITESPACE.match(text, 0).end()  # type: ignore
+    if text[idx : idx + 1] != "{":  # noqa: E203
+        # not an object, nothing to project
+        return json.loads(text)
+
+    data: dict[str, Any] = {}
+    idx = _WHITESPACE.match(text, idx + 1).end()  # type: ignore
+    if text[idx : idx + 1] == "}":  # noqa: E203
+        return data
+
+    while True:
+        if text[idx : idx + 1] != '"':  # noqa: E203
+            msg = "Expecting property name enclosed in double quotes"
+            raise json.JSONDecodeError(msg, text, idx)
+        key, idx = scanstring(text, idx + 1)
+        idx = _WHITESPACE.match(text, idx).end()  # type: ignore
+        if text[idx : idx + 1] != ":":  # noqa: E203
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, idx)
+        idx = _WHITESPACE.match(text, idx + 1).end()  # type: ignore
+
+        if key in keys:
+            data[key], idx = _DECODER.raw_decode(text, idx)
+        else:
+            idx = _skip_value(text, idx)
+
+        idx = _WHITESPACE.match(text, idx).end()  # type: ignore
+        delimiter = text[idx : idx + 1]  # noqa: E203
+        if delimiter == "}":
+            return data
+        if delimiter != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, idx)
+        idx = _WHITESPACE.match(text, idx + 1).end()  # type: ignore
+
+
+def _skip_value(text: str, idx: int) -> int:
+    """Return the index just past the JSON value which starts at `idx`"""
+    char = text[idx : idx + 1]  # noqa: E203
+    if char == '"':
+        return scanstring(text, idx + 1)[1]
+
+    if char in ("{", "["):
+        depth, pos = 0, idx
+        while True:
+            if pos >= len(text):
+                raise json.JSONDecodeError("Unterminated container", text, idx)
+            depth += 1 if text[pos] in "[{" else -1
+            if depth == 0:
+                return pos + 1
+            pos = _CONTAINER_CONTENTS.match(text, pos + 1).end()  # type: ignore
+
+    end = _SCALAR.match(text, idx).end()  # type: ignore
+    if end == idx:
+        raise json.JSONDecodeError("Expecting value", text, idx)
+    return end
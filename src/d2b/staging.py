@@ -0,0 +1,416 @@
+from __future__ import annotations
+
+import errno
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+from typing import Dict
+from typing import List
+
+from d2b import defaults
+from d2b.archives import Archive
+from d2b.archives import is_archive
+from d2b.archives import sidecar_member
+from d2b.sync import copy_symlink
+from d2b.sync import remove
+from d2b.sync import remove_extraneous
+from d2b.sync import transfer_file
+from d2b.utils import rsync
+from d2b.utils import write_json_atomic
+
+
+# relative path -> [size, mtime_ns, inode]
+TSnapshot = Dict[str, List[int]]
+
+
+class StagingError(RuntimeError):
+    """Raised if one or more input directories could not be staged
+
+    `errors` maps each input directory which failed to stage to the exception
+    raised while staging it.
+    """
+
+    def __init__(self, errors: dict[Path, BaseException]):
+        self.errors = errors
+        details = "; ".join(f"[{d}]: {e}" for d, e in errors.items())
+        super().__init__(f"Failed to stage [{len(errors)}] directories: {details}")
+
+
+class StagedDirectory:
+    """The outcome of staging a single input directory"""
+
+    def __init__(
+        self,
+        src: Path,
+        dst: Path,
+        n_bytes: int,
+        seconds: float,
+        n_files: int = 0,
+        n_transferred: int = 0,
+    ):
+        self.src = src
+        self.dst = dst
+        self.n_bytes = n_bytes
+        self.seconds = seconds
+        self.n_files = n_files
+        self.n_transferred = n_transferred
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(src={self.src!r}, dst={self.dst!r})"
+
+    @property
+    def throughput(self) -> float:
+        """Bytes staged per second"""
+        return self.n_bytes / self.seconds if self.seconds > 0 else float("inf")
+
+
+class StagingManifest:
+    """The metadata of each file in a staging directory, as of when it was staged
+
+    For each staged file the size, modification time, and inode of both the
+    input file and the staged file are recorded. When the input directory is
+    staged again only the files whose input or staged metadata has changed
+    since (e.g. the staged file has since been moved into the BIDS directory)
+    are transferred, rather than comparing every file's contents.
+    """
+
+    def __init__(self, path: str | Path, entries: dict[str, dict[str, list]]):
+        self.path = Path(path)
+        self.entries = entries
+
+    @classmethod
+    def load(cls, path: str | Path) -> StagingManifest | None:
+        try:
+            data = json.loads(Path(path).read_text())
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != 1:
+            return None
+        return cls(path, data.get("entries", {}))
+
+    @classmethod
+    def record(cls, path: str | Path, src: TSnapshot, dst: TSnapshot):
+        entries = {
+            rel: {"src": meta, "dst": dst[rel]}
+            for rel, meta in src.items()
+            if rel in dst
+        }
+        return cls(path, entries)
+
+    def save(self) -> None:
+        write_json_atomic(self.path, {"version": 1, "entries": self.entries})
+
+    def stale(self, src: TSnapshot, dst: TSnapshot) -> list[str]:
+        """The files which need to be (re-)staged"""
+        return [
+            rel
+            for rel, meta in src.items()
+            if self.entries.get(rel) != {"src": meta, "dst": dst.get(rel)}
+        ]
+
+
+class Stager:
+    """Copy input directories into their staging directories, concurrently
+
+    Up to `jobs` directories are staged at once, and each directory is copied
+    with `rsync()` by the given copy `engine` (the in-process engine copies
+    up to `copy_jobs` files of each directory at once). Every directory is
+    attempted, if any of them fail a single `StagingError` is raised which
+    holds the error of each failed directory.
+
+    `mode` determines how files are staged when an input directory is on the
+    same filesystem (device) as its staging directory:
+
+    - `"auto"`: each file is reflinked (a copy-on-write clone), or hardlinked
+      if the filesystem doesn't support reflinks
+    - `"reflink"`: each file is reflinked, or copied if the filesystem doesn't
+      support reflinks
+    - `"copy"`: each file is copied
+
+    Input directories on other filesystems are always copied. If an input
+    "directory" is an archive only its sidecars are extracted (see `Archive`).
+
+    If a `manifest_dir` is given a `StagingManifest` is kept for each staging
+    directory, and re-staging a directory only transfers the files whose
+    metadata has changed since it was last staged. If `checksum` is `True`
+    then every file is instead compared by its contents (`rsync -c`).
+
+    Note:
+        A hardlinked file *is* the input file, writing to a staged file (or to
+        the BIDS file it's eventually moved to) in-place also changes the
+        input file. Use `"reflink"` or `"copy"` if that's a concern.
+    """
+
+    def __init__(
+        self,
+        jobs: int = defaults.stage_jobs,
+        logger: logging.Logger | None = None,
+        mode: str = defaults.stage_mode,
+        manifest_dir: str | Path | None = None,
+        checksum: bool = False,
+        engine: str = defaults.copy_engine,
+        copy_jobs: int = defaults.copy_jobs,
+    ):
+        # with "none" the files are matched in place, nothing is staged
+        modes = [m for m in defaults.stage_mode_choices if m != "none"]
+        if mode not in modes:
+            raise ValueError(f"Unknown staging mode [{mode}], expected one of {modes}")
+        self.jobs = max(1, jobs)
+        self.logger = logger or logging.getLogger(__name__)
+        self.mode = mode
+        self.manifest_dir = Path(manifest_dir) if manifest_dir is not None else None
+        self.checksum = checksum
+        self.engine = engine
+        self.copy_jobs = copy_jobs
+
+    def stage(self, directories: list[tuple[Path, Path]]) -> list[StagedDirectory]:
+        """Stage each (src, dst) pair, results are in the same order as the pairs"""
+        results: dict[int, StagedDirectory] = {}
+        errors: dict[Path, BaseException] = {}
+
+        jobs = min(self.jobs, len(directories)) or 1
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(self.stage_one, src, dst): (i, src)
+                for i, (src, dst) in enumerate(directories)
+            }
+            for future in as_completed(futures):
+                i, src = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    self.logger.error(f"Failed to copy folder [{src}]: {e}")
+                    errors[src] = e
+
+        if errors:
+            raise StagingError(errors)
+
+        return [results[i] for i in range(len(directories))]
+
+    def stage_one(self, src: Path, dst: Path) -> StagedDirectory:
+        dst.mkdir(exist_ok=True, parents=True)
+        if is_archive(src):
+            return self._stage_archive(src, dst)
+        start = time.perf_counter()
+        linking = self.mode != "copy" and os.stat(src).st_dev == os.stat(dst).st_dev
+
+        manifest = None
+        if self.manifest_dir is not None and not self.checksum:
+            manifest = StagingManifest.load(self._manifest_path(dst))
+        src_snapshot = snapshot(src)
+
+        if manifest is None:
+            verb = "Linking" if linking else "Copying"
+            msg = f"{verb} folder [{src}] to temporary location [{dst}]"
+            self.logger.info(msg)
+            if linking:
+                link_tree(src, dst, hardlink=self.mode == "auto")
+            else:
+                rsync(
+                    src,
+                    dst,
+                    delete=True,
+                    checksum=self.checksum,
+                    engine=self.engine,
+                    jobs=self.copy_jobs,
+                    progress=self._progress,
+                )
+            transferred = list(src_snapshot)
+        else:
+            msg = f"Updating temporary location [{dst}] of folder [{src}]"
+            self.logger.info(msg)
+            methods = _methods(hardlink=self.mode == "auto") if linking else None
+            transferred = self._update(src, dst, src_snapshot, manifest, methods)
+
+        if self.manifest_dir is not None:
+            dst_snapshot = snapshot(dst)
+            path = self._manifest_path(dst)
+            StagingManifest.record(path, src_snapshot, dst_snapshot).save()
+
+        staged = StagedDirectory(
+            src,
+            dst,
+            sum(src_snapshot[rel][0] for rel in transferred),
+            time.perf_counter() - start,
+            n_files=len(src_snapshot),
+            n_transferred=len(transferred),
+        )
+        self._log_staged(staged)
+        return staged
+
+    def _log_staged(self, staged: StagedDirectory) -> None:
+        mb = staged.n_bytes / 1e6
+        self.logger.info(
+            f"Staged folder [{staged.src}] ({staged.n_transferred} of "
+            f"{staged.n_files} files, {mb:.1f} MB) in {staged.seconds:.2f}s "
+            f"({staged.throughput / 1e6:.1f} MB/s)",
+        )
+
+    def _stage_archive(self, src: Path, dst: Path) -> StagedDirectory:
+        """Extract only an archive's sidecars, see `Archive`"""
+        msg = f"Extracting sidecars of archive [{src}] to temporary location [{dst}]"
+        self.logger.info(msg)
+        start = time.perf_counter()
+        remove_extraneous(dst, set())
+        extracted = Archive(src).extract(dst, sidecar_member)
+        staged = StagedDirectory(
+            src,
+            dst,
+            sum(fp.stat().st_size for fp in extracted),
+            time.perf_counter() - start,
+            n_files=len(extracted),
+            n_transferred=len(extracted),
+        )
+        self._log_staged(staged)
+        return staged
+
+    def _update(
+        self,
+        src: Path,
+        dst: Path,
+        src_snapshot: TSnapshot,
+        manifest: StagingManifest,
+        methods: list[Callable[[str, str], object]] | None,
+    ) -> list[str]:
+        """Only transfer the files which have changed since they were staged"""
+        dst_snapshot = snapshot(dst)
+        for rel in dst_snapshot.keys() - src_snapshot.keys():
+            remove(str(dst / rel))
+
+        stale = manifest.stale(src_snapshot, dst_snapshot)
+        for rel in stale:
+            s, d = src / rel, dst / rel
+            d.parent.mkdir(exist_ok=True, parents=True)
+            if os.path.lexists(d):
+                remove(str(d))
+            if s.is_symlink():
+                copy_symlink(str(s), str(d))
+            elif methods is not None:
+                _link_file(str(s), str(d), methods)
+            else:
+                transfer_file(s, d)
+        return stale
+
+    def _progress(self, path: Path, n_bytes: int) -> None:
+        self.logger.debug(f"Copied [{path}] ({n_bytes} bytes)")
+
+    def _manifest_path(self, dst: Path) -> Path:
+        assert self.manifest_dir is not None
+        return self.manifest_dir / f"{dst.name}.json"
+
+
+def snapshot(directory: str | Path) -> TSnapshot:
+    """The size, modification time, and inode of each file below `directory`"""
+    entries: TSnapshot = {}
+    for root, dirnames, filenames in os.walk(directory):
+        # symlinks to directories are listed (but not descended into) by walk
+        links = [n for n in dirnames if os.path.islink(os.path.join(root, n))]
+        for name in [*filenames, *links]:
+            path = os.path.join(root, name)
+            try:
+                st = os.lstat(path)
+            except FileNotFoundError:
+                continue
+            rel = os.path.relpath(path, directory)
+            entries[rel] = [st.st_size, st.st_mtime_ns, st.st_ino]
+    return entries
+
+
+# linux's FICLONE ioctl, _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
+
+
+def reflink(src: str | Path, dst: str | Path) -> None:
+    """Create `dst` as a copy-on-write clone of `src`
+
+    Raises an `OSError` if the platform or filesystem doesn't support reflinks.
+    """
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflinks are only supported on linux")
+
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def link_tree(src: str | Path, dst: str | Path, hardlink: bool = True) -> None:
+    """Mirror `src` into `dst` by reflinking (or hardlinking) each file
+
+    Files which can be neither reflinked nor hardlinked (e.g. if the
+    filesystem supports neither) are copied. As with `rsync(src, dst,
+    delete=True)` anything in `dst` which isn't in `src` is removed.
+    """
+    _src, _dst = Path(src), Path(dst)
+    methods = _methods(hardlink)
+
+    for root, dirnames, filenames in os.walk(_src):
+        rel = Path(root).relative_to(_src)
+        dst_root = _dst / rel
+        dst_root.mkdir(exist_ok=True)
+        remove_extraneous(dst_root, {*dirnames, *filenames})
+
+        # symlinks to directories are listed (but not descended into) by walk
+        for name in [n for n in dirnames if os.path.islink(os.path.join(root, n))]:
+            copy_symlink(os.path.join(root, name), str(dst_root / name))
+
+        for name in filenames:
+            s, d = os.path.join(root, name), os.path.join(dst_root, name)
+            if os.path.islink(s):
+                copy_symlink(s, d)
+                continue
+            if os.path.lexists(d):
+                if os.path.samefile(s, d):
+                    continue
+                remove(d)
+            _link_file(s, d, methods)
+
+
+def _methods(hardlink: bool) -> list[Callable[[str, str], object]]:
+    methods: list[Callable[[str, str], object]] = [reflink]
+    if hardlink:
+        methods.append(os.link)
+    methods.append(shutil.copy2)
+    return methods
+
+
+def _link_file(
+    src: str,
+    dst: str,
+    methods: list[Callable[[str, str], object]],
+) -> None:
+    # unsupported methods are dropped, so they aren't retried for every file,
+    # any other failure (e.g. EPERM, EMLINK) only falls back for this file
+    candidates = list(methods)
+    for i, method in enumerate(candidates):
+        try:
+            method(src, dst)
+            return
+        except OSError as e:
+            if i == len(candidates) - 1:
+                raise
+            if _unsupported(method, e) and method in methods:
+                methods.remove(method)
+
+
+# the errors with which the platform or filesystem reports that a way of
+# linking files isn't supported at all
+_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV}
+
+
+def _unsupported(method: Callable[[str, str], object], e: OSError) -> bool:
+    # FICLONE also fails with EINVAL if the filesystem can't clone files
+    return e.errno in _UNSUPPORTED or (method is reflink and e.errno == errno.EINVAL)
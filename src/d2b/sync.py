@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import errno
+import filecmp
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+from typing import Optional
+
+from d2b import defaults
+
+
+# called with the path of each transferred file (relative to the source
+# directory) and its size, possibly from several threads at once
+TProgress = Optional[Callable[[Path, int], None]]
+
+# the largest number of bytes handed to a single copy_file_range/sendfile call
+_CHUNK = 64 * 1024 * 1024
+# errors which mean a zero-copy syscall can't be used for a given pair of files
+_UNSUPPORTED = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSOCK,
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+}
+
+
+def sync_tree(
+    src: str | Path,
+    dst: str | Path,
+    delete: bool = False,
+    checksum: bool = False,
+    jobs: int = defaults.copy_jobs,
+    progress: TProgress = None,
+) -> Path:
+    """Make `dst` a copy of `src`, in the same manner as `rsync -a`
+
+    A file is only transferred if it's missing from `dst`, or if its size or
+    modification time differ (its contents if `checksum` is `True`). Files are
+    transferred by up to `jobs` threads at once, each file is written to a
+    temporary file which then replaces the destination file, and its
+    permissions and modification time are preserved. Symlinks are recreated
+    rather than followed.
+
+    Args:
+        src (str | Path): The source directory to synchronize.
+        dst (str | Path): The destination directory to synchronize to.
+        delete (bool): Whether to delete extraneous files from the
+            receiving side (`dst`) (default: False)
+        checksum (bool): Whether to compare files by their contents rather
+            than by their size and modification time (default: False)
+        jobs (int): The number of files to transfer at once.
+        progress (Callable | None): Called after each file is transferred.
+    """
+    _src, _dst = Path(src), Path(dst)
+    _dst.mkdir(exist_ok=True, parents=True)
+    pending, directories = _plan(_src, _dst, delete, checksum)
+
+    def transfer(item: tuple[Path, Path, os.stat_result]) -> None:
+        s, d, st = item
+        transfer_file(s, d)
+        if progress is not None:
+            progress(s.relative_to(_src), st.st_size)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        # consume the results so any error is raised
+        for _ in executor.map(transfer, pending):
+            pass
+
+    # directories' times are only final once their contents are
+    for s, d in reversed(directories):
+        shutil.copystat(s, d)
+
+    return _dst
+
+
+def _plan(
+    src: Path,
+    dst: Path,
+    delete: bool,
+    checksum: bool,
+) -> tuple[list[tuple[Path, Path, os.stat_result]], list[tuple[Path, Path]]]:
+    """Create `dst`'s directories and symlinks, and return the files to transfer
+    along with each pair of directories"""
+    pending: list[tuple[Path, Path, os.stat_result]] = []
+    directories: list[tuple[Path, Path]] = []
+    for root, dirnames, filenames in os.walk(src):
+        dst_root = dst / Path(root).relative_to(src)
+        if dst_root.is_symlink() or dst_root.is_file():
+            remove(str(dst_root))
+        dst_root.mkdir(exist_ok=True)
+        directories.append((Path(root), dst_root))
+        if delete:
+            remove_extraneous(dst_root, {*dirnames, *filenames})
+
+        for name in [*dirnames, *filenames]:
+            s, d = Path(root) / name, dst_root / name
+            if s.is_symlink():
+                if not d.is_symlink() or os.readlink(d) != os.readlink(s):
+                    copy_symlink(str(s), str(d))
+            elif name in filenames:
+                st = s.stat()
+                if _needs_transfer(s, st, d, checksum):
+                    pending.append((s, d, st))
+    return pending, directories
+
+
+def transfer_file(src: str | Path, dst: str | Path) -> None:
+    """Copy `src` (its contents, permissions, and times) over `dst`
+
+    The copy is written to a temporary file alongside `dst` which then replaces
+    `dst`, so `dst` is never seen partially written, and if `dst` was a
+    hardlink the other links to its data are left untouched.
+    """
+    _dst = Path(dst)
+    fd, tmp = tempfile.mkstemp(prefix=f".{_dst.name}.", dir=_dst.parent)
+    try:
+        with open(src, "rb") as fsrc, os.fdopen(fd, "wb") as fdst:
+            copy_fileobj(fsrc.fileno(), fdst.fileno())
+        shutil.copystat(src, tmp)
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def copy_fileobj(fsrc: int, fdst: int) -> int:
+    """Copy the rest of file descriptor `fsrc` to `fdst`, return the bytes copied
+
+    The copy is made within the kernel with `copy_file_range` (which can also
+    offload the copy to a network filesystem's server or clone the data on
+    copy-on-write filesystems) or `sendfile`, and falls back to reading and
+    writing if neither can be used.
+    """
+    size = os.fstat(fsrc).st_size
+    copied = 0
+    for syscall in (_copy_file_range, _sendfile):
+        if copied >= size:
+            break
+        try:
+            copied += syscall(fsrc, fdst, size - copied)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+        except AttributeError:
+            # the syscall isn't available on this platform
+            continue
+
+    # e.g. if the file grew, or the syscalls copied nothing
+    while True:
+        buf = os.read(fsrc, 1024 * 1024)
+        if not buf:
+            return copied
+        os.write(fdst, buf)
+        copied += len(buf)
+
+
+def _copy_file_range(fsrc: int, fdst: int, count: int) -> int:
+    copied = 0
+    while copied < count:
+        n = os.copy_file_range(fsrc, fdst, min(count - copied, _CHUNK))
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _sendfile(fsrc: int, fdst: int, count: int) -> int:
+    # sendfile doesn't advance fsrc's offset when one is given, so it's passed
+    # and then fsrc's offset is advanced by hand
+    offset = os.lseek(fsrc, 0, os.SEEK_CUR)
+    copied = 0
+    while copied < count:
+        n = os.sendfile(fdst, fsrc, offset + copied, min(count - copied, _CHUNK))
+        if n == 0:
+            break
+        copied += n
+    os.lseek(fsrc, offset + copied, os.SEEK_SET)
+    return copied
+
+
+def _needs_transfer(src: Path, st: os.stat_result, dst: Path, checksum: bool) -> bool:
+    try:
+        dst_st = dst.lstat()
+    except FileNotFoundError:
+        return True
+    if not dst.is_file() or dst.is_symlink() or st.st_size != dst_st.st_size:
+        return True
+    if checksum:
+        return not filecmp.cmp(src, dst, shallow=False)
+    return st.st_mtime_ns != dst_st.st_mtime_ns
+
+
+def copy_symlink(src: str, dst: str) -> None:
+    """(Re-)create `dst` as a symlink with the same target as `src`"""
+    if os.path.lexists(dst):
+        remove(dst)
+    os.symlink(os.readlink(src), dst)
+
+
+def remove_extraneous(directory: Path, keep: set[str]) -> None:
+    """Remove every entry of `directory` whose name isn't in `keep`"""
+    for entry in os.scandir(directory):
+        if entry.name not in keep:
+            remove(entry.path)
+
+
+def remove(path: str) -> None:
+    """Remove a file, symlink, or directory tree"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
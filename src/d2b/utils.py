@@ -2,15 +2,33 @@ from __future__ import annotations
 
 import hashlib
 import json
+import os
 import re
+import shutil
 import subprocess
 import sys
+import threading
+from collections import OrderedDict
 from fnmatch import fnmatch
 from io import BytesIO
 from pathlib import Path
+from typing import Any
 from typing import BinaryIO
+from typing import Generic
+from typing import TYPE_CHECKING
+from typing import TypeVar
 
 from d2b import defaults
+from d2b.sync import sync_tree
+from d2b.sync import TProgress
+
+if TYPE_CHECKING:
+    from d2b.collect import StemIndex
+    from d2b.sidecars import SidecarCache
+
+
+K = TypeVar("K")
+V = TypeVar("V")
 
 
 def splitext(
@@ -61,17 +79,38 @@ def prepend(value: str, char="_"):
     return value if value.startswith(char) else f"{char}{value}"
 
 
-def rsync(src: str | Path, dst: str | Path, delete: bool = False) -> Path:
-    """Thin wrapper around the 'rsync' command line tool.
+def rsync(
+    src: str | Path,
+    dst: str | Path,
+    delete: bool = False,
+    checksum: bool = False,
+    engine: str = defaults.copy_engine,
+    jobs: int = defaults.copy_jobs,
+    progress: TProgress = None,
+) -> Path:
+    """Synchronize a directory, like the 'rsync' command line tool.
 
     Args:
         src (str | Path): The source directory to synchronize.
         dst (str | Path): The destination directory to synchronize to.
         delete (bool): Whether to delete extraneous files from the
             receiving side (`dst`) (default: False)
+        checksum (bool): Whether to compare files by their contents rather
+            than by their size and modification time, this reads every file
+            on both sides (default: False)
+        engine (str): `"python"` to copy files in-process (see
+            `d2b.sync.sync_tree()`), or `"rsync"` to run the external 'rsync'
+            tool. The in-process engine is also used if 'rsync' isn't
+            installed (default: "python")
+        jobs (int): The number of files the in-process engine copies at once.
+        progress (Callable | None): Called by the in-process engine with the
+            (relative) path and size of each file after it's been copied.
     """
     _src, _dst = Path(src), Path(dst)
-    cmd = ("rsync", "-ac")
+    if engine == "python" or shutil.which("rsync") is None:
+        return sync_tree(_src, _dst, delete, checksum, jobs=jobs, progress=progress)
+
+    cmd: tuple[str, ...] = ("rsync", "-ac") if checksum else ("rsync", "-a")
     if delete:
         cmd += ("--delete",)
     cmd += (f"{_src}/", f"{_dst}/")
@@ -79,6 +118,14 @@ def rsync(src: str | Path, dst: str | Path, delete: bool = False) -> Path:
     return _dst
 
 
+def write_json_atomic(path: Path, data: Any) -> None:
+    """Write `data` to `path` as JSON, readers never see a partially written file"""
+    path.parent.mkdir(exist_ok=True, parents=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
 def compare(
     name: str,
     pattern: str,
@@ -108,23 +155,26 @@ def compare(
         return fnmatch(name.lower(), pattern.lower())
 
 
-def associated_nii_ext(fp: str | Path) -> str | None:
+def associated_nii_ext(fp: str | Path, index: StemIndex | None = None) -> str | None:
     """Returns .nii, .nii.gz, or None.
 
     The suffix returned matches the first file found which shares a
     file root (parent dir + stem) with `fp`. `None` is returned if no
     matching nii file is found.
     """
-    nii = first_nii(fp)
+    nii = first_nii(fp, index)
     if nii is None:
         return
     _, ext = splitext(nii)
     return ext
 
 
-def first_nii(fp: str | Path) -> Path | None:
+def first_nii(fp: str | Path, index: StemIndex | None = None) -> Path | None:
     """Returns the first .nii[.gz] file found which shares a stem with `fp`
 
+    If an `index` is given it's used to find the files, rather than the
+    filesystem.
+
     Examples:
         >>> import contextlib, tempfile
         >>> from pathlib import Path
@@ -162,7 +212,10 @@ def first_nii(fp: str | Path) -> Path | None:
         None
     """
     root, _ = splitext(fp)
-    niis = sorted(root.parent.glob(f"{root.stem}.nii*"))
+    if index is not None:
+        niis = index.children(root.parent, f"{root.stem}.nii")
+    else:
+        niis = sorted(root.parent.glob(f"{root.stem}.nii*"))
     return niis[0] if len(niis) else None
 
 
@@ -183,9 +236,72 @@ def md5_from_string(s: str) -> hashlib._Hash:
     return md5(b)
 
 
-def filepath_sort_key(fp: Path) -> tuple[int, str]:
+# the sidecar keys read by filepath_sort_key()
+SORT_KEYS = ("SeriesNumber",)
+
+
+def filepath_sort_key(
+    fp: Path,
+    sidecars: SidecarCache | None = None,
+) -> tuple[int, str]:
     if fp.suffix == ".json":
-        series_number = json.loads(fp.read_text()).get("SeriesNumber", sys.maxsize)
+        data: dict[str, Any] = (
+            sidecars.get(fp) if sidecars is not None else json.loads(fp.read_text())
+        )
+        series_number = data.get("SeriesNumber", sys.maxsize)
         return (int(series_number), str(fp))
     else:
         return (sys.maxsize, str(fp))
+
+
+class LRUCache(Generic[K, V]):
+    """A minimal, size-bounded mapping which evicts the least recently used entry
+
+    Examples:
+        >>> cache = LRUCache(2)
+        >>> cache.put('a', 1)
+        >>> cache.put('b', 2)
+        >>> cache.get('a')
+        1
+        >>> cache.put('c', 3)  # evicts 'b', the least recently used key
+        >>> 'b' in cache, len(cache)
+        (False, 2)
+
+    The cache is safe to use from several threads at once.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key: K, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import io
+import tarfile
+import zipfile
+from pathlib import Path
+from pathlib import PurePosixPath
+
+import pytest
+from d2b.archives import Archive
+from d2b.archives import is_archive
+from d2b.archives import sidecar_member
+from d2b.archives import stem_members
+
+
+MEMBERS = {
+    "a/b.json": b"{}",
+    "a/b.nii.gz": b"nii",
+    "a/bc.json": b"{}",
+    "a/sub/b.bval": b"bval",
+    "c.json": b"{}",
+}
+
+
+def _tar(path: Path, members: dict[str, bytes], mode: str = "w:gz") -> Path:
+    with tarfile.open(path, mode) as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = 1_600_000_000
+            tf.addfile(info, io.BytesIO(data))
+    return path
+
+
+def _zip(path: Path, members: dict[str, bytes]) -> Path:
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return path
+
+
+@pytest.fixture(params=["tar.gz", "zip"])
+def archive(request, tmpdir: str) -> Path:
+    path = Path(tmpdir) / f"session.{request.param}"
+    if request.param == "zip":
+        return _zip(path, MEMBERS)
+    return _tar(path, MEMBERS)
+
+
+def test_is_archive(archive: Path, tmpdir: str):
+    not_an_archive = Path(tmpdir) / "a.json"
+    not_an_archive.write_text("{}")
+
+    assert is_archive(archive)
+    assert not is_archive(not_an_archive)
+    assert not is_archive(Path(tmpdir))
+
+
+def test_extract_only_selected_members(archive: Path, tmpdir: str):
+    dst = Path(tmpdir) / "out"
+
+    extracted = Archive(archive).extract(dst, sidecar_member)
+
+    assert sorted(str(p.relative_to(dst)) for p in extracted) == [
+        "a/b.json",
+        "a/bc.json",
+        "c.json",
+    ]
+    assert sorted(str(p.relative_to(dst)) for p in dst.rglob("*.*")) == [
+        "a/b.json",
+        "a/bc.json",
+        "c.json",
+    ]
+
+
+def test_stem_members():
+    select = stem_members([PurePosixPath("a/b")])
+
+    assert [name for name in MEMBERS if select(name)] == [
+        "a/b.json",
+        "a/b.nii.gz",
+        "a/sub/b.bval",
+    ]
+
+
+@pytest.mark.parametrize("name", ["../evil.json", "/abs/evil.json"])
+def test_extract_refuses_members_outside_destination(tmpdir: str, name: str):
+    archive = _tar(Path(tmpdir) / "evil.tar", {name: b"{}"}, mode="w")
+
+    with pytest.raises(ValueError, match="Refusing"):
+        Archive(archive).extract(Path(tmpdir) / "out", sidecar_member)
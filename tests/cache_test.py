@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+from d2b.cache import MatchCache
+from d2b.d2b import Description
+from d2b.d2b import Matcher
+from d2b.d2b import Participant
+from pytest_mock import MockerFixture
+
+
+SIDECARS = {
+    "t1.json": {"SeriesDescription": "T1W_3D_TFE"},
+    "rest.json": {"SeriesDescription": "fMRI_rest"},
+    "tap.json": {"SeriesDescription": "fMRI_tap"},
+}
+CRITERIA = [
+    {"SeriesDescription": "T1W*"},
+    {"SeriesDescription": "fMRI*"},
+    {"filename": "tap.json"},
+]
+
+
+@pytest.fixture
+def files(tmpdir: str) -> list[Path]:
+    _files = []
+    for fn, data in SIDECARS.items():
+        fp = Path(tmpdir) / "src" / fn
+        fp.parent.mkdir(exist_ok=True, parents=True)
+        fp.write_text(json.dumps(data))
+        _files.append(fp)
+    return _files
+
+
+def _descriptions(criteria: list[dict]) -> list[Description]:
+    return [
+        Description.from_dict(
+            i,
+            {"dataType": "func", "modalityLabel": f"m{i}", "criteria": c},
+        )
+        for i, c in enumerate(criteria)
+    ]
+
+
+def _run(
+    files: list[Path],
+    descriptions: list[Description],
+    cache_file: Path,
+) -> dict[Path, list[int]]:
+    cache = MatchCache.load(cache_file)
+    matcher = Matcher(files, Participant("a"), descriptions, cache=cache)
+    matcher.find_matches()
+    cache.save()
+    return {
+        fp: [acq.description.index for acq in acqs]
+        for fp, acqs in matcher.file_to_acq.items()
+    }
+
+
+def _evaluated_pairs(spy) -> int:
+    return sum(len(call.args[1]) * len(call.args[2]) for call in spy.call_args_list)
+
+
+def test_rerun_reuses_cached_verdicts(
+    files: list[Path],
+    tmpdir: str,
+    mocker: MockerFixture,
+):
+    cache_file = Path(tmpdir) / "cache" / "matches.json"
+    descriptions = _descriptions(CRITERIA)
+
+    first = _run(files, descriptions, cache_file)
+    spy = mocker.spy(Matcher, "_evaluate")
+    second = _run(files, descriptions, cache_file)
+
+    assert first == second == {files[0]: [0], files[1]: [1], files[2]: [1, 2]}
+    assert _evaluated_pairs(spy) == 0
+
+
+def test_rerun_with_a_description_without_criteria_evaluates_nothing(
+    files: list[Path],
+    tmpdir: str,
+    mocker: MockerFixture,
+):
+    cache_file = Path(tmpdir) / "cache" / "matches.json"
+    without_criteria = {"dataType": "func", "modalityLabel": "other"}
+    descriptions = [
+        *_descriptions(CRITERIA),
+        Description.from_dict(len(CRITERIA), without_criteria),
+    ]
+
+    first = _run(files, descriptions, cache_file)
+    spy = mocker.spy(Matcher, "_evaluate")
+    second = _run(files, descriptions, cache_file)
+
+    assert first == second == {files[0]: [0], files[1]: [1], files[2]: [1, 2]}
+    assert _evaluated_pairs(spy) == 0
+
+
+def test_changed_file_is_reevaluated(
+    files: list[Path],
+    tmpdir: str,
+    mocker: MockerFixture,
+):
+    cache_file = Path(tmpdir) / "cache" / "matches.json"
+    descriptions = _descriptions(CRITERIA)
+
+    _run(files, descriptions, cache_file)
+    files[0].write_text(json.dumps({"SeriesDescription": "fMRI_other"}))
+    spy = mocker.spy(Matcher, "_evaluate")
+    matches = _run(files, descriptions, cache_file)
+
+    assert matches == {files[0]: [1], files[1]: [1], files[2]: [1, 2]}
+    # the filename-only description doesn't depend on the file's contents
+    assert _evaluated_pairs(spy) == 2
+
+
+def test_changed_description_is_reevaluated(
+    files: list[Path],
+    tmpdir: str,
+    mocker: MockerFixture,
+):
+    cache_file = Path(tmpdir) / "cache" / "matches.json"
+
+    _run(files, _descriptions(CRITERIA), cache_file)
+    spy = mocker.spy(Matcher, "_evaluate")
+    criteria = [*CRITERIA[:2], {"filename": "rest.json"}]
+    matches = _run(files, _descriptions(criteria), cache_file)
+
+    assert matches == {files[0]: [0], files[1]: [1, 2], files[2]: [1]}
+    assert _evaluated_pairs(spy) == len(files)
+
+
+def test_cache_is_discarded_when_identity_changes(
+    files: list[Path],
+    tmpdir: str,
+    mocker: MockerFixture,
+):
+    cache_file = Path(tmpdir) / "cache" / "matches.json"
+    descriptions = _descriptions(CRITERIA)
+
+    _run(files, descriptions, cache_file)
+    mocker.patch.object(MatchCache, "identity").return_value = {"d2b": "0.0.0"}
+    spy = mocker.spy(Matcher, "_evaluate")
+    _run(files, descriptions, cache_file)
+
+    assert _evaluated_pairs(spy) == len(files) * len(descriptions)
+
+
+def test_unreadable_cache_is_ignored(tmpdir: str):
+    cache_file = Path(tmpdir) / "matches.json"
+    cache_file.write_text("{not json")
+
+    cache = MatchCache.load(cache_file)
+
+    assert cache.get(cache_file, _descriptions(CRITERIA)[0].criteria) is None
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+from d2b import collect
+from d2b.collect import StemIndex
+from d2b.collect import walk
+from d2b.collect import WalkCache
+from d2b.utils import associated_nii_ext
+from d2b.utils import first_nii
+
+
+FILES = [
+    "a.json",
+    "a.nii.gz",
+    "a.bval",
+    "ab.json",
+    "ab.nii",
+    "sub/a.bvec",
+    "sub/deeper/a.txt",
+    "sub/b.json",
+    "b.json",
+    "c[1].json",
+    "c[1].nii",
+]
+
+
+@pytest.fixture
+def tree(tmpdir: str) -> Path:
+    root = Path(tmpdir) / "tree"
+    for fn in FILES:
+        fp = root / fn
+        fp.parent.mkdir(exist_ok=True, parents=True)
+        fp.write_text(fn)
+    (root / "empty").mkdir()
+    return root
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_files(tree: Path, threads: int):
+    index = StemIndex.build([tree], threads=threads)
+
+    assert sorted(index.files()) == sorted(tree / fn for fn in FILES)
+    assert sorted(index.files(".json")) == sorted(tree.rglob("*.json"))
+    assert len(index) == len(FILES)
+
+
+@pytest.mark.parametrize("stem", ["a", "ab", "b", "sub/b", "missing"])
+def test_recursive_siblings_agree_with_rglob(tree: Path, stem: str):
+    index = StemIndex.build([tree])
+    root = tree / stem
+
+    expected = sorted(root.parent.rglob(f"{root.name}.*"))
+
+    assert sorted(index.siblings(root, recursive=True)) == expected
+
+
+def test_siblings_are_not_glob_patterns(tree: Path):
+    index = StemIndex.build([tree])
+
+    assert index.siblings(tree / "c[1]") == [tree / "c[1].json", tree / "c[1].nii"]
+
+
+@pytest.mark.parametrize("fn", ["a.json", "ab.json", "b.json", "sub/b.json"])
+def test_first_nii_agrees_with_and_without_index(tree: Path, fn: str):
+    index = StemIndex.build([tree])
+
+    assert first_nii(tree / fn, index) == first_nii(tree / fn)
+    assert associated_nii_ext(tree / fn, index) == associated_nii_ext(tree / fn)
+
+
+def test_add_registers_new_directories(tree: Path):
+    index = StemIndex.build([tree])
+    new = tree / "new" / "dir" / "a.nii.gz"
+
+    index.add(new)
+
+    assert new in index
+    assert new in index.siblings(tree / "a", recursive=True)
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_refresh_indexes_new_files(tree: Path, tmpdir: str, threads: int):
+    index = StemIndex.build([tree])
+    (tree / "a.bvec").write_text("")
+    (tree / "sub" / "new").mkdir()
+    (tree / "sub" / "new" / "a.txt").write_text("")
+    (tree / "sub" / "deeper" / "a.txt").unlink()
+    outside = Path(tmpdir) / "outside"
+    outside.mkdir()
+    (outside / "x.json").write_text("")
+
+    index.refresh([tree / "sub", tree, outside], threads)
+
+    expected = sorted(tree.rglob("a.*"))
+    assert sorted(index.siblings(tree / "a", recursive=True)) == expected
+    assert sorted(index.files()) == sorted(
+        p for p in [*tree.rglob("*"), *outside.rglob("*")] if p.is_file()
+    )
+
+
+@pytest.mark.parametrize("threads", [1, 2, 8])
+def test_walk_lists_every_file(tree: Path, threads: int):
+    files = [
+        d / name for d, filenames, _ in walk([tree], threads) for name in filenames
+    ]
+
+    assert sorted(files) == sorted(tree / fn for fn in FILES)
+
+
+def test_walk_yields_parents_before_children(tree: Path):
+    seen: set[Path] = set()
+    for directory, _, _ in walk([tree], threads=4):
+        assert directory == tree or directory.parent in seen
+        seen.add(directory)
+
+    assert seen == {tree, *(p for p in tree.rglob("*") if p.is_dir())}
+
+
+def test_walk_bounds_listings_in_flight(tmpdir: str, monkeypatch):
+    root = Path(tmpdir) / "wide"
+    for i in range(40):
+        (root / f"{i}").mkdir(parents=True)
+    listed = []
+
+    def counting_list_directory(directory: Path):
+        listed.append(directory)
+        return list_directory(directory)
+
+    list_directory = collect.list_directory
+    monkeypatch.setattr(collect, "list_directory", counting_list_directory)
+    listings = walk([root], threads=2)
+    # the generator is suspended at the first listing, so only the root (and
+    # then at most 8 of its subdirectories) can have been submitted
+    next(listings)
+    next(listings)
+
+    assert len(listed) <= 1 + 2 * 4
+    assert len(list(listings)) == 39
+
+
+def _backdate(root: Path, seconds: int = 60) -> None:
+    """Move the directories' modification times safely into the past"""
+    for directory in [root, *(p for p in root.rglob("*") if p.is_dir())]:
+        st = directory.stat()
+        mtime_ns = st.st_mtime_ns - seconds * 1_000_000_000
+        os.utime(directory, ns=(st.st_atime_ns, mtime_ns))
+
+
+class TestWalkCache:
+    @pytest.fixture
+    def listed(self, monkeypatch) -> list[Path]:
+        _listed: list[Path] = []
+        list_directory = collect.list_directory
+
+        def counting_list_directory(directory: Path):
+            _listed.append(directory)
+            return list_directory(directory)
+
+        monkeypatch.setattr(collect, "list_directory", counting_list_directory)
+        return _listed
+
+    def _index(self, tree: Path, cache_file: Path) -> StemIndex:
+        cache = WalkCache.load(cache_file)
+        index = StemIndex.build([tree], cache=cache)
+        cache.save()
+        return index
+
+    def test_unchanged_directories_are_not_listed_again(
+        self,
+        tree: Path,
+        tmpdir: str,
+        listed: list[Path],
+    ):
+        _backdate(tree)
+        cache_file = Path(tmpdir) / "walk.json"
+        first = self._index(tree, cache_file)
+        n_dirs = len(listed)
+
+        second = self._index(tree, cache_file)
+
+        assert len(listed) == n_dirs
+        assert sorted(second.files()) == sorted(first.files())
+        assert second.siblings(tree / "a", recursive=True) == first.siblings(
+            tree / "a",
+            recursive=True,
+        )
+
+    def test_changed_directories_are_listed_again(
+        self,
+        tree: Path,
+        tmpdir: str,
+        listed: list[Path],
+    ):
+        _backdate(tree)
+        cache_file = Path(tmpdir) / "walk.json"
+        self._index(tree, cache_file)
+        (tree / "sub" / "b.json").unlink()
+        (tree / "sub" / "new").mkdir()
+        (tree / "sub" / "new" / "c.json").write_text("{}")
+        listed.clear()
+
+        index = self._index(tree, cache_file)
+
+        assert listed == [tree / "sub", tree / "sub" / "new"]
+        assert sorted(index.files(".json")) == sorted(tree.rglob("*.json"))
+
+    def test_racily_recent_listings_are_not_recorded(
+        self,
+        tree: Path,
+        tmpdir: str,
+        listed: list[Path],
+    ):
+        cache_file = Path(tmpdir) / "walk.json"
+        self._index(tree, cache_file)
+        n_dirs = len(listed)
+
+        self._index(tree, cache_file)
+
+        # the directories were modified just now, so they're listed again
+        assert len(listed) == 2 * n_dirs
+
+    def test_unreadable_cache_is_ignored(self, tree: Path, tmpdir: str):
+        cache_file = Path(tmpdir) / "walk.json"
+        cache_file.write_text("{not json")
+
+        index = self._index(tree, cache_file)
+
+        assert len(index) == len(FILES)
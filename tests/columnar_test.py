@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+from typing import Any
+
+import pytest
+from d2b.criteria import Criteria
+from d2b.criteria import CriteriaIndex
+from d2b.sidecars import SidecarCache
+
+np = pytest.importorskip("numpy")
+columnar = pytest.importorskip("d2b.columnar")
+
+
+SIDECARS: dict[str, dict[str, Any]] = {
+    "t1.json": {"SeriesDescription": "T1W_3D_TFE", "EchoNumber": 1},
+    "T1_2.json": {"SeriesDescription": "t1w_3d_tfe", "EchoNumber": 1},
+    "rest.json": {"SeriesDescription": "fMRI_rest", "ImageType": ["M", "ND"]},
+    "tap.json": {"SeriesDescription": "fMRI_tap", "ImageType": ["ND", "M"]},
+    "dwi.json": {"SeriesDescription": "DTI", "ImageType": "['M', 'ND']"},
+    "empty.json": {},
+}
+CRITERIA: list[dict[str, Any] | None] = [
+    {"SeriesDescription": "T1W_3D_TFE"},
+    {"SeriesDescription": "fMRI*"},
+    {"ImageType": ["ND", "M"]},
+    {"ImageType": "*ND*"},
+    {"filename": "t*.json", "EchoNumber": "1"},
+    {"filepath": "*/dwi.json"},
+    {"EchoNumber": ""},
+    {},
+    None,
+]
+
+
+@pytest.fixture
+def paths(tmpdir: str) -> list[Path]:
+    _paths = []
+    for fn, data in SIDECARS.items():
+        fp = Path(tmpdir) / fn
+        fp.write_text(json.dumps(data))
+        _paths.append(fp)
+    _paths.append(Path(tmpdir) / "t1.nii.gz")
+    return _paths
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {},
+        {"caseSensitive": False},
+        {"searchMethod": "re"},
+    ],
+)
+def test_match_matrix_agrees_with_criteria_index(paths: list[Path], config: dict):
+    criteria = [_compile(c, config) for c in CRITERIA]
+    sidecars = SidecarCache()
+
+    matrix = columnar.match_matrix(paths, criteria, sidecars)
+
+    index = CriteriaIndex(criteria)
+    expected = np.zeros((len(paths), len(criteria)), dtype=bool)
+    for row, fp in enumerate(paths):
+        if fp.suffix == ".json":
+            expected[row, index.match(fp, sidecars.get(fp))] = True
+
+    assert matrix.shape == (len(paths), len(criteria))
+    assert matrix.tolist() == expected.tolist()
+
+
+def _compile(criteria: dict[str, Any] | None, config: dict) -> Criteria | None:
+    try:
+        return None if criteria is None else Criteria.from_config(criteria, config)
+    except re.error:
+        # some of the glob patterns above are invalid regular expressions
+        return None
+
+
+def test_match_matrix_case_insensitive(paths: list[Path]):
+    criteria = [Criteria({"SeriesDescription": "T1W_3D_TFE"}, case_sensitive=False)]
+
+    matrix = columnar.match_matrix(paths, criteria, SidecarCache())
+
+    assert matrix[:, 0].tolist() == [True, True, False, False, False, False, False]
+
+
+def test_match_matrix_without_files():
+    matrix = columnar.match_matrix([], [Criteria({"a": "b"})], SidecarCache())
+    assert matrix.shape == (0, 1)
@@ -1,5 +1,8 @@
+from __future__ import annotations
+
 import shutil
 from pathlib import Path
+from typing import Callable
 
 import pytest
 
@@ -18,3 +21,31 @@ def scaffold_test_data(tmpdir: str) -> Path:
     dst = Path(tmpdir) / "scaffold_test"
     shutil.copytree(src, dst)
     return dst
+
+
+@pytest.fixture
+def populate() -> Callable[[Path, dict[str, str]], Path]:
+    """Write the given {relative path: text} files below a directory"""
+
+    def _populate(directory: Path, contents: dict[str, str]) -> Path:
+        for filename, text in contents.items():
+            fp = directory / filename
+            fp.parent.mkdir(exist_ok=True, parents=True)
+            fp.write_text(text)
+        return directory
+
+    return _populate
+
+
+@pytest.fixture
+def contents() -> Callable[[Path], dict[str, str]]:
+    """Read the {relative path: text} of every file below a directory"""
+
+    def _contents(directory: Path) -> dict[str, str]:
+        return {
+            str(fp.relative_to(directory)): fp.read_text()
+            for fp in directory.rglob("*")
+            if fp.is_file()
+        }
+
+    return _contents
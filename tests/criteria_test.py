@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import itertools
+import re
+from pathlib import Path
+from typing import Any
+
+import pytest
+from d2b.criteria import CompiledPattern
+from d2b.criteria import Criteria
+from d2b.criteria import MatchMemo
+from d2b.d2b import Description
+from d2b.sidecars import LazySidecar
+from d2b.utils import compare
+from pytest_mock import MockerFixture
+
+
+NAMES = ["Test", "TEST", "./parent/folder/Test", "a*b", "[1, 2]", ""]
+PATTERNS = ["*es*", "*ab*", "Test", "test", ".+es.+", ".*es.*", "a[*]b", "*"]
+
+
+@pytest.mark.parametrize(
+    ("name", "pattern", "search_method", "case_sensitive"),
+    [
+        (n, p, m, c)
+        for n, p, m, c in itertools.product(
+            NAMES,
+            PATTERNS,
+            ["fnmatch", "re"],
+            [True, False],
+        )
+        # NOTE: invalid regex
+        if not (m == "re" and p.startswith("*"))
+    ],
+)
+def test_compiled_pattern_agrees_with_compare(
+    name: str,
+    pattern: str,
+    search_method: str,
+    case_sensitive: bool,
+):
+    compiled = CompiledPattern(pattern, search_method, case_sensitive)
+    expected = compare(name, pattern, search_method, case_sensitive)
+    assert compiled.match(name) is expected
+
+
+def test_compiled_pattern_invalid_regex_raises_at_compile_time():
+    with pytest.raises(re.error):
+        CompiledPattern("*es*", "re")
+
+
+def test_compiled_pattern_equality():
+    assert CompiledPattern("a*") == CompiledPattern("a*")
+    assert CompiledPattern("a*") != CompiledPattern("a*", "re")
+    assert CompiledPattern("a*") != CompiledPattern("a*", case_sensitive=False)
+    assert len({CompiledPattern("a*"), CompiledPattern("a*")}) == 1
+
+
+@pytest.mark.parametrize(
+    ("criteria", "path", "data", "expected"),
+    [
+        # empty criteria match everything
+        ({}, "a/b.json", {}, True),
+        # file name and file path
+        ({"filename": "b.*"}, "a/b.json", {}, True),
+        ({"SidecarFilename": "a*"}, "a/b.json", {}, False),
+        ({"filepath": "a/*"}, "a/b.json", {}, True),
+        ({"SidecarFilepath": "*/c.json"}, "a/b.json", {}, False),
+        # plain values
+        ({"EchoNumber": "1"}, "b.json", {"EchoNumber": 1}, True),
+        ({"EchoNumber": "1"}, "b.json", {"EchoNumber": 2}, False),
+        ({"EchoNumber": "1"}, "b.json", {}, False),
+        ({"EchoNumber": ""}, "b.json", {}, True),
+        # lists
+        ({"ImageType": ["M", "ND"]}, "b.json", {"ImageType": ["ND", "M"]}, True),
+        ({"ImageType": ["M", "N*"]}, "b.json", {"ImageType": ["ND", "M"]}, True),
+        ({"ImageType": ["M"]}, "b.json", {"ImageType": ["ND", "M"]}, False),
+        ({"ImageType": ["M", "X"]}, "b.json", {"ImageType": ["ND", "M"]}, False),
+        ({"ImageType": "*ND*"}, "b.json", {"ImageType": ["ND", "M"]}, True),
+        # non-list values are compared against the string form of the list
+        ({"ImageType": ["M"]}, "b.json", {"ImageType": "M"}, True),
+        # multiple criteria must all match
+        ({"filename": "b*", "EchoNumber": "2"}, "b.json", {"EchoNumber": 1}, False),
+        ({"filename": "b*", "EchoNumber": "1"}, "b.json", {"EchoNumber": 1}, True),
+    ],
+)
+def test_criteria_matches(
+    criteria: dict[str, Any],
+    path: str,
+    data: dict[str, Any],
+    expected: bool,
+):
+    assert Criteria(criteria).matches(Path(path), data) is expected
+
+
+def test_criteria_from_config():
+    criteria = Criteria.from_config(
+        {"ProtocolName": "t1.*"},
+        {"searchMethod": "re", "caseSensitive": False},
+    )
+    assert criteria.search_method == "re"
+    assert criteria.case_sensitive is False
+    assert criteria.matches(Path("a.json"), {"ProtocolName": "t1_mprage"})
+
+
+def test_description_from_dict_compiles_criteria():
+    data = {"dataType": "anat", "modalityLabel": "T1w", "criteria": {"a": "B*"}}
+    config = {"caseSensitive": False}
+
+    description = Description.from_dict(0, data, config)
+
+    assert description.criteria is not None
+    assert description.criteria.criteria == {"a": "B*"}
+    assert description.criteria.matches(Path("a.json"), {"a": "bc"})
+    assert description.copy().criteria is description.criteria
+
+
+def test_description_from_dict_without_criteria():
+    data = {"dataType": "anat", "modalityLabel": "T1w"}
+    assert Description.from_dict(0, data).criteria is None
+
+
+def test_memoized_criteria_agree_with_unmemoized_criteria():
+    memo = MatchMemo()
+    criteria = [
+        Criteria({"Manufacturer": "Philips*", "ImageType": ["M", "ND"]}),
+        Criteria({"Manufacturer": "*siemens*", "EchoNumber": "1"}, "fnmatch", False),
+        Criteria({"ProtocolName": "^t1_.*"}, "re"),
+    ]
+    sidecars = [
+        {"Manufacturer": "Philips Medical", "ImageType": ["ND", "M"]},
+        {"Manufacturer": "SIEMENS", "EchoNumber": 1, "ProtocolName": "t1_mprage"},
+        {"Manufacturer": "SIEMENS", "EchoNumber": 2, "ProtocolName": "t2_tse"},
+        {"Manufacturer": "Philips Medical", "ImageType": ["M"]},
+    ]
+
+    for c, data in itertools.product(criteria, sidecars):
+        path = Path("a.json")
+        assert c.matches(path, data, memo) is c.matches(path, data)
+
+
+def test_match_memo_evaluates_each_distinct_value_once(mocker: MockerFixture):
+    memo = MatchMemo()
+    pattern = CompiledPattern("*MPRAGE*")
+    spy = mocker.spy(pattern, "match")
+
+    verdicts = [memo.match(pattern, v) for v in ["T1_MPRAGE", "T2", "T1_MPRAGE"]]
+
+    assert verdicts == [True, False, True]
+    assert spy.call_count == 2
+    assert (memo.hits, memo.misses) == (1, 2)
+
+
+def test_match_memo_is_bounded():
+    memo = MatchMemo(maxsize=2)
+    pattern = CompiledPattern("*")
+
+    for value in range(10):
+        memo.match(pattern, value)
+
+    assert len(memo) == 2
+
+
+def test_path_values_are_not_memoized():
+    memo = MatchMemo()
+    criteria = Criteria({"filename": "*T1w*", "EchoNumber": "1"})
+
+    assert criteria.matches(Path("a/sub-01_T1w.json"), {"EchoNumber": 1}, memo)
+    assert len(memo) == 1
+
+
+def test_path_only_criteria_do_not_read_the_sidecar():
+    criteria = Criteria({"filename": "*T1w*", "filepath": "*/anat/*"})
+    sidecar = LazySidecar("does/not/exist/anat/sub-01_T1w.json")
+
+    assert criteria.matches(sidecar.path, sidecar)
+    assert not sidecar.loaded
+
+
+def test_sidecar_is_only_read_if_path_criteria_match(tmpdir: str):
+    fp = Path(tmpdir) / "sub-01_bold.json"
+    fp.write_text('{"SeriesDescription": "T1w"}')
+    criteria = Criteria({"SeriesDescription": "T1w", "filename": "*T1w*"})
+
+    sidecar = LazySidecar(fp)
+    assert not criteria.matches(fp, sidecar)
+    assert not sidecar.loaded
+
+    criteria = Criteria({"SeriesDescription": "T1w", "filename": "*bold*"})
+    assert criteria.matches(fp, sidecar)
+    assert sidecar.loaded
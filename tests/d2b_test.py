@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import concurrent.futures
 import filecmp
 import json
 import logging
+import os
+import shutil
 from pathlib import Path
+from typing import Any
 
 import pytest
+from d2b import defaults
+from d2b.criteria import Criteria
 from d2b.d2b import __version__
 from d2b.d2b import Acquisition
 from d2b.d2b import D2B
@@ -14,6 +20,10 @@ from d2b.d2b import FilenameEntities
 from d2b.d2b import IntendedForResolver
 from d2b.d2b import Matcher
 from d2b.d2b import Participant
+from d2b.hookspecs import hookimpl
+from d2b.moving import MovePlan
+from d2b.plugins import pm
+from d2b.sidecars import SidecarCache
 from pytest import LogCaptureFixture
 from pytest_mock import MockerFixture
 
@@ -701,6 +711,216 @@ class TestMatcher:
             for acq in acquisitions:
                 assert "run" not in str(acq.dst_root)
 
+    def test_numpy_engine_without_numpy(self, mocker: MockerFixture):
+        mocker.patch("d2b.columnar.available", return_value=False)
+        options = {"match_engine": "numpy"}
+
+        with pytest.raises(ImportError, match="--match-engine auto"):
+            Matcher([], Participant("a"), [], options=options)
+        with pytest.raises(ImportError, match="--match-engine auto"):
+            D2B([], "out", "config.json", "a", options=options)
+
+    @pytest.mark.parametrize("match_engine", ["auto", "python"])
+    def test_batch_matching_agrees_with_is_link_hook(
+        self,
+        tmpdir: str,
+        match_engine: str,
+        mocker: MockerFixture,
+    ):
+        files, descriptions, config = _matcher_test_data(Path(tmpdir))
+        options = {"match_engine": match_engine}
+
+        batched = _matches(
+            Matcher(files, Participant("a"), descriptions, config, options),
+        )
+        # the hook is handed the compiled criteria, it doesn't recompile them
+        from_config = mocker.spy(Criteria, "from_config")
+        sidecars = SidecarCache()
+        pairwise = {
+            fp: [
+                d.index
+                for d in descriptions
+                if any(
+                    pm.hook.is_link(  # type: ignore
+                        path=fp,
+                        criteria=d.data["criteria"],
+                        compiled_criteria=d.criteria,
+                        config=config,
+                        options=options,
+                        sidecars=sidecars,
+                    ),
+                )
+            ]
+            for fp in files
+        }
+
+        assert batched == pairwise
+        assert not from_config.called
+        assert batched == {
+            files[0]: [0, 4],
+            files[1]: [1, 4],
+            files[2]: [1, 2],
+            files[3]: [3],
+            files[4]: [],
+        }
+
+    @pytest.mark.parametrize("match_engine", ["auto", "python"])
+    def test_memo_is_shared_across_batches(self, tmpdir: str, match_engine: str):
+        files, descriptions, config = _matcher_test_data(Path(tmpdir))
+        options = {"match_engine": match_engine}
+        matcher = Matcher(files, Participant("a"), descriptions, config, options)
+
+        first = matcher.links(files[:2])
+        misses = matcher.memo.misses
+        second = matcher.links(files[:2])
+
+        assert first == second
+        assert misses > 0
+        assert matcher.memo.misses == misses
+
+    def test_plugins_without_is_link_batch_are_asked_about_each_pair(
+        self,
+        tmpdir: str,
+    ):
+        files, descriptions, config = _matcher_test_data(Path(tmpdir))
+        calls: list[tuple[Path, int]] = []
+
+        class PairwisePlugin:
+            @hookimpl
+            def is_link(self, path: Path, compiled_criteria: Criteria):
+                position = [d.criteria for d in descriptions].index(
+                    compiled_criteria,
+                )
+                calls.append((path, position))
+                # link the nifti file to the last description
+                return path.name == "t1.nii.gz" and position == 4
+
+        class BatchPlugin:
+            @hookimpl
+            def is_link_batch(self, paths: list[Path]):
+                # link every file to the dwi description
+                return [[False, False, False, True, False] for _ in paths]
+
+        plugins = [PairwisePlugin(), BatchPlugin()]
+        for plugin in plugins:
+            pm.register(plugin)
+        try:
+            matches = _matches(
+                Matcher(files, Participant("a"), descriptions, config),
+            )
+        finally:
+            for plugin in plugins:
+                pm.unregister(plugin)
+
+        assert matches == {
+            files[0]: [0, 3, 4],
+            files[1]: [1, 3, 4],
+            files[2]: [1, 2, 3],
+            files[3]: [3],
+            files[4]: [3, 4],
+        }
+        # the pairwise plugin is only asked about pairs which aren't linked yet
+        assert len(calls) == len(set(calls))
+        assert (files[3], 3) not in calls
+        assert (files[4], 4) in calls
+
+    @pytest.mark.parametrize("jobs", [2, 3, 16])
+    def test_parallel_matching_agrees_with_serial_matching(
+        self,
+        tmpdir: str,
+        jobs: int,
+    ):
+        files, descriptions, config = _matcher_test_data(Path(tmpdir))
+        options = {"jobs": jobs}
+
+        serial = _matches(Matcher(files, Participant("a"), descriptions, config))
+        parallel = _matches(
+            Matcher(files, Participant("a"), descriptions, config, options),
+        )
+
+        assert list(parallel.items()) == list(serial.items())
+
+    def test_batches_share_one_process_pool(
+        self,
+        tmpdir: str,
+        mocker: MockerFixture,
+    ):
+        files, descriptions, config = _matcher_test_data(Path(tmpdir))
+        expected = _matches(Matcher(files, Participant("a"), descriptions, config))
+        pool = mocker.patch(
+            "d2b.d2b.ProcessPoolExecutor",
+            wraps=concurrent.futures.ProcessPoolExecutor,
+        )
+        options = {"jobs": 2}
+
+        with Matcher([], Participant("a"), descriptions, config, options) as matcher:
+            links = [*matcher.links(files[:2]), *matcher.links(files[2:])]
+
+        assert pool.call_count == 1
+        assert dict(zip(files, links)) == expected
+
+    def test_known_links_are_not_evaluated_again(
+        self,
+        tmpdir: str,
+        mocker: MockerFixture,
+    ):
+        files, descriptions, config = _matcher_test_data(Path(tmpdir))
+        expected = _matches(Matcher(files, Participant("a"), descriptions, config))
+        matcher = Matcher(files, Participant("a"), descriptions, config)
+        links = mocker.spy(matcher, "links")
+        known = {fp: expected[fp] for fp in files[:3]}
+
+        matcher.find_matches(known)
+
+        links.assert_called_once_with(files[3:])
+        assert _matches_of(matcher) == expected
+
+
+def _matcher_test_data(
+    tmpdir: Path,
+) -> tuple[list[Path], list[Description], dict[str, bool]]:
+    sidecars = {
+        "t1.json": {"SeriesDescription": "T1W_3D_TFE", "EchoNumber": 1},
+        "rest.json": {"SeriesDescription": "fMRI_rest", "EchoNumber": 1},
+        "tap.json": {"SeriesDescription": "fMRI_tap", "ImageType": ["M", "ND"]},
+        "dwi.json": {"SeriesDescription": "DTI"},
+    }
+    files: list[Path] = []
+    for fn, data in sidecars.items():
+        fp = tmpdir / fn
+        fp.write_text(json.dumps(data))
+        files.append(fp)
+    files.append(tmpdir / "t1.nii.gz")
+    criteria = [
+        {"SeriesDescription": "T1W_3D_TFE"},
+        {"SeriesDescription": "fMRI*"},
+        {"SeriesDescription": "fmri_tap", "ImageType": ["ND", "M"]},
+        {"SeriesDescription": "DTI", "filename": "dwi.json"},
+        {"EchoNumber": "1"},
+    ]
+    config = {"caseSensitive": False}
+    descriptions = [
+        Description.from_dict(
+            i,
+            {"dataType": "anat", "modalityLabel": f"m{i}", "criteria": c},
+            config,
+        )
+        for i, c in enumerate(criteria)
+    ]
+    return files, descriptions, config
+
+
+def _matches(matcher: Matcher) -> dict[Path, list[int]]:
+    matcher.find_matches()
+    return _matches_of(matcher)
+
+
+def _matches_of(matcher: Matcher) -> dict[Path, list[int]]:
+    return {
+        fp: [acq.description.index for acq in acqs]
+        for fp, acqs in matcher.file_to_acq.items()
+    }
+
 
 class TestD2b:
     def test_init(self, tmpdir: str):
@@ -734,14 +954,16 @@ class TestD2b:
         out_dir: Path,
         sidecar_files: list[str],
         other_files: list[str],
+        options: dict[str, Any] | None = None,
+        in_dirs: list[Path] | None = None,
     ):
         """generic checks for all test_run_* methods"""
         config_file = data_dir / "d2b-config.json"
-        in_dirs = [data_dir / "in"]
+        in_dirs = in_dirs or [data_dir / "in"]
 
         expected_out_dir = data_dir / "out"
 
-        d2b = D2B(in_dirs, out_dir, config_file, "a", "1")
+        d2b = D2B(in_dirs, out_dir, config_file, "a", "1", options)
         d2b.load_config()
         d2b.run()
 
@@ -822,6 +1044,457 @@ class TestD2b:
 
         self._check_run_results(data_dir, out_dir, sidecar_files, other_files)
 
+    def test_run_intended_for_target_has_run_with_parallel_matching(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+    ):
+        # test-specific
+        data_dir = d2b_run_e2e / "intended-for-target-has-run"
+        sidecar_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_run-1_bold.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_run-2_bold.json",
+        ]
+        other_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_run-1_bold.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_run-2_bold.nii.gz",
+        ]
+        out_dir = Path(tmpdir) / "bids"
+        options = {"jobs": 2}
+
+        self._check_run_results(data_dir, out_dir, sidecar_files, other_files, options)
+
+    def test_run_in_place_leaves_input_untouched(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+    ):
+        # test-specific
+        data_dir = d2b_run_e2e / "intended-for-fields"
+        sidecar_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.json",
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-PA_fmap.json",
+            "sub-a/ses-1/fmap/sub-a_ses-1_fmap.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_bold.json",
+            "sub-a/ses-1/anat/sub-a_ses-1_T1w.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-fingertap_bold.json",
+        ]
+        other_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.nii.gz",
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-PA_fmap.nii.gz",
+            "sub-a/ses-1/fmap/sub-a_ses-1_fmap.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_bold.nii.gz",
+            "sub-a/ses-1/anat/sub-a_ses-1_T1w.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-fingertap_bold.nii.gz",
+        ]
+        out_dir = Path(tmpdir) / "bids"
+        options = {"stage_mode": "none"}
+        in_dir = data_dir / "in"
+        before = {fp: fp.read_bytes() for fp in in_dir.rglob("*") if fp.is_file()}
+
+        self._check_run_results(data_dir, out_dir, sidecar_files, other_files, options)
+
+        after = {fp: fp.read_bytes() for fp in in_dir.rglob("*") if fp.is_file()}
+        assert after == before
+        assert not (out_dir / defaults.d2b_dir_name / "src").exists()
+
+    @pytest.mark.parametrize("fmt", ["gztar", "zip"])
+    @pytest.mark.parametrize("stage_mode", ["auto", "none"])
+    def test_run_from_archive(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+        fmt: str,
+        stage_mode: str,
+    ):
+        # test-specific
+        data_dir = d2b_run_e2e / "extra-files"
+        sidecar_files = [
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.json",
+        ]
+        other_files = [
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.bval",
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.bvec",
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.nii.gz",
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.txt",
+        ]
+        out_dir = Path(tmpdir) / "bids"
+        archive = shutil.make_archive(
+            str(Path(tmpdir) / "session"),
+            fmt,
+            root_dir=data_dir / "in",
+        )
+        options = {"stage_mode": stage_mode}
+
+        self._check_run_results(
+            data_dir,
+            out_dir,
+            sidecar_files,
+            other_files,
+            options,
+            in_dirs=[Path(archive)],
+        )
+
+    def test_run_intended_for_fields_with_parallel_moves(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+    ):
+        # test-specific
+        data_dir = d2b_run_e2e / "intended-for-fields"
+        sidecar_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.json",
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-PA_fmap.json",
+            "sub-a/ses-1/fmap/sub-a_ses-1_fmap.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_bold.json",
+            "sub-a/ses-1/anat/sub-a_ses-1_T1w.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-fingertap_bold.json",
+        ]
+        other_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.nii.gz",
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-PA_fmap.nii.gz",
+            "sub-a/ses-1/fmap/sub-a_ses-1_fmap.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_bold.nii.gz",
+            "sub-a/ses-1/anat/sub-a_ses-1_T1w.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-fingertap_bold.nii.gz",
+        ]
+        out_dir = Path(tmpdir) / "bids"
+        options = {"move_jobs": 4}
+
+        self._check_run_results(data_dir, out_dir, sidecar_files, other_files, options)
+
+    def test_run_moves_files_written_by_pre_move_hooks(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+    ):
+        # test-specific
+        data_dir = d2b_run_e2e / "extra-files"
+        out_dir = Path(tmpdir) / "bids"
+
+        planned: list[Path] = []
+
+        class WritingPlugin:
+            @hookimpl
+            def pre_move(self, acquisitions: list[Acquisition]):
+                for acquisition in acquisitions:
+                    Path(f"{acquisition.src_root}.extra").write_text("extra")
+
+            @hookimpl
+            def prepare_move_plan(self, plan: MovePlan):
+                planned.extend(src for src, _ in plan)
+
+        plugin = WritingPlugin()
+        pm.register(plugin)
+        try:
+            self._check_run_results(
+                data_dir,
+                out_dir,
+                ["sub-a/ses-1/dwi/sub-a_ses-1_dwi.json"],
+                ["sub-a/ses-1/dwi/sub-a_ses-1_dwi.bval"],
+            )
+        finally:
+            pm.unregister(plugin)
+
+        # the plan handed to the prepare_move_plan hooks includes the file
+        assert ".extra" in {fp.suffix for fp in planned}
+        extra = out_dir / "sub-a/ses-1/dwi/sub-a_ses-1_dwi.extra"
+        assert extra.read_text() == "extra"
+
+    def test_run_warns_about_acquisitions_without_files(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+        caplog: LogCaptureFixture,
+    ):
+        data_dir = d2b_run_e2e / "extra-files"
+        out_dir = Path(tmpdir) / "bids"
+
+        class RemovingPlugin:
+            @hookimpl
+            def pre_move(self, acquisitions: list[Acquisition]):
+                for acquisition in acquisitions:
+                    for fp in acquisition.src_root.parent.glob("*"):
+                        fp.unlink()
+
+        plugin = RemovingPlugin()
+        pm.register(plugin)
+        try:
+            d2b = D2B(
+                [data_dir / "in"],
+                out_dir,
+                data_dir / "d2b-config.json",
+                "a",
+                "1",
+                {"plan_only": True},
+            )
+            d2b.load_config()
+            d2b.run()
+        finally:
+            pm.unregister(plugin)
+
+        assert "No files are planned to be moved" in caplog.text
+
+    @pytest.mark.parametrize("durability", ["batch", "strict"])
+    def test_run_extra_files_durably(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+        durability: str,
+    ):
+        # test-specific
+        data_dir = d2b_run_e2e / "extra-files"
+        sidecar_files = [
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.json",
+        ]
+        other_files = [
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.bval",
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.bvec",
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.nii.gz",
+            "sub-a/ses-1/dwi/sub-a_ses-1_dwi.txt",
+        ]
+        out_dir = Path(tmpdir) / "bids"
+        options = {"durability": durability}
+
+        self._check_run_results(data_dir, out_dir, sidecar_files, other_files, options)
+
+    def test_run_resumes_an_interrupted_run(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+        mocker: MockerFixture,
+    ):
+        # test-specific
+        data_dir = d2b_run_e2e / "intended-for-fields"
+        sidecar_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.json",
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-PA_fmap.json",
+            "sub-a/ses-1/fmap/sub-a_ses-1_fmap.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_bold.json",
+            "sub-a/ses-1/anat/sub-a_ses-1_T1w.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-fingertap_bold.json",
+        ]
+        other_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.nii.gz",
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-PA_fmap.nii.gz",
+            "sub-a/ses-1/fmap/sub-a_ses-1_fmap.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_bold.nii.gz",
+            "sub-a/ses-1/anat/sub-a_ses-1_T1w.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-fingertap_bold.nii.gz",
+        ]
+        out_dir = Path(tmpdir) / "bids"
+        config_file = data_dir / "d2b-config.json"
+
+        # the run dies part way through moving the third acquisition's files
+        real_move = D2B._move
+        n_moved = 0
+
+        def dying_move(self: D2B, acquisition: Acquisition):
+            nonlocal n_moved
+            if n_moved == 2:
+                moves = self.move_plan.moves(acquisition)
+                src, dst = next(m for m in moves if m.src.suffix != ".json")
+                os.rename(src, dst)
+                raise KeyboardInterrupt
+            real_move(self, acquisition)
+            n_moved += 1
+
+        mocker.patch.object(D2B, "_move", dying_move)
+        d2b = D2B([data_dir / "in"], out_dir, config_file, "a", "1")
+        d2b.load_config()
+        with pytest.raises(KeyboardInterrupt):
+            d2b.run()
+        mocker.stopall()
+
+        stage = mocker.spy(D2B, "_stage")
+        collect = mocker.spy(D2B, "_collect_files")
+        move = mocker.spy(D2B, "_move")
+        self._check_run_results(
+            data_dir,
+            out_dir,
+            sidecar_files,
+            other_files,
+            {"resume": True},
+        )
+
+        assert not stage.called and not collect.called
+        assert move.call_count == len(sidecar_files) - 2
+        assert not list((out_dir / defaults.d2b_dir_name / "journal").rglob("*.jsonl"))
+
+    def test_run_in_place_is_not_resumed_as_a_staged_run(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+        mocker: MockerFixture,
+    ):
+        # test-specific
+        data_dir = d2b_run_e2e / "intended-for-fields"
+        sidecar_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.json",
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-PA_fmap.json",
+            "sub-a/ses-1/fmap/sub-a_ses-1_fmap.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_bold.json",
+            "sub-a/ses-1/anat/sub-a_ses-1_T1w.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-fingertap_bold.json",
+        ]
+        other_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.nii.gz",
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-PA_fmap.nii.gz",
+            "sub-a/ses-1/fmap/sub-a_ses-1_fmap.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_bold.nii.gz",
+            "sub-a/ses-1/anat/sub-a_ses-1_T1w.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-fingertap_bold.nii.gz",
+        ]
+        out_dir = Path(tmpdir) / "bids"
+        config_file = data_dir / "d2b-config.json"
+        in_dir = data_dir / "in"
+        before = {fp: fp.read_bytes() for fp in in_dir.rglob("*") if fp.is_file()}
+
+        # an in-place run dies after moving two acquisitions
+        real_move = D2B._move
+        n_moved = 0
+
+        def dying_move(self: D2B, acquisition: Acquisition):
+            nonlocal n_moved
+            if n_moved == 2:
+                raise KeyboardInterrupt
+            real_move(self, acquisition)
+            n_moved += 1
+
+        mocker.patch.object(D2B, "_move", dying_move)
+        options = {"stage_mode": "none"}
+        d2b = D2B([in_dir], out_dir, config_file, "a", "1", options)
+        d2b.load_config()
+        with pytest.raises(KeyboardInterrupt):
+            d2b.run()
+        mocker.stopall()
+
+        # resumed without --stage-mode none, the input directories must not be
+        # mistaken for staged copies (and their files moved away)
+        stage = mocker.spy(D2B, "_stage")
+        self._check_run_results(
+            data_dir,
+            out_dir,
+            sidecar_files,
+            other_files,
+            {"resume": True},
+        )
+
+        stage.assert_called_once()
+        after = {fp: fp.read_bytes() for fp in in_dir.rglob("*") if fp.is_file()}
+        assert after == before
+
+    def test_run_resumes_with_the_pre_move_hooks_changes(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+        mocker: MockerFixture,
+    ):
+        data_dir = d2b_run_e2e / "intended-for-fields"
+        config_file = data_dir / "d2b-config.json"
+        out_dir = Path(tmpdir) / "bids"
+
+        class RelabellingPlugin:
+            @hookimpl
+            def pre_move(self, acquisitions: list[Acquisition]):
+                for acquisition in acquisitions:
+                    if acquisition.description.modality_label == "_T1w":
+                        acquisition.description.modality_label = "T1map"
+                        acquisition.description.sidecar_changes["Relabelled"] = True
+
+        # the run dies before anything is moved
+        plugin = RelabellingPlugin()
+        pm.register(plugin)
+        mocker.patch.object(D2B, "_move", side_effect=KeyboardInterrupt)
+        try:
+            d2b = D2B([data_dir / "in"], out_dir, config_file, "a", "1")
+            d2b.load_config()
+            with pytest.raises(KeyboardInterrupt):
+                d2b.run()
+        finally:
+            pm.unregister(plugin)
+        mocker.stopall()
+
+        # the pre-move hooks aren't run again, yet their changes are kept
+        d2b = D2B([data_dir / "in"], out_dir, config_file, "a", "1", {"resume": True})
+        d2b.load_config()
+        d2b.run()
+
+        anat = out_dir / "sub-a" / "ses-1" / "anat"
+        assert sorted(fp.name for fp in anat.iterdir()) == [
+            "sub-a_ses-1_T1map.json",
+            "sub-a_ses-1_T1map.nii.gz",
+        ]
+        sidecar = json.loads((anat / "sub-a_ses-1_T1map.json").read_text())
+        assert sidecar["Relabelled"] is True
+
+    def test_run_plan_only_moves_nothing(self, d2b_run_e2e: Path, tmpdir: str):
+        data_dir = d2b_run_e2e / "intended-for-fields"
+        config_file = data_dir / "d2b-config.json"
+        out_dir = Path(tmpdir) / "bids"
+
+        d2b = D2B(
+            [data_dir / "in"], out_dir, config_file, "a", "1", {"plan_only": True}
+        )
+        d2b.load_config()
+        d2b.run()
+
+        assert len(d2b.move_plan.acquisitions) == 6
+        assert not (out_dir / "sub-a").exists()
+        for src, dst in d2b.move_plan:
+            assert src.is_file()
+            assert out_dir / "sub-a" / "ses-1" in dst.parents
+        # the next run doesn't resume the plan-only run
+        assert not list((out_dir / defaults.d2b_dir_name / "journal").rglob("*.jsonl"))
+
+    @pytest.mark.parametrize("walk_threads,jobs", [(1, 1), (4, 1), (4, 2)])
+    def test_run_pipelined(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+        walk_threads: int,
+        jobs: int,
+    ):
+        # test-specific
+        data_dir = d2b_run_e2e / "intended-for-target-has-run"
+        sidecar_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_run-1_bold.json",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_run-2_bold.json",
+        ]
+        other_files = [
+            "sub-a/ses-1/fmap/sub-a_ses-1_dir-AP_fmap.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_run-1_bold.nii.gz",
+            "sub-a/ses-1/func/sub-a_ses-1_task-rest_run-2_bold.nii.gz",
+        ]
+        out_dir = Path(tmpdir) / "bids"
+        # several batches, so the walk and the matching overlap
+        options = {
+            "pipeline": True,
+            "pipeline_batch_size": 1,
+            "walk_threads": walk_threads,
+            "jobs": jobs,
+        }
+
+        self._check_run_results(data_dir, out_dir, sidecar_files, other_files, options)
+
+    def test_run_only_decodes_sorted_and_matched_sidecar_keys(
+        self,
+        d2b_run_e2e: Path,
+        tmpdir: str,
+    ):
+        data_dir = d2b_run_e2e / "intended-for-target-has-run"
+        config_file = data_dir / "d2b-config.json"
+        out_dir = Path(tmpdir) / "bids"
+
+        d2b = D2B([data_dir / "in"], out_dir, config_file, "a", "1")
+        d2b.load_config()
+        d2b.run()
+
+        assert d2b.sidecars.keys == {"SeriesNumber", "ProtocolName"}
+
     def test_run_intended_for_list_target_has_run(self, d2b_run_e2e: Path, tmpdir: str):
         # test-specific
         data_dir = d2b_run_e2e / "intended-for-list-target-has-run"
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+from d2b.durability import Durability
+from pytest_mock import MockerFixture
+
+
+def _write(durability: Durability, directory: Path, n_files: int) -> list[Path]:
+    paths = []
+    for i in range(n_files):
+        fp = directory / f"{i % 2}" / f"{i}.json"
+        fp.parent.mkdir(exist_ok=True)
+        durability.write_text(fp, f'{{"i": {i}}}')
+        paths.append(fp)
+    return paths
+
+
+@pytest.mark.parametrize(
+    ("mode", "while_writing", "on_commit"),
+    [
+        ("none", 0, 0),
+        # 4 files + 2 directories, each flushed once
+        ("batch", 0, 6),
+        # each file and its directory, as each file is written
+        ("strict", 8, 0),
+    ],
+)
+def test_fsyncs_per_mode(
+    tmpdir: str,
+    mocker: MockerFixture,
+    mode: str,
+    while_writing: int,
+    on_commit: int,
+):
+    fsync = mocker.patch("d2b.durability.os.fsync")
+    durability = Durability(mode)
+
+    paths = _write(durability, Path(tmpdir), 4)
+    n_written = fsync.call_count
+    durability.commit()
+
+    assert n_written == while_writing
+    assert fsync.call_count - n_written == on_commit
+    assert [fp.read_text() for fp in paths] == [f'{{"i": {i}}}' for i in range(4)]
+
+
+def test_batch_flushes_tracked_files_and_new_directories(
+    tmpdir: str,
+    mocker: MockerFixture,
+):
+    flushed: list[Path] = []
+    mocker.patch("d2b.durability.fsync", side_effect=flushed.append)
+    root = Path(tmpdir) / "bids"
+    directory = root / "sub-a" / "anat"
+    directory.mkdir(parents=True)
+    (directory / "a.nii").write_text("")
+    durability = Durability("batch")
+
+    durability.track_directories([directory], root)
+    durability.track(directory / "a.nii")
+    durability.commit()
+
+    # each path once, the files before the directories which contain them
+    assert flushed == [directory / "a.nii", root, root / "sub-a", directory]
+    assert durability.pending == 0
+
+
+@pytest.mark.parametrize("mode", ["batch", "strict"])
+def test_failed_write_leaves_the_destination_intact(
+    tmpdir: str,
+    mocker: MockerFixture,
+    mode: str,
+):
+    fp = Path(tmpdir) / "a.json"
+    fp.write_text('{"old": true}')
+    mocker.patch("d2b.durability.os.replace", side_effect=OSError("disk on fire"))
+
+    with pytest.raises(OSError, match="disk on fire"):
+        Durability(mode).write_text(fp, '{"new": true}')
+
+    assert fp.read_text() == '{"old": true}'
+    assert os.listdir(tmpdir) == ["a.json"]
+
+
+@pytest.mark.parametrize("mode", ["none", "batch"])
+def test_written_files_have_the_default_permissions(tmpdir: str, mode: str):
+    reference = Path(tmpdir) / "reference"
+    reference.write_text("")
+    fp = Path(tmpdir) / "a.json"
+
+    Durability(mode).write_text(fp, "{}")
+
+    assert fp.stat().st_mode == reference.stat().st_mode
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError, match="Invalid durability mode"):
+        Durability("sometimes")
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from d2b.journal import RunJournal
+from pytest import LogCaptureFixture
+
+
+IDENTITY = {"d2b": "1.0.0", "participant": "sub-a"}
+
+
+def test_resume_returns_the_recorded_stages(tmpdir: str):
+    path = Path(tmpdir) / "journal" / "run.jsonl"
+    journal = RunJournal.start(path, IDENTITY)
+    journal.record("staged", src_dirs=["a"])
+    journal.record("moved", acquisition=1)
+    journal.record("moved", acquisition=0)
+
+    resumed = RunJournal.resume(path, IDENTITY)
+
+    assert resumed is not None
+    assert resumed.get("staged") == {"stage": "staged", "src_dirs": ["a"]}
+    assert resumed.get("planned") is None
+    assert resumed.moved == {0, 1}
+
+
+def test_a_partially_written_record_is_ignored(tmpdir: str):
+    path = Path(tmpdir) / "run.jsonl"
+    journal = RunJournal.start(path, IDENTITY)
+    journal.record("moved", acquisition=0)
+    with open(path, "a") as f:
+        f.write('{"stage": "moved", "acqui')
+
+    resumed = RunJournal.resume(path, IDENTITY)
+
+    assert resumed is not None
+    assert resumed.moved == {0}
+
+
+def test_another_runs_journal_is_not_resumed(tmpdir: str, caplog: LogCaptureFixture):
+    path = Path(tmpdir) / "run.jsonl"
+    RunJournal.start(path, IDENTITY).record("moved", acquisition=0)
+
+    assert RunJournal.resume(path, {**IDENTITY, "participant": "sub-b"}) is None
+    assert "['participant'] differ" in caplog.text
+    assert RunJournal.resume(Path(tmpdir) / "missing.jsonl", IDENTITY) is None
+
+
+def test_start_discards_the_previous_journal(tmpdir: str):
+    path = Path(tmpdir) / "run.jsonl"
+    RunJournal.start(path, IDENTITY).record("moved", acquisition=0)
+
+    RunJournal.start(path, IDENTITY)
+    resumed = RunJournal.resume(path, IDENTITY)
+
+    assert resumed is not None
+    assert resumed.moved == set()
+
+
+def test_finish_removes_the_journal(tmpdir: str):
+    path = Path(tmpdir) / "run.jsonl"
+    journal = RunJournal.start(path, IDENTITY)
+
+    journal.finish()
+
+    assert not path.exists()
+
+
+def test_unpersisted_journal_leaves_the_journal_on_disk_alone(tmpdir: str):
+    path = Path(tmpdir) / "run.jsonl"
+    RunJournal.start(path, IDENTITY).record("moved", acquisition=0)
+    previous = path.read_text()
+
+    journal = RunJournal.resume(path, IDENTITY, persist=False)
+    assert journal is not None
+    journal.record("moved", acquisition=1)
+    journal.finish()
+    RunJournal.start(Path(tmpdir) / "new.jsonl", IDENTITY, persist=False)
+
+    assert journal.moved == {0, 1}
+    assert path.read_text() == previous
+    assert not (Path(tmpdir) / "new.jsonl").exists()
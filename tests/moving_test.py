@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import errno
+import os
+import threading
+from pathlib import Path
+
+import pytest
+from d2b.collect import StemIndex
+from d2b.d2b import Acquisition
+from d2b.d2b import Description
+from d2b.d2b import Participant
+from d2b.moving import conflict_groups
+from d2b.moving import move_concurrently
+from d2b.moving import MoveError
+from d2b.moving import Mover
+from d2b.moving import MovePlan
+from d2b.moving import PlannedMove
+from pytest_mock import MockerFixture
+
+
+def _acquisition(src_file: str, modality_label: str) -> Acquisition:
+    return Acquisition(
+        Path(src_file),
+        Participant("a"),
+        Description(0, "anat", modality_label),
+    )
+
+
+@pytest.mark.parametrize(
+    ("acquisitions", "expected"),
+    [
+        ([("in/a.json", "T1w"), ("in/b.json", "T2w")], [[0], [1]]),
+        # same destination
+        ([("in/a.json", "T1w"), ("in/b.json", "T1w")], [[0, 1]]),
+        # possibly shared source files
+        ([("in/a.json", "T1w"), ("in/x/y/a.json", "T2w")], [[0, 1]]),
+        ([("in/x/a.json", "T1w"), ("in/a.json", "T2w")], [[0, 1]]),
+        ([("in/x/a.json", "T1w"), ("in/y/a.json", "T2w")], [[0], [1]]),
+        # conflicts are transitive
+        (
+            [
+                ("in/a.json", "T1w"),
+                ("in/b.json", "T2w"),
+                ("in/x/a.json", "T2w"),
+                ("in/c.json", "FLAIR"),
+            ],
+            [[0, 1, 2], [3]],
+        ),
+    ],
+)
+def test_conflict_groups(
+    acquisitions: list[tuple[str, str]],
+    expected: list[list[int]],
+):
+    acqs = [_acquisition(src, modality) for src, modality in acquisitions]
+
+    assert conflict_groups(acqs) == expected
+
+
+def test_move_concurrently_moves_independent_acquisitions_at_once():
+    acqs = [_acquisition(f"in/{i}.json", f"m{i}") for i in range(3)]
+    barrier = threading.Barrier(len(acqs), timeout=5)
+    moved: list[Path] = []
+
+    def move(acq: Acquisition):
+        # deadlocks (and the barrier times out) unless the moves run at once
+        barrier.wait()
+        moved.append(acq.src_file)
+
+    move_concurrently(acqs, move, jobs=len(acqs))
+
+    assert sorted(moved) == sorted(acq.src_file for acq in acqs)
+
+
+def test_move_concurrently_moves_conflicting_acquisitions_in_order():
+    acqs = [_acquisition(f"in/{'x/' * i}a.json", f"m{i}") for i in range(5)]
+    moved: list[Path] = []
+
+    move_concurrently(acqs, lambda acq: moved.append(acq.src_file), jobs=4)
+
+    assert moved == [acq.src_file for acq in acqs]
+
+
+def test_move_concurrently_collects_errors_per_acquisition():
+    acqs = [_acquisition(f"in/{i}.json", f"m{i}") for i in range(4)]
+    moved: list[Path] = []
+
+    def move(acq: Acquisition):
+        if acq.src_file.stem in {"1", "3"}:
+            raise OSError(f"disk on fire [{acq.src_file}]")
+        moved.append(acq.src_file)
+
+    with pytest.raises(MoveError) as exc_info:
+        move_concurrently(acqs, move, jobs=2)
+
+    assert list(exc_info.value.errors) == [Path("in/1.json"), Path("in/3.json")]
+    assert "disk on fire" in str(exc_info.value)
+    # the other acquisitions are still moved
+    assert sorted(moved) == [Path("in/0.json"), Path("in/2.json")]
+
+
+def _tree(root: Path, filenames: list[str]) -> StemIndex:
+    for fn in filenames:
+        fp = root / fn
+        fp.parent.mkdir(exist_ok=True, parents=True)
+        fp.write_text(fn)
+    return StemIndex.build([root])
+
+
+class TestMovePlan:
+    def test_build(self, tmpdir: str):
+        root = Path(tmpdir) / "in"
+        index = _tree(root, ["a.json", "a.nii.gz", "ab.json", "ab.nii", "b.txt"])
+        acqs = [
+            _acquisition(str(root / "a.json"), "T1w"),
+            _acquisition(str(root / "ab.json"), "T2w"),
+            _acquisition(str(root / "b.txt"), "FLAIR"),
+        ]
+        out_dir = Path(tmpdir) / "bids"
+
+        plan = MovePlan.build(acqs, out_dir, index)
+
+        anat = out_dir / "sub-a" / "anat"
+        assert plan.moves(acqs[0]) == [
+            PlannedMove(root / "a.json", anat / "sub-a_T1w.json"),
+            PlannedMove(root / "a.nii.gz", anat / "sub-a_T1w.nii.gz"),
+        ]
+        assert plan.moves(acqs[1]) == [
+            PlannedMove(root / "ab.json", anat / "sub-a_T2w.json"),
+            PlannedMove(root / "ab.nii", anat / "sub-a_T2w.nii"),
+        ]
+        # only sidecar-based acquisitions are planned
+        assert plan.moves(acqs[2]) == []
+        assert plan.acquisitions == acqs[:2]
+        assert len(plan) == 4
+        assert plan.directories == [anat]
+        assert plan.collisions() == {}
+
+    def test_files_are_planned_for_the_first_acquisition_only(self, tmpdir: str):
+        root = Path(tmpdir) / "in"
+        index = _tree(root, ["a.json", "a.nii", "x/a.json", "x/a.bval"])
+        acqs = [
+            _acquisition(str(root / "a.json"), "T1w"),
+            _acquisition(str(root / "x" / "a.json"), "T2w"),
+        ]
+
+        plan = MovePlan.build(acqs, Path(tmpdir) / "bids", index)
+
+        planned = [[src for src, _ in plan.moves(acq)] for acq in acqs]
+        assert planned == [
+            [
+                root / "a.json",
+                root / "a.nii",
+                root / "x" / "a.bval",
+                root / "x" / "a.json",
+            ],
+            [],
+        ]
+
+    def test_collisions_and_existing_destinations(self, tmpdir: str):
+        root = Path(tmpdir) / "in"
+        index = _tree(root, ["a.json", "a.nii", "x/a.nii"])
+        acq = _acquisition(str(root / "a.json"), "T1w")
+        out_dir = Path(tmpdir) / "bids"
+        existing = out_dir / "sub-a" / "anat" / "sub-a_T1w.json"
+        existing.parent.mkdir(parents=True)
+        existing.write_text("{}")
+
+        plan = MovePlan.build([acq], out_dir, index)
+
+        nii = out_dir / "sub-a" / "anat" / "sub-a_T1w.nii"
+        assert plan.collisions() == {nii: [root / "a.nii", root / "x" / "a.nii"]}
+        assert plan.existing() == [existing]
+
+    def test_make_directories(self, tmpdir: str):
+        out_dir = Path(tmpdir) / "bids"
+        plan = MovePlan(out_dir)
+        plan.add(_acquisition("in/a.json", "T1w"), [Path("in/a.json")])
+        plan.add(_acquisition("in/b.json", "T2w"), [Path("in/b.json")])
+
+        plan.make_directories()
+
+        assert plan.directories == [out_dir / "sub-a" / "anat"]
+        assert plan.directories[0].is_dir()
+
+
+class TestMover:
+    @pytest.fixture
+    def src(self, tmpdir: str) -> Path:
+        fp = Path(tmpdir) / "in" / "a.nii.gz"
+        fp.parent.mkdir()
+        fp.write_text("data")
+        os.utime(fp, (1_000_000, 1_000_000))
+        return fp
+
+    @pytest.fixture
+    def out_dir(self, tmpdir: str) -> Path:
+        _out_dir = Path(tmpdir) / "bids"
+        _out_dir.mkdir()
+        return _out_dir
+
+    def test_renames_on_the_same_filesystem(self, src: Path, out_dir: Path):
+        inode = src.stat().st_ino
+        mover = Mover(out_dir, [src.parent])
+
+        mover.move(src, out_dir / "a.nii.gz")
+
+        assert not mover.cross_device(src)
+        assert not src.exists()
+        assert (out_dir / "a.nii.gz").stat().st_ino == inode
+
+    def test_copies_across_filesystems(
+        self,
+        src: Path,
+        out_dir: Path,
+        mocker: MockerFixture,
+    ):
+        mover = Mover(out_dir)
+        mocker.patch.object(mover, "_out_dev", -1)
+        rename = mocker.spy(os, "rename")
+
+        mover.move(src, out_dir / "a.nii.gz")
+
+        assert mover.cross_device(src)
+        assert not rename.called
+        assert not src.exists()
+        assert (out_dir / "a.nii.gz").read_text() == "data"
+        assert (out_dir / "a.nii.gz").stat().st_mtime == 1_000_000
+
+    def test_copies_if_rename_fails_with_exdev(
+        self,
+        src: Path,
+        out_dir: Path,
+        mocker: MockerFixture,
+    ):
+        exdev = OSError(errno.EXDEV, "Invalid cross-device link")
+        mocker.patch("d2b.moving.os.rename", side_effect=exdev)
+        mover = Mover(out_dir)
+
+        mover.move(src, out_dir / "a.nii.gz")
+
+        assert not src.exists()
+        assert (out_dir / "a.nii.gz").read_text() == "data"
+        # the directory is known to be on another filesystem from now on
+        assert mover.cross_device(src)
+
+    def test_source_is_kept_if_the_copy_fails(
+        self,
+        src: Path,
+        out_dir: Path,
+        mocker: MockerFixture,
+    ):
+        mover = Mover(out_dir)
+        mocker.patch.object(mover, "_out_dev", -1)
+        mocker.patch("d2b.moving.transfer_file", side_effect=OSError("disk full"))
+
+        with pytest.raises(OSError, match="disk full"):
+            mover.move(src, out_dir / "a.nii.gz")
+
+        assert src.read_text() == "data"
+
+    def test_keep_sources(self, src: Path, out_dir: Path):
+        Mover(out_dir, keep_sources=True).move(src, out_dir / "a.nii.gz")
+
+        assert src.read_text() == (out_dir / "a.nii.gz").read_text() == "data"
+
+    def test_move_all_copies_files_at_once(
+        self,
+        tmpdir: str,
+        out_dir: Path,
+        mocker: MockerFixture,
+    ):
+        n_files = 3
+        barrier = threading.Barrier(n_files, timeout=5)
+        # deadlocks (and the barrier times out) unless the copies run at once
+        mocker.patch("d2b.moving.transfer_file", side_effect=lambda *_: barrier.wait())
+        pairs = []
+        for i in range(n_files):
+            src = Path(tmpdir) / f"{i}.nii"
+            src.write_text(f"{i}")
+            pairs.append((src, out_dir / f"{i}.nii"))
+        mover = Mover(out_dir, jobs=n_files)
+        mocker.patch.object(mover, "_out_dev", -1)
+
+        mover.move_all(pairs)
+
+        assert not any(src.exists() for src, _ in pairs)
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+from d2b.criteria import Criteria
+from d2b.criteria import MatchMemo
+from d2b.internal_plugins.core import is_link_batch
+from d2b.plugins import pm
+from d2b.sidecars import project_sidecar
+from d2b.sidecars import SidecarCache
+from d2b.utils import filepath_sort_key
+from pytest_mock import MockerFixture
+
+
+def _write_sidecar(fp: Path, data: dict) -> Path:
+    fp.write_text(json.dumps(data))
+    return fp
+
+
+class TestSidecarCache:
+    def test_get_parses_each_file_once(self, tmpdir: str, mocker: MockerFixture):
+        fp = _write_sidecar(Path(tmpdir) / "a.json", {"SeriesNumber": 1})
+        loads = mocker.spy(json, "loads")
+
+        sidecars = SidecarCache(maxsize=10)
+        first = sidecars.get(fp)
+        second = sidecars.get(str(fp))
+
+        assert first == {"SeriesNumber": 1}
+        assert first is second
+        assert loads.call_count == 1
+
+    def test_least_recently_used_entries_are_evicted(self, tmpdir: str):
+        a = _write_sidecar(Path(tmpdir) / "a.json", {"a": 1})
+        b = _write_sidecar(Path(tmpdir) / "b.json", {"b": 1})
+        c = _write_sidecar(Path(tmpdir) / "c.json", {"c": 1})
+
+        sidecars = SidecarCache(maxsize=2)
+        sidecars.get(a)
+        sidecars.get(b)
+        sidecars.get(a)  # 'b' is now the least recently used entry
+        sidecars.get(c)
+
+        assert len(sidecars) == 2
+        assert a in sidecars
+        assert b not in sidecars
+        assert c in sidecars
+
+    def test_zero_maxsize_disables_caching(self, tmpdir: str):
+        fp = _write_sidecar(Path(tmpdir) / "a.json", {"a": 1})
+
+        sidecars = SidecarCache(maxsize=0)
+
+        assert sidecars.get(fp) == {"a": 1}
+        assert len(sidecars) == 0
+
+    def test_discard(self, tmpdir: str):
+        fp = _write_sidecar(Path(tmpdir) / "a.json", {"a": 1})
+
+        sidecars = SidecarCache()
+        sidecars.get(fp)
+        sidecars.discard(fp)
+        sidecars.discard(fp)  # discarding a missing entry is a no-op
+
+        assert fp not in sidecars
+
+    def test_keys_project_sidecars(self, tmpdir: str):
+        data = {"SeriesNumber": 2, "SliceTiming": [0.0, 0.5], "ImageComments": "x"}
+        fp = _write_sidecar(Path(tmpdir) / "a.json", data)
+
+        sidecars = SidecarCache(keys={"SeriesNumber", "ProtocolName"})
+
+        assert sidecars.get(fp) == {"SeriesNumber": 2}
+        assert sidecars.get(fp, complete=True) == data
+
+
+PROJECTION_CASES = [
+    {},
+    {"a": 1, "b": [1, 2.5e-3, -3], "c": None},
+    {"a": {"nested": ["]", "}", '"', "\\"]}, "b": True, "c": "\u00e9"},
+    {"blob": "x" * 1000, "a": [[{}], {"k": [[]]}], "b": "end"},
+    {"\u0041\n": 1, "a": 'q"}', "b": [False, None, ""]},
+]
+
+
+@pytest.mark.parametrize("data", PROJECTION_CASES)
+@pytest.mark.parametrize("keys", [set(), {"a"}, {"a", "c", "missing"}, {"\u0041\n"}])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_project_sidecar_agrees_with_json_loads(
+    data: dict,
+    keys: set[str],
+    indent: int | None,
+):
+    text = json.dumps(data, indent=indent, ensure_ascii=False)
+    expected = {k: v for k, v in json.loads(text).items() if k in keys}
+    assert project_sidecar(text, keys) == expected
+
+
+def test_project_sidecar_last_duplicate_key_wins():
+    assert project_sidecar('{"a": 1, "b": 2, "a": 3}', {"a"}) == {"a": 3}
+
+
+@pytest.mark.parametrize(
+    "text",
+    ['{"a": [1, 2', '{"a" 1}', '{"a": 1 "b": 2}', '{"a": }', '{"a": "x', "{1: 2}"],
+)
+def test_project_sidecar_malformed_json_raises(text: str):
+    with pytest.raises(json.JSONDecodeError):
+        project_sidecar(text, {"b"})
+
+
+def test_filepath_sort_key_uses_sidecar_cache(tmpdir: str, mocker: MockerFixture):
+    fp = _write_sidecar(Path(tmpdir) / "a.json", {"SeriesNumber": 7})
+    sidecars = SidecarCache()
+    sidecars.get(fp)
+    loads = mocker.spy(json, "loads")
+
+    assert filepath_sort_key(fp, sidecars) == (7, str(fp))
+    assert loads.call_count == 0
+
+
+def test_is_link_hook_uses_sidecar_cache(tmpdir: str, mocker: MockerFixture):
+    fp = _write_sidecar(Path(tmpdir) / "a.json", {"SeriesNumber": 7})
+    sidecars = SidecarCache()
+    sidecars.get(fp)
+    loads = mocker.spy(json, "loads")
+    criteria = Criteria({"SeriesNumber": 7})
+
+    results = pm.hook.is_link(  # type: ignore
+        path=fp,
+        criteria=criteria.criteria,
+        compiled_criteria=criteria,
+        config={},
+        options={},
+        sidecars=sidecars,
+    )
+
+    assert any(results)
+    assert loads.call_count == 0
+
+
+@pytest.mark.parametrize("match_engine", ["auto", "python"])
+def test_path_only_criteria_are_matched_without_reading_sidecars(
+    match_engine: str,
+    mocker: MockerFixture,
+):
+    sidecars = SidecarCache()
+    spy = mocker.spy(sidecars, "get")
+    paths = [Path("missing/sub-01_T1w.json"), Path("missing/sub-01_bold.json")]
+    criteria = [Criteria({"filename": "*T1w*"}), Criteria({"filepath": "*bold*"})]
+    options = {"match_engine": match_engine}
+
+    matrix = is_link_batch(paths, criteria, options, sidecars, MatchMemo())
+
+    assert matrix == [[True, False], [False, True]]
+    spy.assert_not_called()
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import errno
+import os
+import threading
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from d2b import staging
+from d2b.staging import link_tree
+from d2b.staging import Stager
+from d2b.staging import StagingError
+from d2b.staging import snapshot
+from pytest_mock import MockerFixture
+
+
+@pytest.mark.parametrize("mode", ["none", "rsync"])
+def test_unknown_stage_mode_is_rejected(mode: str):
+    with pytest.raises(ValueError, match="Unknown staging mode"):
+        Stager(mode=mode)
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_stage_copies_every_directory(
+    tmpdir: str,
+    jobs: int,
+    populate: Callable[[Path, dict[str, str]], Path],
+    contents: Callable[[Path], dict[str, str]],
+):
+    pairs = []
+    for i in range(3):
+        src = populate(
+            Path(tmpdir) / f"in{i}",
+            {"a.json": f"{i}", "b/c.nii": "x" * i},
+        )
+        pairs.append((src, Path(tmpdir) / "staged" / f"{i}"))
+
+    staged = Stager(jobs).stage(pairs)
+
+    assert [(s.src, s.dst) for s in staged] == pairs
+    for (src, dst), s in zip(pairs, staged):
+        assert contents(dst) == contents(src)
+        assert s.n_bytes == sum(size for size, *_ in snapshot(src).values())
+
+
+def test_stage_runs_directories_concurrently(tmpdir: str, mocker: MockerFixture):
+    n_dirs = 3
+    barrier = threading.Barrier(n_dirs, timeout=5)
+    # every copy waits for the others to start, so this deadlocks (and the
+    # barrier times out) unless all of the copies run at the same time
+    mocker.patch("d2b.staging.rsync", side_effect=lambda *_, **__: barrier.wait())
+    pairs = [
+        (Path(tmpdir) / f"{i}", Path(tmpdir) / f"staged{i}") for i in range(n_dirs)
+    ]
+
+    staged = Stager(jobs=n_dirs, mode="copy").stage(pairs)
+
+    assert len(staged) == n_dirs
+
+
+def test_stage_collects_errors_per_directory(
+    tmpdir: str,
+    mocker: MockerFixture,
+    populate: Callable[[Path, dict[str, str]], Path],
+    contents: Callable[[Path], dict[str, str]],
+):
+    ok = populate(Path(tmpdir) / "ok", {"a.json": "{}"})
+    bad = Path(tmpdir) / "bad"
+
+    def fake_rsync(src: Path, dst: Path, **kwargs):
+        if src == bad:
+            raise OSError("disk on fire")
+        populate(dst, contents(src))
+
+    mocker.patch("d2b.staging.rsync", side_effect=fake_rsync)
+    pairs = [(bad, Path(tmpdir) / "s1"), (ok, Path(tmpdir) / "s2")]
+
+    with pytest.raises(StagingError) as exc_info:
+        Stager(jobs=2, mode="copy").stage(pairs)
+
+    assert list(exc_info.value.errors) == [bad]
+    assert "disk on fire" in str(exc_info.value)
+    # the other directories are still staged
+    assert contents(Path(tmpdir) / "s2") == {"a.json": "{}"}
+
+
+class TestStagingManifest:
+    @pytest.fixture
+    def src(
+        self,
+        tmpdir: str,
+        populate: Callable[[Path, dict[str, str]], Path],
+    ) -> Path:
+        return populate(
+            Path(tmpdir) / "in",
+            {"a.json": "{}", "a.nii": "a", "b/c.json": "{}", "b/c.nii": "c"},
+        )
+
+    @pytest.fixture(params=["auto", "copy"])
+    def stager(self, tmpdir: str, request) -> Stager:
+        return Stager(mode=request.param, manifest_dir=Path(tmpdir) / "manifests")
+
+    def test_unchanged_directory_is_not_transferred(
+        self,
+        src: Path,
+        stager: Stager,
+        tmpdir: str,
+        mocker: MockerFixture,
+        contents: Callable[[Path], dict[str, str]],
+    ):
+        dst = Path(tmpdir) / "staged"
+        first = stager.stage_one(src, dst)
+        rsync = mocker.patch("d2b.staging.rsync")
+        link_file = mocker.spy(staging, "_link_file")
+        copy = mocker.spy(staging.shutil, "copy2")
+
+        second = stager.stage_one(src, dst)
+
+        assert first.n_transferred == first.n_files == 4
+        assert second.n_transferred == second.n_bytes == 0
+        assert not rsync.called and not link_file.called and not copy.called
+        assert contents(dst) == contents(src)
+
+    def test_changed_and_moved_files_are_restaged(
+        self,
+        src: Path,
+        stager: Stager,
+        tmpdir: str,
+        contents: Callable[[Path], dict[str, str]],
+    ):
+        dst = Path(tmpdir) / "staged"
+        stager.stage_one(src, dst)
+        # the staged file was moved into the BIDS directory by a previous run
+        (dst / "a.nii").rename(Path(tmpdir) / "moved.nii")
+        # an input file was replaced, another was removed
+        (src / "b" / "c.json").unlink()
+        (src / "b" / "c.json").write_text('{"SeriesNumber": 2}')
+        (src / "b" / "c.nii").unlink()
+
+        staged = stager.stage_one(src, dst)
+
+        assert staged.n_transferred == 2
+        assert contents(dst) == contents(src)
+
+    def test_checksum_ignores_the_manifest(
+        self,
+        src: Path,
+        tmpdir: str,
+        mocker: MockerFixture,
+    ):
+        manifest_dir = Path(tmpdir) / "manifests"
+        dst = Path(tmpdir) / "staged"
+        Stager(mode="copy", manifest_dir=manifest_dir).stage_one(src, dst)
+        rsync = mocker.patch("d2b.staging.rsync")
+
+        stager = Stager(mode="copy", manifest_dir=manifest_dir, checksum=True)
+        stager.stage_one(src, dst)
+
+        rsync.assert_called_once()
+        assert rsync.call_args.kwargs["checksum"] is True
+
+
+class TestLinkTree:
+    def test_hardlinks_when_reflinks_are_unsupported(
+        self,
+        tmpdir: str,
+        mocker: MockerFixture,
+        populate: Callable[[Path, dict[str, str]], Path],
+        contents: Callable[[Path], dict[str, str]],
+    ):
+        unsupported = OSError(errno.EOPNOTSUPP, "unsupported")
+        reflink = mocker.patch("d2b.staging.reflink", side_effect=unsupported)
+        src = populate(Path(tmpdir) / "src", {"a.json": "{}", "b/c.nii": "x"})
+        dst = Path(tmpdir) / "dst"
+        dst.mkdir()
+
+        link_tree(src, dst)
+
+        assert contents(dst) == contents(src)
+        assert (dst / "a.json").samefile(src / "a.json")
+        assert (dst / "b" / "c.nii").samefile(src / "b" / "c.nii")
+        # an unsupported method isn't retried for every file
+        reflink.assert_called_once()
+
+    def test_falls_back_per_file_on_other_errors(
+        self,
+        tmpdir: str,
+        mocker: MockerFixture,
+        populate: Callable[[Path, dict[str, str]], Path],
+        contents: Callable[[Path], dict[str, str]],
+    ):
+        unsupported = OSError(errno.EOPNOTSUPP, "unsupported")
+        mocker.patch("d2b.staging.reflink", side_effect=unsupported)
+        link = os.link
+
+        def link_or_fail(src: str, dst: str):
+            if src.endswith("a.json"):
+                raise OSError(errno.EPERM, "not permitted")
+            link(src, dst)
+
+        mocker.patch("os.link", side_effect=link_or_fail)
+        src = populate(
+            Path(tmpdir) / "src",
+            {"a.json": "{}", "b/c.nii": "x", "b/d.nii": "y"},
+        )
+        dst = Path(tmpdir) / "dst"
+        dst.mkdir()
+
+        link_tree(src, dst)
+
+        assert contents(dst) == contents(src)
+        assert not (dst / "a.json").samefile(src / "a.json")
+        assert (dst / "b" / "c.nii").samefile(src / "b" / "c.nii")
+        assert (dst / "b" / "d.nii").samefile(src / "b" / "d.nii")
+
+    def test_copies_when_links_are_disallowed(
+        self,
+        tmpdir: str,
+        mocker: MockerFixture,
+        populate: Callable[[Path, dict[str, str]], Path],
+        contents: Callable[[Path], dict[str, str]],
+    ):
+        unsupported = OSError(errno.EOPNOTSUPP, "unsupported")
+        mocker.patch("d2b.staging.reflink", side_effect=unsupported)
+        src = populate(Path(tmpdir) / "src", {"a.json": "{}", "b/c.nii": "x"})
+        dst = Path(tmpdir) / "dst"
+        dst.mkdir()
+
+        link_tree(src, dst, hardlink=False)
+
+        assert contents(dst) == contents(src)
+        assert not (dst / "a.json").samefile(src / "a.json")
+
+    def test_removes_extraneous_entries(
+        self,
+        tmpdir: str,
+        populate: Callable[[Path, dict[str, str]], Path],
+        contents: Callable[[Path], dict[str, str]],
+    ):
+        src = populate(Path(tmpdir) / "src", {"a.json": "{}", "b/c.nii": "x"})
+        dst = populate(
+            Path(tmpdir) / "dst",
+            {"old.json": "", "b/old.nii": "", "gone/d.txt": "", "a.json": "stale"},
+        )
+
+        link_tree(src, dst)
+
+        assert contents(dst) == contents(src)
+
+    def test_symlinks_are_recreated(
+        self,
+        tmpdir: str,
+        populate: Callable[[Path, dict[str, str]], Path],
+    ):
+        src = populate(Path(tmpdir) / "src", {"b/c.nii": "x"})
+        (src / "link.nii").symlink_to("b/c.nii")
+        (src / "dirlink").symlink_to("b")
+        dst = Path(tmpdir) / "dst"
+        dst.mkdir()
+
+        link_tree(src, dst)
+
+        assert os.readlink(dst / "link.nii") == "b/c.nii"
+        assert os.readlink(dst / "dirlink") == "b"
+
+
+@pytest.mark.parametrize(
+    ("mode", "same_device", "expected"),
+    [
+        ("auto", True, "link_tree"),
+        ("reflink", True, "link_tree"),
+        ("copy", True, "rsync"),
+        ("auto", False, "rsync"),
+        ("reflink", False, "rsync"),
+    ],
+)
+def test_stage_mode_is_chosen_by_device(
+    tmpdir: str,
+    mocker: MockerFixture,
+    mode: str,
+    same_device: bool,
+    expected: str,
+    populate: Callable[[Path, dict[str, str]], Path],
+):
+    src = populate(Path(tmpdir) / "src", {"a.json": "{}"})
+    dst = Path(tmpdir) / "dst"
+    dst.mkdir()
+    if not same_device:
+        real_stat = os.stat
+        devices = {str(src): 1, str(dst): 2}
+
+        def fake_stat(path, *args, **kwargs):
+            st = real_stat(path, *args, **kwargs)
+            if str(path) not in devices:
+                return st
+            fields = list(st)
+            fields[2] = devices[str(path)]  # st_dev
+            return os.stat_result(fields)
+
+        mocker.patch("d2b.staging.os.stat", side_effect=fake_stat)
+    mocks = {
+        "link_tree": mocker.patch("d2b.staging.link_tree"),
+        "rsync": mocker.patch("d2b.staging.rsync"),
+    }
+
+    Stager(mode=mode).stage_one(src, dst)
+
+    for name, mock in mocks.items():
+        assert mock.called == (name == expected)
+    if expected == "link_tree":
+        assert mocks["link_tree"].call_args.kwargs == {"hardlink": mode == "auto"}
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import errno
+import os
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from d2b import sync
+from d2b.sync import copy_fileobj
+from d2b.sync import sync_tree
+from pytest_mock import MockerFixture
+
+
+@pytest.fixture
+def src(tmpdir: str, populate: Callable[[Path, dict[str, str]], Path]) -> Path:
+    return populate(
+        Path(tmpdir) / "src",
+        {"a.json": "{}", "a.nii": "a" * 1000, "b/c.json": "{}", "b/d/e.txt": "e"},
+    )
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_sync_tree_copies_contents_and_times(
+    src: Path,
+    tmpdir: str,
+    jobs: int,
+    contents: Callable[[Path], dict[str, str]],
+):
+    dst = Path(tmpdir) / "dst"
+
+    sync_tree(src, dst, jobs=jobs)
+
+    assert contents(dst) == contents(src)
+    for fp in src.rglob("*"):
+        assert (dst / fp.relative_to(src)).stat().st_mtime_ns == fp.stat().st_mtime_ns
+
+
+def test_sync_tree_only_transfers_changed_files(
+    src: Path,
+    tmpdir: str,
+    contents: Callable[[Path], dict[str, str]],
+):
+    dst = Path(tmpdir) / "dst"
+    sync_tree(src, dst)
+    (src / "a.nii").write_text("b" * 1001)
+
+    transferred: list[tuple[Path, int]] = []
+    sync_tree(src, dst, progress=lambda p, n: transferred.append((p, n)))
+
+    assert transferred == [(Path("a.nii"), 1001)]
+    assert contents(dst) == contents(src)
+
+
+def test_sync_tree_checksum_finds_same_size_and_time_changes(
+    src: Path,
+    tmpdir: str,
+):
+    dst = Path(tmpdir) / "dst"
+    sync_tree(src, dst)
+    st = (dst / "a.nii").stat()
+    (dst / "a.nii").write_text("z" * 1000)
+    os.utime(dst / "a.nii", ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    sync_tree(src, dst)
+    assert (dst / "a.nii").read_text() == "z" * 1000
+
+    sync_tree(src, dst, checksum=True)
+    assert (dst / "a.nii").read_text() == "a" * 1000
+
+
+@pytest.mark.parametrize("delete", [True, False])
+def test_sync_tree_delete(
+    src: Path,
+    tmpdir: str,
+    delete: bool,
+    populate: Callable[[Path, dict[str, str]], Path],
+    contents: Callable[[Path], dict[str, str]],
+):
+    dst = populate(Path(tmpdir) / "dst", {"x.txt": "x", "b/d/y.txt": "y"})
+
+    sync_tree(src, dst, delete=delete)
+
+    extraneous = {"x.txt": "x", "b/d/y.txt": "y"}
+    assert contents(dst) == {**contents(src), **({} if delete else extraneous)}
+
+
+def test_sync_tree_recreates_symlinks(src: Path, tmpdir: str):
+    (src / "link.nii").symlink_to("a.nii")
+    (src / "dirlink").symlink_to("b")
+    dst = Path(tmpdir) / "dst"
+
+    sync_tree(src, dst)
+
+    assert os.readlink(dst / "link.nii") == "a.nii"
+    assert os.readlink(dst / "dirlink") == "b"
+
+
+def test_sync_tree_does_not_write_through_hardlinks(src: Path, tmpdir: str):
+    dst = Path(tmpdir) / "dst"
+    sync_tree(src, dst)
+    other = Path(tmpdir) / "other.nii"
+    os.link(dst / "a.nii", other)
+    (src / "a.nii").write_text("new")
+
+    sync_tree(src, dst)
+
+    assert (dst / "a.nii").read_text() == "new"
+    assert other.read_text() == "a" * 1000
+
+
+@pytest.mark.parametrize(
+    "unsupported",
+    [["copy_file_range"], ["copy_file_range", "sendfile"]],
+)
+def test_copy_fileobj_falls_back(
+    tmpdir: str,
+    mocker: MockerFixture,
+    unsupported: list[str],
+):
+    for name in unsupported:
+        mocker.patch.object(
+            sync.os,
+            name,
+            side_effect=OSError(errno.EXDEV, "unsupported"),
+            create=True,
+        )
+    a, b = Path(tmpdir) / "a", Path(tmpdir) / "b"
+    a.write_bytes(os.urandom(3 * 1024 * 1024 + 7))
+
+    with open(a, "rb") as fsrc, open(b, "wb") as fdst:
+        n = copy_fileobj(fsrc.fileno(), fdst.fileno())
+
+    assert n == a.stat().st_size
+    assert b.read_bytes() == a.read_bytes()
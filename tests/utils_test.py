@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import re
+import shutil
 from io import BytesIO
 from pathlib import Path
 
@@ -31,7 +32,21 @@ from d2b.utils import rsync
         (["a.py", "b/c.txt"], ["d.js"], True, ["a.py", "b/c.txt"]),
     ],
 )
+@pytest.mark.parametrize(
+    "engine",
+    [
+        "python",
+        pytest.param(
+            "rsync",
+            marks=pytest.mark.skipif(
+                shutil.which("rsync") is None,
+                reason="rsync is not installed",
+            ),
+        ),
+    ],
+)
 def test_rsync(
+    engine: str,
     tmpdir: str,
     srcdir_contents: list[str],
     dstdir_contents: list[str],
@@ -52,7 +67,7 @@ def test_rsync(
         fp.parent.mkdir(exist_ok=True, parents=True)
         fp.write_text(filename)
 
-    rsync(src, dst, delete)
+    rsync(src, dst, delete, engine=engine)
 
     actual_dstdir_contents = sorted(
         str(fp.relative_to(dst)) for fp in dst.rglob("*") if fp.is_file()